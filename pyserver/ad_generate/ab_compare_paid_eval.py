@@ -12,7 +12,6 @@ ab_compare_paid_eval.py  (BASE vs LoRA, PAID-style eval, robust CUDA-safe, HYBRI
 """
 
 import os, json, glob, csv, argparse, math, traceback, time, re
-from dataclasses import dataclass
 from typing import List, Optional, Dict, Any, Tuple
 
 import numpy as np
@@ -26,6 +25,8 @@ from transformers import Qwen2_5_VLForConditionalGeneration as QwenVL
 from peft import PeftModel, get_peft_model_state_dict
 from qwen_vl_utils import process_vision_info
 
+from paid_eval import REPORT_FIELDS, Rules, eval_one  # PAID 지표 (torch 불필요, visual_layout_eval.py와 공용)
+
 # tqdm 사용 가능 시 프로그레스 바, 아니면 폴백
 try:
     from tqdm import tqdm  # type: ignore
@@ -59,94 +60,6 @@ def write_json(p: str, obj: dict) -> None:
     with open(p, "w", encoding="utf-8") as f:
         json.dump(obj, f, ensure_ascii=False, indent=2)
 
-# ----------------- geometry ------------------
-def clip01(v: float) -> float:
-    return max(0.0, min(1.0, float(v)))
-
-def clip_bbox(b):
-    x, y, w, h = map(float, b)
-    x = clip01(x); y = clip01(y); w = clip01(w); h = clip01(h)
-    if x + w > 1: w = max(0.0, 1 - x)
-    if y + h > 1: h = max(0.0, 1 - y)
-    return [x, y, w, h]
-
-def bbox_from_center_ratio(center, ratio):
-    cx, cy = center; rw, rh = ratio
-    return clip_bbox([cx - rw/2, cy - rh/2, rw, rh])
-
-def iou_xywh(b1, b2):
-    if not b1 or not b2:
-        return 0.0
-    x1, y1, w1, h1 = b1; x2, y2, w2, h2 = b2
-    xa = max(x1, x2); ya = max(y1, y2)
-    xb = min(x1 + w1, x2 + w2); yb = min(y1 + h1, y2 + h2)
-    inter = max(0.0, xb - xa) * max(0.0, yb - ya)
-    a1 = max(0.0, w1 * h1); a2 = max(0.0, w2 * h2)
-    u = a1 + a2 - inter
-    return inter / u if u > 0 else 0.0
-
-# -------------- image / energy ---------------
-def load_gray_for_energy(image_path: str, max_side=1280):
-    im = Image.open(image_path)
-    im = ImageOps.exif_transpose(im)
-    im = im.convert("L")
-    w, h = im.size
-    scale = min(1.0, max_side / max(w, h))
-    if scale < 1.0:
-        im = im.resize((int(w * scale), int(h * scale)), Image.BICUBIC)
-    return np.asarray(im, dtype=np.float32) / 255.0
-
-def sobel_energy(gray: np.ndarray):
-    Kx = np.array([[1,0,-1],[2,0,-2],[1,0,-1]], dtype=np.float32)
-    Ky = np.array([[1,2,1],[0,0,0],[-1,-2,-1]], dtype=np.float32)
-    g = np.pad(gray, 1, mode='edge')
-    sx = (Kx[0,0]*g[:-2,:-2] + Kx[0,1]*g[:-2,1:-1] + Kx[0,2]*g[:-2,2:] +
-          Kx[1,0]*g[1:-1,:-2] + Kx[1,1]*g[1:-1,1:-1] + Kx[1,2]*g[1:-1,2:] +
-          Kx[2,0]*g[2:,:-2] + Kx[2,1]*g[2:,1:-1] + Kx[2,2]*g[2:,2:])
-    sy = (Ky[0,0]*g[:-2,:-2] + Ky[0,1]*g[:-2,1:-1] + Ky[0,2]*g[:-2,2:] +
-          Ky[1,0]*g[1:-1,:-2] + Ky[1,1]*g[1:-1,1:-1] + Ky[1,2]*g[1:-1,2:] +
-          Ky[2,0]*g[2:,:-2] + Ky[2,1]*g[2:,1:-1] + Ky[2,2]*g[2:,2:])
-    mag = np.sqrt(sx*sx + sy*sy)
-    if mag.max() > 0:
-        mag = mag / mag.max()
-    return mag
-
-def window_energy(energy: np.ndarray, b):
-    x, y, w, h = b
-    H, W = energy.shape
-    x0 = int(round(x * W)); y0 = int(round(y * H))
-    x1 = int(round((x + w) * W)); y1 = int(round((y + h) * H))
-    x0 = max(0, min(W - 1, x0)); x1 = max(0, min(W, x1))
-    y0 = max(0, min(H - 1, y0)); y1 = max(0, min(H, y1))
-    if x1 <= x0 or y1 <= y0: return 1.0
-    sub = energy[y0:y1, x0:x1]
-    return float(sub.mean())
-
-def window_energy_safe(energy, b):
-    try:
-        return window_energy(energy, b) if b else -1.0
-    except Exception:
-        return -1.0
-
-def subject_from_energy(energy: np.ndarray, q_low=0.15, q_high=0.85):
-    H, W = energy.shape
-    yy, xx = np.mgrid[0:H, 0:W]
-    w = energy + 1e-6
-    w = w / w.sum()
-    x_flat = xx.flatten(); y_flat = yy.flatten(); w_flat = w.flatten()
-    order_x = np.argsort(x_flat)
-    order_y = np.argsort(y_flat)
-    cdf_x = np.cumsum(w_flat[order_x])
-    cdf_y = np.cumsum(w_flat[order_y])
-    x_lo = x_flat[order_x][np.searchsorted(cdf_x, q_low)]
-    x_hi = x_flat[order_x][np.searchsorted(cdf_x, q_high)]
-    y_lo = y_flat[order_y][np.searchsorted(cdf_y, q_low)]
-    y_hi = y_flat[order_y][np.searchsorted(cdf_y, q_high)]
-    x = x_lo / W; y = y_lo / H
-    w_box = max(2 / W, (x_hi - x_lo) / W)
-    h_box = max(2 / H, (y_hi - y_lo) / H)
-    return clip_bbox([x, y, w_box, h_box])
-
 # -------------- schema / prompting --------------
 SYSTEM = (
     "You are a layout planner for product advertisements.\n"
@@ -333,185 +246,6 @@ def run_qwen(image_path: str, cond: dict, product_name: str,
     out = processor.batch_decode(out_ids[:, inputs["input_ids"].shape[1]:], skip_special_tokens=True)[0]
     return extract_json(out)
 
-# -------------- type aliases & strict pick --------------
-TYPE_ALIASES = {
-    "headline": {"headline", "title", "tagline", "heading", "main_text", "copy", "text"},
-    "logo": {"logo", "brand", "badge", "icon", "mark", "logotype"},
-}
-
-def normalize_types(layout: dict) -> dict:
-    if not isinstance(layout, dict):
-        return {"nongraphic_layout": [], "graphic_layout": []}
-    for key in ("nongraphic_layout", "graphic_layout"):
-        items = layout.get(key) or []
-        for it in items:
-            t = (it.get("type") or "").lower()
-            if t in TYPE_ALIASES["headline"]:
-                it["type"] = "headline"
-            elif t in TYPE_ALIASES["logo"]:
-                it["type"] = "logo"
-    return layout
-
-MIN_W = 0.02
-MIN_H = 0.04
-MIN_AREA = 1e-3
-
-IGNORE_TYPES = {"underlay", "mask", "guide", "grid", "ruler"}
-
-def pick_first_box_strict(items, want_type, reasons=None, tag=""):
-    if not isinstance(items, list):
-        return None
-
-    def ok(b):
-        x, y, w, h = clip_bbox(b)
-        bad = []
-        if w < MIN_W: bad.append("w<min")
-        if h < MIN_H: bad.append("h<min")
-        if (w * h) < MIN_AREA: bad.append("area<min")
-        if bad and reasons is not None:
-            reasons.append(f"{tag or want_type} rejected {bad} -> bbox={[round(float(z),4) for z in [x,y,w,h]]}")
-        return not bad
-
-    # 1순위: 원하는 타입
-    for it in items:
-        t = (it.get("type") or "").lower()
-        if t in IGNORE_TYPES:  # ← 추가
-            continue
-        if t == want_type and isinstance(it.get("bbox"), list) and len(it["bbox"]) == 4:
-            b = clip_bbox(it["bbox"])
-            if ok(b): return b
-
-    # 2순위: 타입 섞여 있어도, ignore 타입 제외하고 bbox만 유효한 첫 항목
-    for it in items:
-        t = (it.get("type") or "").lower()
-        if t in IGNORE_TYPES:  # ← 추가
-            continue
-        if isinstance(it, dict) and isinstance(it.get("bbox"), list) and len(it["bbox"]) == 4:
-            b = clip_bbox(it["bbox"])
-            if ok(b): return b
-
-    return None
-
-
-# ----------------- rules & PAID-like scores -----------------
-@dataclass
-class Rules:
-    min_margin: float = 0.03
-    min_ar_text: float = 1.6
-    max_area_text: float = 0.20
-    max_area_logo: float = 0.12
-    ar_logo_min: float = 0.7
-    ar_logo_max: float = 3.0
-    max_iou_subject: float = 0.20
-    max_iou_text: float = 0.25
-    energy_ok_text: float = 0.35  # 텍스트는 낮은 에너지 영역 선호
-    energy_ok_logo: float = 0.55  # 로고는 텍스트보다 다소 자유
-
-def margin_ok(b, m):
-    if b is None: return 0
-    x, y, w, h = b
-    return int(x >= m and y >= m and x + w <= 1 - m and y + h <= 1 - m)
-
-def composite_score(row: dict, rules: Rules) -> float:
-    s = 0.0
-    # 존재
-    s += 1.2 * row["have_headline"] + 1.0 * row["have_logo"]
-    # 여백
-    s += 0.6 * row["margin_ok_text"] + 0.4 * row["margin_ok_logo"]
-    # AR 보상
-    if row["ar_text"] > 0: s += 0.5 * min(row["ar_text"] / 3.0, 1.0)
-    if row["ar_logo"] > 0 and rules.ar_logo_min <= row["ar_logo"] <= rules.ar_logo_max: s += 0.3
-    # 면적 sweet spot
-    if 0.04 <= row["area_text"] <= 0.12: s += 0.4
-    if 0.015 <= row["area_logo"] <= 0.06: s += 0.25
-    # 겹침 패널티
-    s -= 0.7 * row["iou_subject_text"]
-    s -= 0.5 * row["iou_subject_logo"]
-    s -= 0.2 * row["iou_text_logo"]
-    # 에너지/네거티브 스페이스 (낮을수록 가산)
-    if row["energy_text"] >= 0: s += 0.6 * max(0.0, (rules.energy_ok_text - row["energy_text"]))
-    if row["energy_logo"] >= 0: s += 0.2 * max(0.0, (rules.energy_ok_logo - row["energy_logo"]))
-    # 프롬프트 길이 (배경 프롬프트 길이에 보너스)
-    if row.get("prompt_len", 0) > 0:
-        if 120 <= row["prompt_len"] <= 1200: s += 0.3
-        elif row["prompt_len"] < 60: s -= 0.1
-    return float(round(s, 4))
-
-# ----------------- evaluation -----------------
-def eval_one(image_path: str, pred: dict, rules: Rules, reason_dir: str = None) -> dict:
-    gray = load_gray_for_energy(image_path)
-    energy = sobel_energy(gray)
-
-    # subject bbox: prefer model, else visual estimate
-    try:
-        subj = (pred.get("layout") or {}).get("subject_layout") or {}
-        subject = bbox_from_center_ratio(subj.get("center", [0.5, 0.5]), subj.get("ratio", [0.3, 0.3]))
-    except Exception:
-        subject = None
-    if subject is None:
-        subject = subject_from_energy(energy)
-
-    layout = normalize_types(pred.get("layout") or {})
-    texts = layout.get("nongraphic_layout", []) or []
-    graphics = layout.get("graphic_layout", []) or []
-    reasons = []
-    head = pick_first_box_strict(texts, "headline", reasons=reasons, tag="headline")
-    logo = pick_first_box_strict(graphics, "logo", reasons=reasons, tag="logo")
-
-    # reason 로그
-    if reason_dir:
-        ensure_dir(reason_dir)
-        base = os.path.splitext(os.path.basename(image_path))[0]
-        if reasons:
-            with open(os.path.join(reason_dir, f"{base}.txt"), "w", encoding="utf-8") as f:
-                f.write("\n".join(reasons))
-
-    def _ar(b):
-        if not b: return 0.0
-        w, h = b[2], b[3]
-        return (w / h) if h > 0 else 0.0
-
-    def _area(b):
-        return (b[2] * b[3]) if b else 0.0
-
-    row = {
-        "json_ok": int("layout" in pred),
-        "have_headline": int(head is not None),
-        "have_logo": int(logo is not None),
-        "margin_ok_text": margin_ok(head, rules.min_margin),
-        "margin_ok_logo": margin_ok(logo, rules.min_margin),
-        "ar_text": round(_ar(head), 4),
-        "ar_logo": round(_ar(logo), 4),
-        "area_text": round(_area(head), 6),
-        "area_logo": round(_area(logo), 6),
-        "iou_subject_text": round(iou_xywh(head, subject), 4) if head else 0.0,
-        "iou_subject_logo": round(iou_xywh(logo, subject), 4) if logo else 0.0,
-        "iou_text_logo": round(iou_xywh(head, logo), 4) if head and logo else 0.0,
-        "energy_text": -1.0, "energy_logo": -1.0,
-        "negspace_compliance": 0.0,  # 간단한 합격/불합격
-        "num_head_boxes": len([it for it in texts if isinstance(it, dict) and it.get("bbox")]),
-        "num_logo_boxes": len([it for it in graphics if isinstance(it, dict) and it.get("bbox")]),
-        "prompt_len": 0,
-    }
-
-    e_t = window_energy_safe(energy, head)
-    e_g = window_energy_safe(energy, logo)
-    row["energy_text"] = round(e_t, 4) if e_t >= 0 else -1.0
-    row["energy_logo"] = round(e_g, 4) if e_g >= 0 else -1.0
-    # 간이 네거티브 스페이스 판정
-    row["negspace_compliance"] = float(int((e_t >= 0 and e_t <= 0.35) and row["iou_subject_text"] <= 0.2))
-
-    # 프롬프트 길이(배경 프롬프트 기준)
-    try:
-        bg = (pred.get("background") or {})
-        hl = (bg.get("prompt") or "").strip()
-        row["prompt_len"] = len(hl)
-    except Exception:
-        row["prompt_len"] = 0
-
-    row["composite_score"] = composite_score(row, rules)
-    return row
-
 # ----------------- LoRA loader (NO offload) -----------------
 def load_lora_model_no_offload(base_model_id: str, lora_dir: str, dtype, device: str):
     import os
@@ -781,16 +515,7 @@ def main():
 
     # ------------------ Save CSV & Aggregate ------------------
     csv_path = os.path.join(args.out_dir, "compare_report.csv")
-    fields = [
-        "image","model","json_ok","have_headline","have_logo",
-        "num_head_boxes","num_logo_boxes",
-        "margin_ok_text","margin_ok_logo","ar_text","ar_logo",
-        "area_text","area_logo",
-        "iou_subject_text","iou_subject_logo","iou_text_logo",
-        "energy_text","energy_logo","negspace_compliance",
-        "prompt_len","composite_score",
-        "headline_suggestion","background_prompt",
-    ]
+    fields = REPORT_FIELDS
     ensure_dir(args.out_dir)
     with open(csv_path, "w", newline="", encoding="utf-8") as f:
         w = csv.DictWriter(f, fieldnames=fields)
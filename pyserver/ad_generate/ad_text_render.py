@@ -1,6 +1,14 @@
 import os, sys, json, argparse, math, glob, re
 from typing import Tuple, Dict, Optional, List
-from PIL import Image, ImageDraw, ImageFont, ImageOps, ImageFilter
+import numpy as np
+from PIL import Image, ImageDraw, ImageFont, ImageOps
+
+from asset_registry import get_registry
+from image_analysis import ImageAnalysis, best_contrast, relative_luminance
+from output_encoder import OutputEncoder
+from upload_policy import SUBSAMPLING
+from roi_filters import blur_rects
+from text_measure import REF_SIZE, Measurer, estimate_size, search_max_size, wrap_text
 
 """
 Stage 4 – Ad Text/Logo Rendering (Improved)
@@ -26,6 +34,7 @@ Tips
 - Prefer a bold Korean font (e.g., malgunbd.ttf or NotoSansKR-Bold.otf)
 - Use --stroke 0~1 and lighter underlay opacity for a modern look
 - For premium look: use --glass_underlay on headline, keep offer bar with classic underlay in layout
+- Output size: --out final_ad.jpg (or --out_format jpeg|webp) with --out_quality / --out_max_kb; PNG is lossless and 5-10x larger
 """
 
 # -----------------------------
@@ -55,13 +64,14 @@ def clamp_box(x0, y0, x1, y1, W, H):
     return x0, y0, x1, y1
 
 
-def detect_and_to_px(bbox: List[float], W: int, H: int) -> Tuple[int,int,int,int]:
+def detect_and_to_px(bbox: List[float], W: int, H: int, fmt: Optional[str] = None) -> Tuple[int,int,int,int]:
     """Accepts [x,y,w,h] (norm or px) OR [x0,y0,x1,y1] (norm or px). Returns integer (x0,y0,x1,y1) in pixel space.
     Heuristics:
       - If any component > 1 => assume pixel units.
       - Else normalized in 0..1.
       - If assumed [x0,y0,x1,y1] and x1>x0,y1>y0 and (x1<=1,y1<=1) -> xyxy norm.
       - Else treat as xywh.
+    fmt: layout의 "bbox_format" ("xywh" | "xyxy")가 있으면 추정 대신 그대로 사용.
     """
     if len(bbox) != 4:
         raise ValueError("bbox must have 4 numbers")
@@ -82,6 +92,11 @@ def detect_and_to_px(bbox: List[float], W: int, H: int) -> Tuple[int,int,int,int
         else:
             return clamp_box(xx*W, yy*H, (xx+ww)*W, (yy+hh)*H, W, H)
 
+    if fmt == "xywh":
+        return as_xywh(x, y, a, b, is_pixels)
+    if fmt == "xyxy":
+        return as_xyxy(x, y, a, b, is_pixels)
+
     # try xyxy first when plausible
     if (not is_pixels) and (a > x) and (b > y) and (a <= 1.0) and (b <= 1.0):
         return as_xyxy(x, y, a, b, False)
@@ -100,25 +115,30 @@ def box_size_xyxy(x0, y0, x1, y1):
 # Luma / color choice
 # -----------------------------
 
-def avg_luma(img: Image.Image, box) -> float:
+def avg_luma(img: Image.Image, box, analysis: Optional[ImageAnalysis] = None) -> float:
+    """Mean relative luminance of box. With an ImageAnalysis of img, reads its luma integral in O(1)."""
     x0,y0,x1,y1 = box
     if x1<=x0 or y1<=y0:
         return 0.5
-    crop = img.crop((x0,y0,x1,y1)).convert("RGB")
-    pixels = crop.resize((32, 32), Image.LANCZOS).getdata()
-    def _linear(c):
-        c = c / 255.0
-        return c/12.92 if c <= 0.04045 else ((c + 0.055) / 1.055) ** 2.4
-    s = 0.0
-    for r,g,b in pixels:
-        R, G, B = _linear(r), _linear(g), _linear(b)
-        L = 0.2126*R + 0.7152*G + 0.0722*B
-        s += L
-    return s / (32*32)
-
-
-def choose_text_and_stroke(bg_luma: float):
-    if bg_luma >= 0.6:
+    if analysis is not None:
+        return analysis.mean_px("luma", box, default=0.5)
+    crop = np.asarray(img.crop((x0,y0,x1,y1)).convert("RGB"), dtype=np.uint8)
+    return float(relative_luminance(crop).mean())
+
+
+TEXT_COLORS = ((0,0,0), (255,255,255))
+
+def choose_text_and_stroke(bg_luma: float, rule: str = "threshold"):
+    """
+    threshold (기본): 기존 규칙 (휘도 0.6 이상이면 검정 글자).
+    wcag: 배경 휘도와 WCAG 대비율이 큰 쪽(검정/흰색)을 글자색, 반대색을 외곽선으로 (opt-in).
+    """
+    if rule == "wcag":
+        txt, _ = best_contrast(bg_luma, TEXT_COLORS)
+        dark = txt == (0,0,0)
+    else:
+        dark = bg_luma >= 0.6
+    if dark:
         return (0,0,0), (255,255,255)
     else:
         return (255,255,255), (0,0,0)
@@ -136,8 +156,8 @@ def glass_underlay(base: Image.Image, box, radius=16, blur=6, tint=(17,20,24,115
     x0,y0,x1,y1 = clamp_box(x0,y0,x1,y1,*base.size)
     if x1<=x0 or y1<=y0:
         return
-    region = base.crop((x0,y0,x1,y1)).filter(ImageFilter.GaussianBlur(blur))
-    base.paste(region, (x0,y0))
+    # 패딩 타일 블러 + 둥근 사각 마스크 합성 (틴트 모양 밖 모서리는 원본 유지)
+    blur_rects(base, [(x0,y0,x1,y1)], radius=blur, feather=0, corner_radius=radius, inplace=True)
     d = ImageDraw.Draw(base, "RGBA")
     d.rounded_rectangle((x0,y0,x1,y1), radius=radius, fill=tint)
 
@@ -146,41 +166,8 @@ def glass_underlay(base: Image.Image, box, radius=16, blur=6, tint=(17,20,24,115
 # -----------------------------
 
 def wrap_text_to_width(draw: ImageDraw.ImageDraw, text: str, font: ImageFont.FreeTypeFont, max_w: int, mode: str) -> List[str]:
-    mode = mode.lower()
-    if mode == 'auto':
-        mode = 'word' if (' ' in text) else 'char'
-    
-    lines = []
-    if mode == 'word':
-        words = text.split()
-        cur = ''
-        for w in words:
-            test = (cur + ' ' + w).strip() if cur else w
-            tw = draw.textbbox((0,0), test, font=font)[2]
-            if tw <= max_w:
-                cur = test
-            else:
-                if cur:
-                    lines.append(cur)
-                    cur = w
-                else:
-                    # a single word longer than max_w -> fallback char wrap
-                    cur = w
-        if cur:
-            lines.append(cur)
-    else:  # char mode
-        cur = ''
-        for ch in list(text):
-            test = cur + ch
-            tw = draw.textbbox((0,0), test, font=font)[2]
-            if tw <= max_w or cur == '':
-                cur = test
-            else:
-                lines.append(cur)
-                cur = ch
-        if cur:
-            lines.append(cur)
-    return lines
+    # 글자 advance 누적합으로 줄바꿈 위치를 찾고 줄당 textbbox 2회로 확인 (text_measure)
+    return wrap_text(Measurer(draw, font), text, max_w, mode)
 
 
 def fit_text_in_box(draw: ImageDraw.ImageDraw, text: str, font_path: str, box,
@@ -191,41 +178,45 @@ def fit_text_in_box(draw: ImageDraw.ImageDraw, text: str, font_path: str, box,
     if not text or W<=1 or H<=1:
         return None, None, None
 
-    lo, hi = min_size, max_try
-    best = (min_size, [text])
-    while lo <= hi:
-        mid = (lo + hi) // 2
-        font = ImageFont.truetype(font_path, mid)
-        usable_w = int(W * target_ratio)
-        lines = wrap_text_to_width(draw, text, font, usable_w, wrap_mode)
+    # (path, size) 폰트는 레지스트리 LRU에서 재사용 (TTF 재파싱 없음)
+    reg = get_registry()
+    usable_w = int(W * target_ratio)
+    ref_font = reg.font(font_path, REF_SIZE)
+    tried = {}
+
+    def layout(size):
+        if size not in tried:
+            m = Measurer(draw, reg.font(font_path, size), ref_font=ref_font)
+            tried[size] = (m, wrap_text(m, text, usable_w, wrap_mode))
+        return tried[size]
 
+    def fits(size):
+        m, lines = layout(size)
         # measure height
-        total_h = 0
-        line_metrics = []
-        for ln in lines:
-            _,_,tw,th = draw.textbbox((0,0), ln, font=font)
-            line_metrics.append((tw, th))
-            total_h += th
+        line_metrics = [m.bbox(ln)[2:] for ln in lines]
+        total_h = sum(th for _, th in line_metrics)
         if line_metrics:
             total_h = int(total_h + (len(lines)-1) * (line_metrics[0][1]*(line_spacing-1)))
-        
-        if total_h <= H * target_ratio:
-            best = (mid, lines)
-            lo = mid + 1
-        else:
-            hi = mid - 1
-
-    size, lines = best
-    font = ImageFont.truetype(font_path, size)
+        return total_h <= H * target_ratio
+
+    # 면적 기반 시작 크기 → 주변 gallop/이분 탐색 (들어가는 최대 크기)
+    est = estimate_size(ref_font, text, usable_w, H * target_ratio, line_spacing)
+    size = search_max_size(fits, min_size, max_try, est)
+    if size is None:
+        size = min_size
+        m, lines = Measurer(draw, reg.font(font_path, size)), [text]
+    else:
+        m, lines = layout(size)
+    font = m.font
 
     # Center vertically
-    line_heights = [draw.textbbox((0,0), ln, font=font)[3] for ln in lines]
+    line_heights = [m.bbox(ln)[3] for ln in lines]
     text_block_h = int(sum(line_heights) + (len(lines)-1) * (line_heights[0]*(line_spacing-1))) if lines else 0
     cur_y = y0 + max(0, (H - text_block_h)//2)
 
     line_boxes = []
     for ln in lines:
-        _,_,tw,th = draw.textbbox((0,0), ln, font=font)
+        _,_,tw,th = m.bbox(ln)
         if align == 'center':
             tx = x0 + (W - tw)//2
         elif align == 'left':
@@ -236,6 +227,57 @@ def fit_text_in_box(draw: ImageDraw.ImageDraw, text: str, font_path: str, box,
         cur_y += int(th * line_spacing)
     return font, line_boxes, size
 
+# -----------------------------
+# Text sprites
+# -----------------------------
+
+class TextSprite:
+    """
+    한 줄 텍스트의 래스터 마스크 (색 무관). draw.text((0,0)) 기준 오프셋 (l,t)에서 시작.
+    stroke: 외곽선 포함 커버리지 (stroke_width>0일 때만), fill: 글자 본체 커버리지.
+    """
+
+    def __init__(self, offset, stroke, fill):
+        self.offset = offset
+        self.stroke = stroke
+        self.fill = fill
+
+    @property
+    def nbytes(self):
+        return sum(m.width * m.height for m in (self.stroke, self.fill) if m is not None) + 64
+
+
+def rasterize_line(text: str, font: ImageFont.FreeTypeFont, stroke_width: int = 0) -> TextSprite:
+    l, t, r, b = ImageDraw.Draw(Image.new("L", (1, 1))).textbbox((0, 0), text, font=font, stroke_width=stroke_width)
+    size = (max(0, r - l), max(0, b - t))
+    fill = Image.new("L", size, 0)
+    ImageDraw.Draw(fill).text((-l, -t), text, font=font, fill=255)
+    stroke = None
+    if stroke_width > 0:
+        stroke = Image.new("L", size, 0)
+        ImageDraw.Draw(stroke).text((-l, -t), text, font=font, fill=255, stroke_width=stroke_width, stroke_fill=255)
+    return TextSprite((l, t), stroke, fill)
+
+
+def text_sprite(text: str, font: ImageFont.FreeTypeFont, font_path: str, stroke_width: int = 0) -> TextSprite:
+    """(문자열, 폰트 해시, 크기, 외곽선 두께) → TextSprite (asset_registry 바이트 상한 LRU)."""
+    reg = get_registry()
+    key = (text, reg.font_hash(font_path), int(font.size), int(stroke_width))
+    return reg.sprite(key, lambda: rasterize_line(text, font, stroke_width))
+
+
+def blit_text(base: Image.Image, xy, sprite: TextSprite, fill, stroke_fill=None):
+    """
+    draw.text(xy, ..., fill, stroke_width, stroke_fill)와 같은 결과:
+    외곽선 커버리지로 stroke 색을 먼저, 본체 커버리지로 fill 색을 덮음.
+    """
+    if sprite.fill.width == 0 or sprite.fill.height == 0:
+        return
+    box = (int(xy[0]) + sprite.offset[0], int(xy[1]) + sprite.offset[1])
+    if sprite.stroke is not None:
+        base.paste(Image.new(base.mode, sprite.stroke.size, stroke_fill), box, sprite.stroke)
+    base.paste(Image.new(base.mode, sprite.fill.size, fill), box, sprite.fill)
+
 # -----------------------------
 # Logo placement
 # -----------------------------
@@ -247,14 +289,15 @@ def place_logo(base: Image.Image, logo_path: str, box, keep_aspect=True):
     W,H = x1-x0, y1-y0
     if W<=0 or H<=0:
         return
-    logo = Image.open(logo_path).convert("RGBA")
-    lw, lh = logo.size
+    # 디코드본 / 리사이즈본은 레지스트리에 내용 해시 + 크기로 캐시
+    reg = get_registry()
+    lw, lh = reg.logo(logo_path).size
     if keep_aspect and lw>0 and lh>0:
         scale = min(W/lw, H/lh)
         nw, nh = max(1, int(lw*scale)), max(1, int(lh*scale))
     else:
         nw, nh = max(1, W), max(1, H)
-    logo = logo.resize((nw, nh), Image.LANCZOS)
+    logo = reg.logo_resized(logo_path, (nw, nh))
     px = x0 + (W - nw)//2
     py = y0 + (H - nh)//2
     base.alpha_composite(logo, (px, py))
@@ -314,17 +357,23 @@ def resolve_font_path(requested_path: Optional[str]) -> str:
         "한글 폰트를 찾지 못했습니다. --font_kor 로 실제 파일(.ttf/.otf)을 지정하거나 'C:\\Windows\\Fonts\\malgunbd.ttf' 등을 사용하세요.")
 
 # -----------------------------
-# Main
+# Render (single / batch)
 # -----------------------------
 
-def main():
+def build_parser():
     ap = argparse.ArgumentParser()
     ap.add_argument("--image", required=True, help="Stage3/4 결과 이미지 경로")
     ap.add_argument("--layout_json", required=True, help="레이아웃 JSON 경로")
     ap.add_argument("--copy_json", required=False, help="문구 매핑 JSON (type#index -> text)")
+    ap.add_argument("--copy_jsons", nargs="+", default=None,
+                    help="배치 모드: 문구 매핑 JSON 여러 개 → 같은 배경/레이아웃으로 N장")
+    ap.add_argument("--variants_json", default=None,
+                    help="배치 모드: 문구 매핑 리스트 JSON ([{type#index: text}, ...])")
+    ap.add_argument("--workers", type=int, default=0, help="배치 렌더 프로세스 수 (0/1 → 현재 프로세스)")
     ap.add_argument("--font_kor", required=False, help="한국어 폰트 파일 경로(.ttf/.otf)")
     ap.add_argument("--logo_path", required=False, help="로고 PNG 경로(선택)")
-    ap.add_argument("--out", default="final_ad.png")
+    ap.add_argument("--out", default="final_ad.png",
+                    help="출력 경로. 배치 모드에서는 '{i}'를 변형 번호로 치환 (없으면 파일명 뒤에 _i)")
     ap.add_argument("--stroke", type=int, default=1, help="텍스트 외곽선 두께")
     ap.add_argument("--underlay_color", default=None, help="언더레이 색상(hex, 예:#111418). 없으면 자동")
     ap.add_argument("--underlay_opacity", type=float, default=None, help="언더레이 불투명도(0~1) override")
@@ -336,51 +385,84 @@ def main():
     ap.add_argument("--glass_alpha", type=float, default=0.45, help="유리 패널 틴트 알파(0~1)")
     ap.add_argument("--shrink_underlay_to_text", action='store_true', help="언더레이를 텍스트 폭+패딩으로 축소")
     ap.add_argument("--skip_layout_underlays", action='store_true', help="layout의 underlay 박스 그리지 않음")
+    ap.add_argument("--text_color_rule", choices=["wcag","threshold"], default="threshold",
+                    help="글자색 선택: 기존 휘도 0.6 기준(기본) / WCAG 대비율 최대")
     ap.add_argument("--debug_boxes", action='store_true', help="각 bbox 테두리 표시")
-    args = ap.parse_args()
-
-    base = Image.open(args.image).convert("RGBA")
+    ap.add_argument("--out_format", choices=["auto","png","jpeg","webp"], default="auto",
+                    help="출력 포맷 (auto → --out 확장자, 모르면 png)")
+    ap.add_argument("--out_quality", type=int, default=90, help="JPEG/WebP 품질 (max_kb 탐색 시 상한)")
+    ap.add_argument("--out_min_quality", type=int, default=50, help="max_kb 탐색 시 품질 하한")
+    ap.add_argument("--out_max_kb", type=int, default=0, help="출력 파일 크기 상한(KB, 0=없음) → 품질 이분 탐색")
+    ap.add_argument("--out_subsampling", choices=list(SUBSAMPLING), default="4:2:0", help="JPEG 크로마 서브샘플링")
+    ap.add_argument("--no_out_optimize", dest="out_optimize", action='store_false',
+                    help="JPEG/PNG optimize 끄기 (인코딩은 빨라지고 파일은 커짐)")
+    ap.add_argument("--no_out_progressive", dest="out_progressive", action='store_false', help="JPEG progressive 끄기")
+    ap.add_argument("--out_report", default=None, help="출력 인코딩 요약 JSON 경로 (배치 모드는 리스트)")
+    return ap
+
+
+def render_options(**overrides) -> argparse.Namespace:
+    """CLI 기본값으로 채운 옵션 (라이브러리 호출용). overrides로 일부만 바꿈."""
+    opts = {a.dest: a.default for a in build_parser()._actions if a.dest != "help"}
+    opts.update(overrides)
+    return argparse.Namespace(**opts)
+
+
+def prepare_background(base: Image.Image, meta: dict, opts):
+    """
+    문구와 무관한 단계: layout underlay를 그리고 글자색 판단용 분석(luma 적분 영상)을 만듦.
+    반환: (RGBA 배경, ImageAnalysis) — 같은 배경의 모든 문구 변형이 공유.
+    """
+    base = base.convert("RGBA") if base.mode != "RGBA" else base.copy()
     W, H = base.size
     draw = ImageDraw.Draw(base, "RGBA")
-
-    with open(args.layout_json, 'r', encoding='utf-8-sig') as f:
-        meta = json.load(f)
-
-    copy_map: Dict[str,str] = load_copy_map(args.copy_json)
-
     layout = meta.get("layout", {}) or {}
-    nongraphics = layout.get("nongraphic_layout", []) or []
     graphics = layout.get("graphic_layout", []) or []
 
-    # Resolve font
-    font_path = resolve_font_path(args.font_kor)
-    try:
-        _ = ImageFont.truetype(font_path, 18)
-    except OSError as e:
-        raise SystemExit(f"[폰트 오류] '{font_path}' 로드 실패: {e}")
+    # Luma is read from one shared analysis of the background instead of crop+resize per box.
+    analysis = ImageAnalysis(base)
+    drew_underlays = False
 
     # 1) Layout-provided UNDERLAYS first (optional)
-    if not args.skip_layout_underlays:
+    if not opts.skip_layout_underlays:
         for g in graphics:
             gtype = (g.get("type") or '').lower()
             bbox = g.get("bbox")
             if gtype != 'underlay' or not (isinstance(bbox, list) and len(bbox)==4):
                 continue
-            x0,y0,x1,y1 = detect_and_to_px(bbox, W, H)
+            x0,y0,x1,y1 = detect_and_to_px(bbox, W, H, layout.get("bbox_format"))
             w,h = box_size_xyxy(x0,y0,x1,y1)
             style = g.get("style", {}) or {}
             radius = style.get("radius", 0.08)  # fraction of min(w,h)
             opacity = style.get("opacity", 0.6)
-            if args.underlay_opacity is not None:
-                opacity = args.underlay_opacity
+            if opts.underlay_opacity is not None:
+                opacity = opts.underlay_opacity
             radius_px = max(2, int(min(w,h) * radius))
-            if args.underlay_color:
-                ur,ug,ub = hex_to_rgb(args.underlay_color)
+            if opts.underlay_color:
+                ur,ug,ub = hex_to_rgb(opts.underlay_color)
             else:
-                luma = avg_luma(base, (x0,y0,x1,y1))
+                luma = avg_luma(base, (x0,y0,x1,y1), analysis)
                 ur,ug,ub = ((255,255,255) if luma < 0.5 else (0,0,0))
             ua = int(clamp(opacity,0,1)*255)
             draw_underlay(draw, (x0,y0,x1,y1), radius_px, (ur,ug,ub,ua))
+            drew_underlays = True
+
+    # Text colors must see the underlays drawn above, so re-analyze once if any were drawn.
+    # (Per-text glass/tight underlays below only cover their own box and are not re-analyzed.)
+    if drew_underlays:
+        analysis = ImageAnalysis(base)
+    return base, analysis
+
+
+def render_copy(prepared: Image.Image, analysis: ImageAnalysis, meta: dict, copy_map: Dict[str,str],
+                font_path: str, opts) -> Image.Image:
+    """prepare_background 결과 위에 문구 + 로고를 그린 RGBA (prepared는 수정하지 않음)."""
+    base = prepared.copy()
+    W, H = base.size
+    draw = ImageDraw.Draw(base, "RGBA")
+    layout = meta.get("layout", {}) or {}
+    nongraphics = layout.get("nongraphic_layout", []) or []
+    graphics = layout.get("graphic_layout", []) or []
 
     # 2) TEXTS (headline/subhead/etc.)
     type_counts: Dict[str,int] = {}
@@ -397,21 +479,22 @@ def main():
         if not (isinstance(bbox, list) and len(bbox)==4):
             continue
 
-        x0,y0,x1,y1 = detect_and_to_px(bbox, W, H)
-        if args.debug_boxes:
+        x0,y0,x1,y1 = detect_and_to_px(bbox, W, H, layout.get("bbox_format"))
+        if opts.debug_boxes:
             draw.rectangle((x0,y0,x1,y1), outline=(255,0,0,128), width=1)
 
         # Decide text color based on local background luma
-        luma = avg_luma(base, (x0,y0,x1,y1))
-        txt_col, stroke_col = choose_text_and_stroke(luma)
+        luma = avg_luma(base, (x0,y0,x1,y1), analysis)
+        txt_col, stroke_col = choose_text_and_stroke(luma, opts.text_color_rule)
 
-        # Fit text
+        # Fit text (서브셋 폰트가 문구를 커버하면 서브셋, 아니면 원본 폰트)
+        fp = get_registry().font_for_text(font_path, text)
         font, line_boxes, size = fit_text_in_box(
-            draw, text, font_path, (x0,y0,x1,y1),
-            target_ratio=args.target_ratio,
+            draw, text, fp, (x0,y0,x1,y1),
+            target_ratio=opts.target_ratio,
             max_try=112, min_size=14,
-            line_spacing=args.line_spacing,
-            align='center', wrap_mode=args.wrap_mode
+            line_spacing=opts.line_spacing,
+            align='center', wrap_mode=opts.wrap_mode
         )
         if not font:
             continue
@@ -428,505 +511,164 @@ def main():
         ux0, uy0, ux1, uy1 = clamp_box(tx0-pad, ty0-pad, tx1+pad, ty1+pad, W, H)
 
         # Optional glass or text-tight underlay
-        if args.glass_underlay:
-            glass_alpha = clamp(args.glass_alpha, 0, 1)
+        if opts.glass_underlay:
+            glass_alpha = clamp(opts.glass_alpha, 0, 1)
             tint = (17,20,24, int(glass_alpha*255))
-            glass_underlay(base, (ux0,uy0,ux1,uy1), radius=16, blur=args.glass_blur, tint=tint)
-        elif args.shrink_underlay_to_text:
-            if args.underlay_color:
-                ur,ug,ub = hex_to_rgb(args.underlay_color)
+            glass_underlay(base, (ux0,uy0,ux1,uy1), radius=16, blur=opts.glass_blur, tint=tint)
+        elif opts.shrink_underlay_to_text:
+            if opts.underlay_color:
+                ur,ug,ub = hex_to_rgb(opts.underlay_color)
             else:
-                luma_u = avg_luma(base, (ux0,uy0,ux1,uy1))
+                luma_u = avg_luma(base, (ux0,uy0,ux1,uy1), analysis)
                 ur,ug,ub = ((255,255,255) if luma_u < 0.5 else (0,0,0))
-            opacity = 0.42 if args.underlay_opacity is None else args.underlay_opacity
+            opacity = 0.42 if opts.underlay_opacity is None else opts.underlay_opacity
             draw_underlay(draw, (ux0,uy0,ux1,uy1), radius_px=16, fill_rgba=(ur,ug,ub,int(clamp(opacity,0,1)*255)))
 
-        # Render text lines
+        # Render text lines (줄 단위 스프라이트 캐시 — 변형 / 포맷 간 같은 줄은 한 번만 래스터화)
+        sw = max(0, opts.stroke)
         for ln, (tx, ty), (tw, th) in line_boxes:
-            draw.text((tx, ty), ln, font=font, fill=txt_col+(255,),
-                      stroke_width=max(0, args.stroke), stroke_fill=stroke_col+(255,))
+            blit_text(base, (tx, ty), text_sprite(ln, font, fp, sw), txt_col+(255,), stroke_col+(255,))
 
     # 3) LOGO from graphic_layout (type=logo)
     for g in graphics:
         if (g.get("type") or '').lower() != 'logo':
             continue
-        if not args.logo_path:
+        if not opts.logo_path:
             continue
         bbox = g.get("bbox")
         if not (isinstance(bbox, list) and len(bbox)==4):
             continue
-        x0,y0,x1,y1 = detect_and_to_px(bbox, W, H)
-        place_logo(base, args.logo_path, (x0,y0,x1,y1))
-
-    base.convert("RGB").save(args.out, quality=95)
-    print(f"✅ 저장 완료: {args.out}")
-
-
-if __name__ == "__main__":
-    main()
-import os, sys, json, argparse, math, glob, re
-from typing import Tuple, Dict, Optional, List
-from PIL import Image, ImageDraw, ImageFont, ImageOps, ImageFilter
+        x0,y0,x1,y1 = detect_and_to_px(bbox, W, H, layout.get("bbox_format"))
+        place_logo(base, opts.logo_path, (x0,y0,x1,y1))
 
-"""
-Stage 4 – Ad Text/Logo Rendering (Improved)
--------------------------------------------
-- Uses layout.json bboxes as-is (supports both [x,y,w,h] and [x0,y0,x1,y1], normalized 0~1 or pixel units)
-- Composition order: Underlay -> Text -> Logo
-- Adds quality options: shrink underlay to text width, glass (blurred) panel, opacity/color overrides, target ratio & line spacing, robust font + copy loader
+    return base
 
-USAGE (PowerShell example)
-  python ad_text_render_v2.py `
-    --image stage4_output.png `
-    --layout_json layout_with_bg.json `
-    --copy_json copy.json `
-    --font_kor "C:\\Windows\\Fonts\\malgunbd.ttf" `
-    --logo_path .\\logo.png `
-    --out final_ad.png `
-    --stroke 1 `
-    --target_ratio 0.82 `
-    --line_spacing 1.02 `
-    --shrink_underlay_to_text 
 
-Tips
-- Prefer a bold Korean font (e.g., malgunbd.ttf or NotoSansKR-Bold.otf)
-- Use --stroke 0~1 and lighter underlay opacity for a modern look
-- For premium look: use --glass_underlay on headline, keep offer bar with classic underlay in layout
-"""
+def output_encoder(opts) -> OutputEncoder:
+    return OutputEncoder(fmt=opts.out_format, quality=opts.out_quality, optimize=opts.out_optimize,
+                         progressive=opts.out_progressive, subsampling=opts.out_subsampling,
+                         max_bytes=opts.out_max_kb * 1024, min_quality=opts.out_min_quality)
 
-# -----------------------------
-# Color / geometry helpers
-# -----------------------------
 
-def hex_to_rgb(hex_str: str) -> Tuple[int, int, int]:
-    s = hex_str.lstrip('#')
-    if len(s) == 3:
-        s = ''.join([c*2 for c in s])
-    if len(s) != 6:
-        raise ValueError(f"Invalid hex color: {hex_str}")
-    return tuple(int(s[i:i+2], 16) for i in (0,2,4))
+def save_final(img: Image.Image, out_path: str, encoder: Optional[OutputEncoder] = None) -> dict:
+    """RGB로 인코딩해 저장. 반환: 인코딩 요약 (format / quality / bytes ...)."""
+    enc = (encoder or OutputEncoder()).save(img, out_path)
+    rep = dict(enc.describe(), path=out_path)
+    if not enc.fits:
+        print(f"[경고] {out_path}: {enc.nbytes/1024:.0f} KB — 크기 상한을 최저 품질로도 맞추지 못함")
+    return rep
 
 
-def clamp(v, lo, hi):
-    return max(lo, min(hi, v))
-
-
-def clamp_box(x0, y0, x1, y1, W, H):
-    x0 = clamp(int(round(x0)), 0, W)
-    y0 = clamp(int(round(y0)), 0, H)
-    x1 = clamp(int(round(x1)), 0, W)
-    y1 = clamp(int(round(y1)), 0, H)
-    if x1 < x0: x0, x1 = x1, x0
-    if y1 < y0: y0, y1 = y1, y0
-    return x0, y0, x1, y1
-
-
-def detect_and_to_px(bbox: List[float], W: int, H: int) -> Tuple[int,int,int,int]:
-    """Accepts [x,y,w,h] (norm or px) OR [x0,y0,x1,y1] (norm or px). Returns integer (x0,y0,x1,y1) in pixel space.
-    Heuristics:
-      - If any component > 1 => assume pixel units.
-      - Else normalized in 0..1.
-      - If assumed [x0,y0,x1,y1] and x1>x0,y1>y0 and (x1<=1,y1<=1) -> xyxy norm.
-      - Else treat as xywh.
-    """
-    if len(bbox) != 4:
-        raise ValueError("bbox must have 4 numbers")
-    x, y, a, b = bbox
-
-    # unit detection
-    is_pixels = any(v > 1.0 for v in bbox)
-
-    def as_xyxy(xx, yy, ww, hh, pixels: bool):
-        if pixels:
-            return clamp_box(xx, yy, ww, hh, W, H)
-        else:
-            return clamp_box(xx*W, yy*H, ww*W, hh*H, W, H)
-
-    def as_xywh(xx, yy, ww, hh, pixels: bool):
-        if pixels:
-            return clamp_box(xx, yy, xx+ww, yy+hh, W, H)
-        else:
-            return clamp_box(xx*W, yy*H, (xx+ww)*W, (yy+hh)*H, W, H)
-
-    # try xyxy first when plausible
-    if (not is_pixels) and (a > x) and (b > y) and (a <= 1.0) and (b <= 1.0):
-        return as_xyxy(x, y, a, b, False)
-    if is_pixels and (a > x) and (b > y):
-        # looks like xyxy pixels
-        return as_xyxy(x, y, a, b, True)
-
-    # fallback xywh
-    return as_xywh(x, y, a, b, is_pixels)
-
-
-def box_size_xyxy(x0, y0, x1, y1):
-    return (x1 - x0, y1 - y0)
-
-# -----------------------------
-# Luma / color choice
-# -----------------------------
-
-def avg_luma(img: Image.Image, box) -> float:
-    x0,y0,x1,y1 = box
-    if x1<=x0 or y1<=y0:
-        return 0.5
-    crop = img.crop((x0,y0,x1,y1)).convert("RGB")
-    pixels = crop.resize((32, 32), Image.LANCZOS).getdata()
-    def _linear(c):
-        c = c / 255.0
-        return c/12.92 if c <= 0.04045 else ((c + 0.055) / 1.055) ** 2.4
-    s = 0.0
-    for r,g,b in pixels:
-        R, G, B = _linear(r), _linear(g), _linear(b)
-        L = 0.2126*R + 0.7152*G + 0.0722*B
-        s += L
-    return s / (32*32)
-
-
-def choose_text_and_stroke(bg_luma: float):
-    if bg_luma >= 0.6:
-        return (0,0,0), (255,255,255)
-    else:
-        return (255,255,255), (0,0,0)
-
-# -----------------------------
-# Underlay / Glass
-# -----------------------------
-
-def draw_underlay(draw: ImageDraw.ImageDraw, box, radius_px: int, fill_rgba: Tuple[int,int,int,int]):
-    draw.rounded_rectangle(box, radius=radius_px, fill=fill_rgba)
-
-
-def glass_underlay(base: Image.Image, box, radius=16, blur=6, tint=(17,20,24,115)):
-    x0,y0,x1,y1 = [int(v) for v in box]
-    x0,y0,x1,y1 = clamp_box(x0,y0,x1,y1,*base.size)
-    if x1<=x0 or y1<=y0:
+def write_out_report(path: Optional[str], rep):
+    if not path:
         return
-    region = base.crop((x0,y0,x1,y1)).filter(ImageFilter.GaussianBlur(blur))
-    base.paste(region, (x0,y0))
-    d = ImageDraw.Draw(base, "RGBA")
-    d.rounded_rectangle((x0,y0,x1,y1), radius=radius, fill=tint)
-
-# -----------------------------
-# Text wrapping & fitting
-# -----------------------------
-
-def wrap_text_to_width(draw: ImageDraw.ImageDraw, text: str, font: ImageFont.FreeTypeFont, max_w: int, mode: str) -> List[str]:
-    mode = mode.lower()
-    if mode == 'auto':
-        mode = 'word' if (' ' in text) else 'char'
-    
-    lines = []
-    if mode == 'word':
-        words = text.split()
-        cur = ''
-        for w in words:
-            test = (cur + ' ' + w).strip() if cur else w
-            tw = draw.textbbox((0,0), test, font=font)[2]
-            if tw <= max_w:
-                cur = test
-            else:
-                if cur:
-                    lines.append(cur)
-                    cur = w
-                else:
-                    # a single word longer than max_w -> fallback char wrap
-                    cur = w
-        if cur:
-            lines.append(cur)
-    else:  # char mode
-        cur = ''
-        for ch in list(text):
-            test = cur + ch
-            tw = draw.textbbox((0,0), test, font=font)[2]
-            if tw <= max_w or cur == '':
-                cur = test
-            else:
-                lines.append(cur)
-                cur = ch
-        if cur:
-            lines.append(cur)
-    return lines
-
-
-def fit_text_in_box(draw: ImageDraw.ImageDraw, text: str, font_path: str, box,
-                    target_ratio=0.82, max_try=96, min_size=14, line_spacing=1.02, align="center", wrap_mode='auto'):
-    x0,y0,x1,y1 = box
-    W = x1 - x0
-    H = y1 - y0
-    if not text or W<=1 or H<=1:
-        return None, None, None
-
-    lo, hi = min_size, max_try
-    best = (min_size, [text])
-    while lo <= hi:
-        mid = (lo + hi) // 2
-        font = ImageFont.truetype(font_path, mid)
-        usable_w = int(W * target_ratio)
-        lines = wrap_text_to_width(draw, text, font, usable_w, wrap_mode)
-
-        # measure height
-        total_h = 0
-        line_metrics = []
-        for ln in lines:
-            _,_,tw,th = draw.textbbox((0,0), ln, font=font)
-            line_metrics.append((tw, th))
-            total_h += th
-        if line_metrics:
-            total_h = int(total_h + (len(lines)-1) * (line_metrics[0][1]*(line_spacing-1)))
-        
-        if total_h <= H * target_ratio:
-            best = (mid, lines)
-            lo = mid + 1
-        else:
-            hi = mid - 1
-
-    size, lines = best
-    font = ImageFont.truetype(font_path, size)
-
-    # Center vertically
-    line_heights = [draw.textbbox((0,0), ln, font=font)[3] for ln in lines]
-    text_block_h = int(sum(line_heights) + (len(lines)-1) * (line_heights[0]*(line_spacing-1))) if lines else 0
-    cur_y = y0 + max(0, (H - text_block_h)//2)
+    try:
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(rep, f, ensure_ascii=False, indent=2)
+    except Exception as e:
+        print(f"[경고] out_report 저장 실패: {e}")
 
-    line_boxes = []
-    for ln in lines:
-        _,_,tw,th = draw.textbbox((0,0), ln, font=font)
-        if align == 'center':
-            tx = x0 + (W - tw)//2
-        elif align == 'left':
-            tx = x0
-        else:
-            tx = x1 - tw
-        line_boxes.append((ln, (tx, cur_y), (tw, th)))
-        cur_y += int(th * line_spacing)
-    return font, line_boxes, size
 
-# -----------------------------
-# Logo placement
-# -----------------------------
+def variant_out_path(out: str, i: int) -> str:
+    if "{i}" in out:
+        return out.replace("{i}", str(i))
+    root, ext = os.path.splitext(out)
+    return f"{root}_{i}{ext or '.png'}"
 
-def place_logo(base: Image.Image, logo_path: str, box, keep_aspect=True):
-    if not logo_path or not os.path.exists(logo_path):
-        return
-    x0,y0,x1,y1 = box
-    W,H = x1-x0, y1-y0
-    if W<=0 or H<=0:
-        return
-    logo = Image.open(logo_path).convert("RGBA")
-    lw, lh = logo.size
-    if keep_aspect and lw>0 and lh>0:
-        scale = min(W/lw, H/lh)
-        nw, nh = max(1, int(lw*scale)), max(1, int(lh*scale))
-    else:
-        nw, nh = max(1, W), max(1, H)
-    logo = logo.resize((nw, nh), Image.LANCZOS)
-    px = x0 + (W - nw)//2
-    py = y0 + (H - nh)//2
-    base.alpha_composite(logo, (px, py))
 
-# -----------------------------
-# Robust loaders
-# -----------------------------
+# Worker process state for render_variants (set once per process by _init_worker)
+_worker = {}
 
-def load_copy_map(path: Optional[str]) -> Dict[str,str]:
-    if not path or not os.path.exists(path):
-        print("[i] copy.json 생략됨 → 빈 매핑으로 진행")
-        return {}
-    try:
-        with open(path, 'r', encoding='utf-8-sig') as f:  # accept BOM
-            raw = f.read()
-        if not raw.strip():
-            print(f"[i] {path} 가 비어있음 → 빈 매핑으로 진행")
-            return {}
-        txt = re.sub(r"/\*.*?\*/", "", raw, flags=re.S)  # /* */ comments
-        txt = re.sub(r"//.*", "", txt)                   # // comments
-        txt = re.sub(r",\s*(\]|})", r"\\1", txt)        # trailing commas
-        return json.loads(txt)
-    except json.JSONDecodeError as e:
-        print(f"[경고] copy.json 파싱 실패: {e} → 빈 매핑으로 계속")
-        return {}
-    except Exception as e:
-        print(f"[경고] copy.json 읽기 오류: {e} → 빈 매핑으로 계속")
-        return {}
+def preload_fonts(font_path):
+    """여러 장을 렌더할 프로세스용: fonts/ 바이트 preload + 렌더 폰트(서브셋 우선) 1회 파싱."""
+    reg = get_registry()
+    reg.preload_fonts()
+    reg.font(reg.font_for_text(font_path), 18)
+    return reg
 
+def _init_worker(mode, size, data, meta, font_path, opts):
+    prepared = Image.frombytes(mode, size, data)
+    preload_fonts(font_path)
+    _worker.update(prepared=prepared, analysis=ImageAnalysis(prepared), meta=meta,
+                   font_path=font_path, opts=opts)
 
-CANDIDATE_FONTS = [
-    r"C:\\Windows\\Fonts\\malgunbd.ttf",
-    r"C:\\Windows\\Fonts\\malgun.ttf",
-    r"C:\\Windows\\Fonts\\NanumGothic.ttf",
-    os.path.expandvars(r"%LOCALAPPDATA%\\Microsoft\\Windows\\Fonts\\NotoSansKR-Bold.otf"),
-    os.path.expandvars(r"%LOCALAPPDATA%\\Microsoft\\Windows\\Fonts\\NotoSansKR-Regular.otf"),
-]
+def _render_worker(job):
+    copy_map, out_path = job
+    w = _worker
+    img = render_copy(w["prepared"], w["analysis"], w["meta"], copy_map, w["font_path"], w["opts"])
+    return save_final(img, out_path, output_encoder(w["opts"]))
 
 
-def resolve_font_path(requested_path: Optional[str]) -> str:
-    if requested_path and os.path.exists(requested_path):
-        return requested_path
-    # Search Noto in system/user fonts
-    for pattern in [
-        r"C:\\Windows\\Fonts\\*Noto*Sans*KR*Bold*.otf",
-        r"C:\\Windows\\Fonts\\*Noto*Sans*KR*.ttf",
-        os.path.expandvars(r"%LOCALAPPDATA%\\Microsoft\\Windows\\Fonts\\*Noto*Sans*KR*Bold*.otf"),
-        os.path.expandvars(r"%LOCALAPPDATA%\\Microsoft\\Windows\\Fonts\\*Noto*Sans*KR*.ttf"),
-    ]:
-        hits = glob.glob(pattern)
-        if hits:
-            return hits[0]
-    for p in CANDIDATE_FONTS:
-        if p and os.path.exists(p):
-            return p
-    raise FileNotFoundError(
-        "한글 폰트를 찾지 못했습니다. --font_kor 로 실제 파일(.ttf/.otf)을 지정하거나 'C:\\Windows\\Fonts\\malgunbd.ttf' 등을 사용하세요.")
+def render_variants(background: Image.Image, meta: dict, copy_maps: List[Dict[str,str]], font_path: str,
+                    opts, out_paths: List[str], workers: int = 0) -> List[dict]:
+    """
+    배경 1장 + 레이아웃 1개 + 문구 매핑 N개 → 최종 이미지 N장 (A/B 세트).
+    배경 디코드 / layout underlay / luma 분석 / 폰트 / 로고는 한 번만 준비해 공유.
+    workers > 1이면 프로세스 풀에서 변형을 병렬 렌더 (워커마다 준비 결과를 한 번만 전달).
+    반환: 변형별 save_final 요약 (path 포함).
+    """
+    if len(copy_maps) != len(out_paths):
+        raise ValueError("copy_maps and out_paths must have the same length")
+    prepared, analysis = prepare_background(background, meta, opts)
+    jobs = list(zip(copy_maps, out_paths))
+    if workers and workers > 1 and len(jobs) > 1:
+        from concurrent.futures import ProcessPoolExecutor
+        init = (prepared.mode, prepared.size, prepared.tobytes(), meta, font_path, opts)
+        with ProcessPoolExecutor(max_workers=min(workers, len(jobs)),
+                                 initializer=_init_worker, initargs=init) as ex:
+            return list(ex.map(_render_worker, jobs))
+    encoder = output_encoder(opts)
+    return [save_final(render_copy(prepared, analysis, meta, copy_map, font_path, opts), out_path, encoder)
+            for copy_map, out_path in jobs]
+
+
+def load_variant_maps(args) -> List[Dict[str,str]]:
+    maps = [load_copy_map(p) for p in (args.copy_jsons or [])]
+    if args.variants_json:
+        with open(args.variants_json, 'r', encoding='utf-8-sig') as f:
+            lst = json.load(f)
+        if not isinstance(lst, list):
+            raise SystemExit(f"[변형 오류] {args.variants_json}: 문구 매핑 리스트가 아님")
+        maps.extend(m for m in lst if isinstance(m, dict))
+    return maps
 
 # -----------------------------
 # Main
 # -----------------------------
 
 def main():
-    ap = argparse.ArgumentParser()
-    ap.add_argument("--image", required=True, help="Stage3/4 결과 이미지 경로")
-    ap.add_argument("--layout_json", required=True, help="레이아웃 JSON 경로")
-    ap.add_argument("--copy_json", required=False, help="문구 매핑 JSON (type#index -> text)")
-    ap.add_argument("--font_kor", required=False, help="한국어 폰트 파일 경로(.ttf/.otf)")
-    ap.add_argument("--logo_path", required=False, help="로고 PNG 경로(선택)")
-    ap.add_argument("--out", default="final_ad.png")
-    ap.add_argument("--stroke", type=int, default=1, help="텍스트 외곽선 두께")
-    ap.add_argument("--underlay_color", default=None, help="언더레이 색상(hex, 예:#111418). 없으면 자동")
-    ap.add_argument("--underlay_opacity", type=float, default=None, help="언더레이 불투명도(0~1) override")
-    ap.add_argument("--target_ratio", type=float, default=0.82, help="텍스트 폭/높이 여유 비율")
-    ap.add_argument("--line_spacing", type=float, default=1.02, help="줄간 간격 배수")
-    ap.add_argument("--wrap_mode", choices=["auto","word","char"], default="auto")
-    ap.add_argument("--glass_underlay", action='store_true', help="텍스트 영역에 유리(블러) 패널 적용")
-    ap.add_argument("--glass_blur", type=int, default=6, help="유리 패널 블러 강도")
-    ap.add_argument("--glass_alpha", type=float, default=0.45, help="유리 패널 틴트 알파(0~1)")
-    ap.add_argument("--shrink_underlay_to_text", action='store_true', help="언더레이를 텍스트 폭+패딩으로 축소")
-    ap.add_argument("--skip_layout_underlays", action='store_true', help="layout의 underlay 박스 그리지 않음")
-    ap.add_argument("--debug_boxes", action='store_true', help="각 bbox 테두리 표시")
-    args = ap.parse_args()
-
-    base = Image.open(args.image).convert("RGBA")
-    W, H = base.size
-    draw = ImageDraw.Draw(base, "RGBA")
+    args = build_parser().parse_args()
 
     with open(args.layout_json, 'r', encoding='utf-8-sig') as f:
         meta = json.load(f)
 
-    copy_map: Dict[str,str] = load_copy_map(args.copy_json)
-
-    layout = meta.get("layout", {}) or {}
-    nongraphics = layout.get("nongraphic_layout", []) or []
-    graphics = layout.get("graphic_layout", []) or []
-
     # Resolve font
     font_path = resolve_font_path(args.font_kor)
     try:
-        _ = ImageFont.truetype(font_path, 18)
+        reg = get_registry()
+        _ = reg.font(reg.font_for_text(font_path), 18)
     except OSError as e:
         raise SystemExit(f"[폰트 오류] '{font_path}' 로드 실패: {e}")
 
-    # 1) Layout-provided UNDERLAYS first (optional)
-    if not args.skip_layout_underlays:
-        for g in graphics:
-            gtype = (g.get("type") or '').lower()
-            bbox = g.get("bbox")
-            if gtype != 'underlay' or not (isinstance(bbox, list) and len(bbox)==4):
-                continue
-            x0,y0,x1,y1 = detect_and_to_px(bbox, W, H)
-            w,h = box_size_xyxy(x0,y0,x1,y1)
-            style = g.get("style", {}) or {}
-            radius = style.get("radius", 0.08)  # fraction of min(w,h)
-            opacity = style.get("opacity", 0.6)
-            if args.underlay_opacity is not None:
-                opacity = args.underlay_opacity
-            radius_px = max(2, int(min(w,h) * radius))
-            if args.underlay_color:
-                ur,ug,ub = hex_to_rgb(args.underlay_color)
-            else:
-                luma = avg_luma(base, (x0,y0,x1,y1))
-                ur,ug,ub = ((255,255,255) if luma < 0.5 else (0,0,0))
-            ua = int(clamp(opacity,0,1)*255)
-            draw_underlay(draw, (x0,y0,x1,y1), radius_px, (ur,ug,ub,ua))
-
-    # 2) TEXTS (headline/subhead/etc.)
-    type_counts: Dict[str,int] = {}
-    for t in nongraphics:
-        ttype = (t.get("type") or 'text').lower()
-        idx = type_counts.get(ttype, 0)
-        type_counts[ttype] = idx + 1
-        key = f"{ttype}#{idx}"
-
-        text = copy_map.get(key, '')
-        if not text:
-            continue
-        bbox = t.get("bbox")
-        if not (isinstance(bbox, list) and len(bbox)==4):
-            continue
-
-        x0,y0,x1,y1 = detect_and_to_px(bbox, W, H)
-        if args.debug_boxes:
-            draw.rectangle((x0,y0,x1,y1), outline=(255,0,0,128), width=1)
-
-        # Decide text color based on local background luma
-        luma = avg_luma(base, (x0,y0,x1,y1))
-        txt_col, stroke_col = choose_text_and_stroke(luma)
-
-        # Fit text
-        font, line_boxes, size = fit_text_in_box(
-            draw, text, font_path, (x0,y0,x1,y1),
-            target_ratio=args.target_ratio,
-            max_try=112, min_size=14,
-            line_spacing=args.line_spacing,
-            align='center', wrap_mode=args.wrap_mode
-        )
-        if not font:
-            continue
-
-        # Compute tight text bbox (for optional underlay/glass around text only)
-        pad = 12
-        if line_boxes:
-            tx0 = min(tx for _, (tx, ty), (tw, th) in line_boxes)
-            ty0 = min(ty for _, (tx, ty), (tw, th) in line_boxes)
-            tx1 = max(tx + tw for _, (tx, ty), (tw, th) in line_boxes)
-            ty1 = max(ty + th for _, (tx, ty), (tw, th) in line_boxes)
-        else:
-            tx0,ty0,tx1,ty1 = x0,y0,x1,y1
-        ux0, uy0, ux1, uy1 = clamp_box(tx0-pad, ty0-pad, tx1+pad, ty1+pad, W, H)
-
-        # Optional glass or text-tight underlay
-        if args.glass_underlay:
-            glass_alpha = clamp(args.glass_alpha, 0, 1)
-            tint = (17,20,24, int(glass_alpha*255))
-            glass_underlay(base, (ux0,uy0,ux1,uy1), radius=16, blur=args.glass_blur, tint=tint)
-        elif args.shrink_underlay_to_text:
-            if args.underlay_color:
-                ur,ug,ub = hex_to_rgb(args.underlay_color)
-            else:
-                luma_u = avg_luma(base, (ux0,uy0,ux1,uy1))
-                ur,ug,ub = ((255,255,255) if luma_u < 0.5 else (0,0,0))
-            opacity = 0.42 if args.underlay_opacity is None else args.underlay_opacity
-            draw_underlay(draw, (ux0,uy0,ux1,uy1), radius_px=16, fill_rgba=(ur,ug,ub,int(clamp(opacity,0,1)*255)))
-
-        # Render text lines
-        for ln, (tx, ty), (tw, th) in line_boxes:
-            draw.text((tx, ty), ln, font=font, fill=txt_col+(255,),
-                      stroke_width=max(0, args.stroke), stroke_fill=stroke_col+(255,))
-
-    # 3) LOGO from graphic_layout (type=logo)
-    for g in graphics:
-        if (g.get("type") or '').lower() != 'logo':
-            continue
-        if not args.logo_path:
-            continue
-        bbox = g.get("bbox")
-        if not (isinstance(bbox, list) and len(bbox)==4):
-            continue
-        x0,y0,x1,y1 = detect_and_to_px(bbox, W, H)
-        place_logo(base, args.logo_path, (x0,y0,x1,y1))
+    background = Image.open(args.image).convert("RGBA")
+
+    if args.copy_jsons or args.variants_json:
+        maps = load_variant_maps(args)
+        if not (args.workers and args.workers > 1):
+            preload_fonts(font_path)   # 변형을 이 프로세스에서 연속 렌더 (워커는 _init_worker에서)
+        outs = [variant_out_path(args.out, i) for i in range(len(maps))]
+        reps = render_variants(background, meta, maps, font_path, args, outs, workers=args.workers)
+        for rep in reps:
+            print(f"✅ 저장 완료: {rep['path']} ({rep['format']}, {rep['bytes']/1024:.0f} KB)")
+        write_out_report(args.out_report, reps)
+        return
 
-    base.convert("RGB").save(args.out, quality=95)
-    print(f"✅ 저장 완료: {args.out}")
+    copy_map: Dict[str,str] = load_copy_map(args.copy_json)
+    prepared, analysis = prepare_background(background, meta, args)
+    rep = save_final(render_copy(prepared, analysis, meta, copy_map, font_path, args), args.out, output_encoder(args))
+    write_out_report(args.out_report, rep)
+    print(f"✅ 저장 완료: {args.out} ({rep['format']}, {rep['bytes']/1024:.0f} KB)")
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
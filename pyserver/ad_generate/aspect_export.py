@@ -0,0 +1,436 @@
+# -*- coding: utf-8 -*-
+"""
+aspect_export.py
+파이프라인 1회로 여러 종횡비(1:1 / 4:5 / 9:16 …) 광고를 뽑는 멀티 포맷 모드.
+
+- plan:   Qwen 레이아웃(원본 좌표)과 원본 이미지 → 모든 종횡비 크롭이 주제(subject)를 담을 수 있는
+          가장 작은 마스터 캔버스를 계산해 원본을 가운데 두고 가장자리 연장 + 블러로 채움,
+          레이아웃을 캔버스 좌표로 변환 → Stage 2(nano_banana_generate)는 이 캔버스로 한 번만 생성
+- export: 생성된 캔버스 배경 1장에서 종횡비별로 주제 중심 크롭 →
+          레이아웃을 크롭 좌표로 옮겨 규칙 검사(layout_rules)를 다시 돌리고, 걸린 요소만
+          크롭의 소벨 에너지에서 네거티브 스페이스 탐색(energy_search)으로 재배치 →
+          포맷별 텍스트 렌더(ad_text_render)를 한 프로세스에서 실행 (폰트 / 스프라이트 캐시 공유)
+
+캔버스가 모자라면(plan 없이 생성된 배경) export가 같은 방식으로 로컬 연장(생성 모델 호출 없음).
+좌표: 레이아웃 bbox는 정규화 [x,y,w,h], 크롭 창은 픽셀 (x0,y0,x1,y1) (끝 미포함).
+의존: numpy, Pillow
+"""
+
+import os
+import sys
+import copy
+import json
+import math
+import time
+import argparse
+
+import numpy as np
+from PIL import Image
+
+from energy_search import clip_bbox, integral_image, multiscale_search, window_sizes
+from image_analysis import ImageAnalysis
+from layout_rules import CandidateTable
+from output_encoder import DEFAULT_EXT
+from roi_filters import blur_rects
+
+ASPECTS = ("1:1", "4:5", "9:16")    # 피드 / 세로 피드 / 스토리·릴스
+SUBJECT_PAD = 0.05                  # 크롭이 주제 주변에 남길 여유 (짧은 변 대비)
+FILL_BLUR = 24                      # 캔버스 연장부 블러 반경 (생성 모델이 배경으로 다시 그릴 자리)
+
+# qwen_logic.generate_layout 기본 규칙과 동일
+TEXT_RULES = {"min_margin": 0.03, "min_ar": 1.8, "max_area": 0.20, "max_iou_subject": 0.20}
+LOGO_RULES = {"min_margin": 0.03, "max_area": 0.12, "ar_range": (0.7, 3.0),
+              "max_iou_subject": 0.20, "max_iou_text": 0.25}
+# headline 외 텍스트 요소(subhead, badge, CTA...)는 여백 / 주제 겹침만 검사
+EXTRA_RULES = {"min_margin": 0.03, "min_ar": 0.0, "max_area": 1.0, "max_iou_subject": 0.20}
+
+def parse_aspect(s):
+    """"4:5" / "4x5" / "0.8" → 가로/세로 비."""
+    s = str(s).strip().lower().replace("x", ":")
+    try:
+        if ":" in s:
+            a, b = s.split(":", 1)
+            v = float(a) / float(b)
+        else:
+            v = float(s)
+    except (ValueError, ZeroDivisionError):
+        raise ValueError(f"invalid aspect ratio: {s}")
+    if not v > 0:
+        raise ValueError(f"invalid aspect ratio: {s}")
+    return v
+
+def aspect_tag(s):
+    return str(s).strip().lower().replace(":", "x")
+
+def parse_aspects(s):
+    lst = [a.strip() for a in (s or "").split(",") if a.strip()] if isinstance(s, str) else list(s or [])
+    for a in lst:
+        parse_aspect(a)
+    return lst or list(ASPECTS)
+
+# ---------------------------
+# Layout geometry
+# ---------------------------
+def subject_bbox(meta):
+    subj = ((meta.get("layout") or {}).get("subject_layout") or {})
+    try:
+        (cx, cy), (rw, rh) = subj.get("center", [0.5, 0.5]), subj.get("ratio", [0.3, 0.3])
+        return clip_bbox([cx - rw/2, cy - rh/2, rw, rh])
+    except (TypeError, ValueError):
+        return [0.35, 0.35, 0.3, 0.3]
+
+def map_bbox(b, size, win):
+    """size 좌표계의 정규화 xywh → 픽셀 창 win=(x0,y0,x1,y1) 기준 정규화 xywh (잘라내지 않음)."""
+    W, H = size
+    x0, y0, x1, y1 = win
+    ww, wh = float(x1 - x0), float(y1 - y0)
+    x, y, w, h = map(float, b)
+    return [(x*W - x0) / ww, (y*H - y0) / wh, w*W / ww, h*H / wh]
+
+def _valid(b):
+    return isinstance(b, list) and len(b) == 4
+
+def map_layout(meta, size, win):
+    """meta의 모든 박스(subject / text / graphic / background_objects 힌트)를 창 좌표로 옮긴 사본."""
+    out = copy.deepcopy(meta)
+    lay = out.setdefault("layout", {})
+    lay["bbox_format"] = "xywh"   # ad_text_render의 xyxy/xywh 추정을 건너뜀 (옮긴 박스는 추정이 틀리기 쉬움)
+    sb = map_bbox(subject_bbox(meta), size, win)
+    lay["subject_layout"] = {"center": [round(sb[0] + sb[2]/2, 4), round(sb[1] + sb[3]/2, 4)],
+                             "ratio": [round(sb[2], 4), round(sb[3], 4)]}
+    for key in ("nongraphic_layout", "graphic_layout"):
+        for it in lay.get(key) or []:
+            if isinstance(it, dict) and _valid(it.get("bbox")):
+                it["bbox"] = map_bbox(it["bbox"], size, win)
+    for ob in out.get("background_objects") or []:
+        if isinstance(ob, dict) and _valid(ob.get("bbox_hint")):
+            ob["bbox_hint"] = clip_bbox(map_bbox(ob["bbox_hint"], size, win))
+    return out
+
+# ---------------------------
+# Canvas planning / crop windows
+# ---------------------------
+class CanvasPlan:
+    """원본(src_size)을 offset 위치에 둔 마스터 캔버스(size)."""
+
+    def __init__(self, src_size, size, offset):
+        self.src_size = tuple(src_size)
+        self.size = tuple(size)
+        self.offset = tuple(offset)
+
+    @property
+    def window(self):
+        """원본 픽셀 좌표로 본 캔버스 창 (map_layout용)."""
+        ox, oy = self.offset
+        return (-ox, -oy, self.size[0] - ox, self.size[1] - oy)
+
+    @property
+    def grows(self):
+        return self.size != self.src_size
+
+    def describe(self):
+        return {"size": list(self.size), "source_size": list(self.src_size), "offset": list(self.offset)}
+
+def plan_canvas(src_size, subj, aspects, pad=SUBJECT_PAD):
+    """
+    종횡비 a마다 주제 + 여유를 담는 크롭 최소 크기 (w,h)=(a·h, max(need_h, need_w/a))를 구해
+    캔버스가 모두를 담도록 각 변을 늘림. 원본은 가운데 배치.
+    (주제 중심에 맞춘 크롭을 캔버스 안으로 밀어 넣어도 주제가 크롭 안에 남음 — 크롭 ≥ 주제)
+    """
+    W, H = src_size
+    m = pad * min(W, H)
+    need_w = subj[2] * W + 2*m
+    need_h = subj[3] * H + 2*m
+    CW, CH = W, H
+    for a in aspects:
+        r = parse_aspect(a)
+        h_req = max(need_h, need_w / r)
+        CW = max(CW, int(math.ceil(r * h_req)))
+        CH = max(CH, int(math.ceil(h_req)))
+    return CanvasPlan((W, H), (CW, CH), ((CW - W) // 2, (CH - H) // 2))
+
+def crop_window(size, subj, aspect):
+    """캔버스 안 가장 큰 aspect 크롭, 주제 중심에 맞추고 캔버스 안으로 클램프. 반환: 픽셀 (x0,y0,x1,y1)."""
+    W, H = size
+    r = parse_aspect(aspect)
+    if W / H > r:
+        cw, ch = min(W, int(round(r * H))), H
+    else:
+        cw, ch = W, min(H, int(round(W / r)))
+    cx = (subj[0] + subj[2]/2) * W
+    cy = (subj[1] + subj[3]/2) * H
+    x0 = int(round(min(max(cx - cw/2, 0), W - cw)))
+    y0 = int(round(min(max(cy - ch/2, 0), H - ch)))
+    return (x0, y0, x0 + cw, y0 + ch)
+
+def pad_to_canvas(img, plan, blur=FILL_BLUR):
+    """
+    원본을 캔버스에 놓고 바깥은 가장자리 픽셀 연장 + 블러로 채움
+    (반사 패딩은 가장자리 근처 제품을 복제하므로 쓰지 않음). 연장이 없으면 RGB 사본.
+    """
+    rgb = img.convert("RGB")
+    if not plan.grows:
+        return rgb.copy()
+    W, H = plan.src_size
+    CW, CH = plan.size
+    ox, oy = plan.offset
+    arr = np.pad(np.asarray(rgb), ((oy, CH - H - oy), (ox, CW - W - ox), (0, 0)), mode="edge")
+    out = Image.fromarray(arr, "RGB")
+    bands = []
+    if oy > 0:          bands.append((0, 0, CW - 1, oy - 1))
+    if CH - H - oy > 0: bands.append((0, oy + H, CW - 1, CH - 1))
+    if ox > 0:          bands.append((0, 0, ox - 1, CH - 1))
+    if CW - W - ox > 0: bands.append((ox + W, 0, CW - 1, CH - 1))
+    return blur_rects(out, bands, radius=blur, feather=blur / 4, inplace=True)
+
+def plan_layout(meta, plan):
+    out = map_layout(meta, plan.src_size, plan.window)
+    out["canvas"] = plan.describe()
+    return out
+
+# ---------------------------
+# Per-aspect layout
+# ---------------------------
+def _energy_crop(analysis, size, win):
+    """캔버스 분석 해상도의 소벨 에너지에서 창 부분만."""
+    W, H = size
+    h, w = analysis.sobel.shape
+    ax0 = int(round(win[0] * w / W)); ax1 = max(ax0 + 1, int(round(win[2] * w / W)))
+    ay0 = int(round(win[1] * h / H)); ay1 = max(ay0 + 1, int(round(win[3] * h / H)))
+    return analysis.sobel[ay0:ay1, ax0:ax1]
+
+def _passes(item, kind, rules, subj, text_bbox=None):
+    tbl = CandidateTable.from_items([dict(item)])
+    if kind == "logo":
+        tbl.enforce_logo_rules(rules, subj, text_bbox)
+    else:
+        tbl.enforce_text_rules(rules, subj)
+    return bool(tbl.alive[0]), tbl.drop_summary()
+
+def _intersects(b, boxes):
+    x, y, w, h = b
+    return any(min(x+w, X+Wd) > max(x, X) and min(y+h, Y+Hd) > max(y, Y) for X, Y, Wd, Hd in boxes)
+
+def _search(energy, ii, b, rules, avoid, placed, max_h):
+    """같은 픽셀 크기(±변형) 창으로 크롭 에너지에서 빈 자리 탐색. 못 찾으면 None."""
+    m = rules["min_margin"]
+    w = min(float(b[2]), 1 - 2*m)
+    h = min(float(b[3]), max_h)
+    if "ar_range" in rules:
+        ar = tuple(rules["ar_range"])
+    else:
+        ar = (rules.get("min_ar", 0.0), float("inf"))
+    sizes = window_sizes(w, h, max_w=1 - 2*m, max_h=max_h, ar_range=ar)
+    ranked = multiscale_search(energy, sizes, margin=m, avoid=list(avoid) + placed,
+                               exclude=placed, top_n=1, ii=ii)
+    return ranked[0][1] if ranked else None
+
+def reframe_layout(meta, size, win, analysis, text_rules=TEXT_RULES, logo_rules=LOGO_RULES,
+                   extra_rules=EXTRA_RULES):
+    """
+    캔버스 레이아웃 → 크롭 창 레이아웃. 요소 순서(headline → 기타 텍스트 → logo)대로
+    규칙을 통과하면 그대로, 걸리거나 앞 요소와 겹치면 크롭 에너지에서 재탐색.
+    underlay는 대상 요소("for")를 따라 같은 여백으로 이동.
+    반환: (meta, {"kept": [...], "moved": [...], "clipped": [...]})
+    """
+    out = map_layout(meta, size, win)
+    lay = out["layout"]
+    subj_raw = subject_bbox(out)
+    subj = clip_bbox(subj_raw)
+    energy = _energy_crop(analysis, size, win)
+    ii = integral_image(energy)
+    texts = [t for t in (lay.get("nongraphic_layout") or []) if isinstance(t, dict)]
+    graphics = [g for g in (lay.get("graphic_layout") or []) if isinstance(g, dict)]
+    underlays = [g for g in graphics if str(g.get("type", "")).lower() == "underlay"]
+    logos = [g for g in graphics if g not in underlays]
+
+    report = {"kept": [], "moved": [], "clipped": []}
+    before = {}                 # key → 크롭 좌표로 옮긴 원래 박스 (underlay 이동량 계산용)
+    placed = []
+    counts = {}
+    headline = None
+
+    def settle(it, key, kind, rules, max_h, text_bbox=None):
+        b = it.get("bbox")
+        if not _valid(b):
+            return
+        before[key] = list(b)
+        ok, _ = _passes(it, kind, rules, subj, text_bbox)
+        if ok and not _intersects(clip_bbox(b), placed):
+            it["bbox"] = clip_bbox(b)
+            report["kept"].append(key)
+        else:
+            nb = _search(energy, ii, b, rules, [subj, text_bbox] if text_bbox else [subj], placed, max_h)
+            if nb is not None:
+                it["bbox"] = nb
+                report["moved"].append(key)
+            else:
+                it["bbox"] = clip_bbox(b)
+                report["clipped"].append(key)
+        placed.append(it["bbox"])
+
+    for t in texts:
+        ttype = str(t.get("type") or "text").lower()
+        idx = counts.get(ttype, 0); counts[ttype] = idx + 1
+        key = f"{ttype}#{idx}"
+        if headline is None and ttype == "headline":
+            settle(t, key, "text", text_rules, max_h=0.22)
+            headline = t.get("bbox")
+        else:
+            settle(t, key, "text", extra_rules, max_h=0.22)
+    for g in logos:
+        gtype = str(g.get("type") or "graphic").lower()
+        idx = counts.get(gtype, 0); counts[gtype] = idx + 1
+        settle(g, f"{gtype}#{idx}", "logo", logo_rules, max_h=0.15, text_bbox=headline)
+
+    # underlay: 대상 요소의 이동 / 크기 변화만큼 같이 옮김
+    targets = {}
+    counts = {}
+    for it in texts + logos:
+        t = str(it.get("type") or "text").lower()
+        idx = counts.get(t, 0); counts[t] = idx + 1
+        targets[f"{t}#{idx}"] = it
+    for u in underlays:
+        b = u.get("bbox")
+        if not _valid(b):
+            continue
+        key = u.get("for")
+        tgt = targets.get(key)
+        if tgt is not None and key in before and _valid(tgt.get("bbox")):
+            ob, nb = before[key], tgt["bbox"]
+            b = [nb[0] + (b[0] - ob[0]), nb[1] + (b[1] - ob[1]), b[2] + (nb[2] - ob[2]), b[3] + (nb[3] - ob[3])]
+        u["bbox"] = clip_bbox(b)
+
+    lay["subject_layout"] = {"center": [round(subj[0] + subj[2]/2, 4), round(subj[1] + subj[3]/2, 4)],
+                             "ratio": [round(subj[2], 4), round(subj[3], 4)]}
+    out.pop("canvas", None)
+    out["crop"] = {"window": list(win), "canvas_size": list(size)}
+    return out, report
+
+# ---------------------------
+# Export
+# ---------------------------
+def export_formats(background, meta, aspects, copy_map, font_path, opts, out_dir,
+                   width=0, name="final_ad"):
+    """
+    캔버스 배경 1장 + 캔버스 레이아웃 → 종횡비별 최종 이미지 / 레이아웃.
+    width > 0이면 크롭을 가로 width 픽셀로 리사이즈 (예: Meta 1080).
+    반환: manifest dict
+    """
+    import ad_text_render as R   # 렌더 옵션 / 캐시(asset_registry)는 모든 포맷이 공유
+
+    t0 = time.perf_counter()
+    bg = background.convert("RGB")
+    subj = subject_bbox(meta)
+    plan = plan_canvas(bg.size, subj, aspects)
+    if plan.grows and "canvas" not in meta:
+        # plan 단계 없이 생성된 배경: 로컬 연장 (생성 모델 호출 없음)
+        print(f"[aspect] canvas {bg.size} -> {plan.size} (local fill)")
+        meta = plan_layout(meta, plan)
+        bg = pad_to_canvas(bg, plan)
+        subj = subject_bbox(meta)
+    analysis = ImageAnalysis(bg)
+    encoder = R.output_encoder(opts)
+    ext = DEFAULT_EXT[encoder.resolve()]     # auto → png
+    os.makedirs(out_dir, exist_ok=True)
+    formats = []
+    for a in aspects:
+        t1 = time.perf_counter()
+        win = crop_window(bg.size, subj, a)
+        meta_a, rep = reframe_layout(meta, bg.size, win, analysis)
+        crop = bg.crop(win)
+        if width and width != crop.width:
+            crop = crop.resize((int(width), max(1, int(round(width / parse_aspect(a))))), Image.LANCZOS)
+        tag = aspect_tag(a)
+        out_path = os.path.join(out_dir, f"{name}_{tag}{ext}")
+        layout_path = os.path.join(out_dir, f"layout_{tag}.json")
+        with open(layout_path, "w", encoding="utf-8") as f:
+            json.dump(meta_a, f, ensure_ascii=False, indent=2)
+        prepared, an = R.prepare_background(crop.convert("RGBA"), meta_a, opts)
+        enc = R.save_final(R.render_copy(prepared, an, meta_a, copy_map, font_path, opts), out_path, encoder)
+        formats.append({"aspect": a, "path": out_path, "layout_path": layout_path, "window": list(win),
+                        "size": [crop.width, crop.height], "reframe": rep, "output": enc,
+                        "ms": round((time.perf_counter() - t1) * 1000, 1)})
+        print(f"[aspect] {a}: window={list(win)} kept={rep['kept']} moved={rep['moved']} "
+              f"clipped={rep['clipped']} -> {out_path}")
+    return {"canvas": list(bg.size), "formats": formats, "ms": round((time.perf_counter() - t0) * 1000, 1)}
+
+# ---------------------------
+# CLI
+# ---------------------------
+def _load_json(path):
+    with open(path, "r", encoding="utf-8-sig") as f:
+        return json.load(f)
+
+def cmd_plan(args):
+    meta = _load_json(args.layout_json)
+    aspects = parse_aspects(args.aspects)
+    src = Image.open(args.image)
+    src.load()
+    plan = plan_canvas(src.size, subject_bbox(meta), aspects, pad=args.pad)
+    pad_to_canvas(src, plan, blur=args.fill_blur).save(args.out_image)
+    out = plan_layout(meta, plan)
+    out["canvas"]["aspects"] = aspects
+    with open(args.out_layout, "w", encoding="utf-8") as f:
+        json.dump(out, f, ensure_ascii=False, indent=2)
+    print(f"[aspect] plan {aspects}: source {src.size} -> canvas {plan.size} offset {plan.offset}")
+
+def cmd_export(args):
+    import ad_text_render as R
+
+    meta = _load_json(args.layout_json)
+    aspects = parse_aspects(args.aspects or (meta.get("canvas") or {}).get("aspects"))
+    font_path = R.resolve_font_path(args.font_kor)
+    R.preload_fonts(font_path)   # 포맷마다 같은 프로세스에서 렌더
+    copy_map = R.load_copy_map(args.copy_json)
+    opts = R.render_options(
+        logo_path=args.logo_path, skip_layout_underlays=args.skip_layout_underlays, stroke=args.stroke,
+        text_color_rule=args.text_color_rule, out_format=args.out_format, out_quality=args.out_quality, out_max_kb=args.out_max_kb)
+    background = Image.open(args.image)
+    man = export_formats(background, meta, aspects, copy_map, font_path, opts, args.out_dir, width=args.width)
+    path = args.manifest or os.path.join(args.out_dir, "manifest.json")
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(man, f, ensure_ascii=False, indent=2)
+    print(f"[aspect] {len(man['formats'])} format(s) in {man['ms']:.0f} ms -> {path}")
+
+def main():
+    ap = argparse.ArgumentParser(description="멀티 종횡비 광고 export (plan → Stage 2 1회 → export)")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+
+    p = sub.add_parser("plan", help="마스터 캔버스 입력 이미지 + 캔버스 좌표 레이아웃 생성 (Stage 2 전)")
+    p.add_argument("--image", required=True, help="원본(제품) 이미지")
+    p.add_argument("--layout_json", required=True, help="Stage 1 레이아웃 JSON (원본 좌표)")
+    p.add_argument("--aspects", default=",".join(ASPECTS), help="예: 1:1,4:5,9:16")
+    p.add_argument("--out_image", required=True)
+    p.add_argument("--out_layout", required=True)
+    p.add_argument("--pad", type=float, default=SUBJECT_PAD, help="크롭이 주제 주변에 남길 여유 (짧은 변 대비)")
+    p.add_argument("--fill_blur", type=int, default=FILL_BLUR, help="캔버스 연장부 블러 반경")
+    p.set_defaults(func=cmd_plan)
+
+    e = sub.add_parser("export", help="캔버스 배경(Stage 2 결과) → 종횡비별 크롭 + 레이아웃 + 텍스트 렌더")
+    e.add_argument("--image", required=True, help="Stage 2 결과 (캔버스 배경)")
+    e.add_argument("--layout_json", required=True, help="plan이 만든 캔버스 좌표 레이아웃")
+    e.add_argument("--aspects", default=None, help="기본: 레이아웃 canvas.aspects 또는 1:1,4:5,9:16")
+    e.add_argument("--out_dir", required=True)
+    e.add_argument("--manifest", default=None, help="결과 요약 JSON (기본 out_dir/manifest.json)")
+    e.add_argument("--width", type=int, default=0, help="출력 가로 픽셀 (0 → 크롭 원본 크기)")
+    e.add_argument("--copy_json", default=None)
+    e.add_argument("--font_kor", default=None)
+    e.add_argument("--logo_path", default=None)
+    e.add_argument("--skip_layout_underlays", action="store_true")
+    e.add_argument("--stroke", type=int, default=1)
+    e.add_argument("--text_color_rule", choices=["wcag", "threshold"], default="threshold")
+    e.add_argument("--out_format", choices=["auto", "png", "jpeg", "webp"], default="auto")
+    e.add_argument("--out_quality", type=int, default=90)
+    e.add_argument("--out_max_kb", type=int, default=0)
+    e.set_defaults(func=cmd_export)
+
+    args = ap.parse_args()
+    try:
+        args.func(args)
+    except (OSError, ValueError) as ex:
+        print(f"[aspect] 실패: {ex}")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
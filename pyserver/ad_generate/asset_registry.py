@@ -0,0 +1,189 @@
+# -*- coding: utf-8 -*-
+"""
+asset_registry.py
+텍스트/로고 렌더링(ad_text_render)용 에셋 캐시.
+
+- 폰트: 파일 바이트를 한 번만 읽어 두고(preload), (path, size) → FreeTypeFont 를 LRU로 유지
+  → fit_text_in_box 이진 탐색마다 수 MB TTF를 다시 파싱하지 않음
+- 로고: 파일 내용 해시 → 디코드된 RGBA, (해시, 크기) → 리사이즈본 LRU
+  (경로가 달라도 내용이 같으면 공유, 파일이 바뀌면 mtime/size로 감지해 다시 해시)
+- 텍스트 스프라이트: (문자열, 폰트 해시, 크기, 외곽선 두께) → 래스터 마스크, 바이트 상한 LRU
+- 서브셋 폰트(font_subset build 결과)가 있으면 문자열이 커버될 때 서브셋을 열고, 아니면 원본을 그때 로드
+
+프로세스 전역 인스턴스는 get_registry(). 여러 장을 렌더하는 프로세스(render_variants 워커 / 프로세스 내 변형 렌더,
+aspect_export export)는 ad_text_render.preload_fonts()로 fonts/ 를 미리 읽어 둠.
+의존: Pillow
+"""
+
+import os
+import io
+import hashlib
+import threading
+from collections import OrderedDict
+
+from PIL import Image, ImageFont
+
+from font_subset import is_subset, select_font
+
+FONT_DIR = os.getenv("AD_FONT_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "fonts"))
+FONT_EXTS = (".ttf", ".otf", ".ttc")
+FONT_CACHE_SIZE = 256   # (path, size) 조합 수
+LOGO_CACHE_SIZE = 64    # (logo, 크기) 조합 수
+SPRITE_CACHE_BYTES = int(os.getenv("AD_SPRITE_CACHE_MB", "64")) * 1024 * 1024
+
+class LRU:
+    """스레드 안전 LRU (OrderedDict). weigh가 있으면 capacity는 항목 무게 합(예: 바이트) 상한."""
+
+    def __init__(self, capacity, weigh=None):
+        self.capacity = int(capacity)
+        self.weigh = weigh
+        self._d = OrderedDict()
+        self._w = {}
+        self.total = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self._lock:
+            v = self._d.get(key)
+            if v is None:
+                self.misses += 1
+                return None
+            self._d.move_to_end(key)
+            self.hits += 1
+            return v
+
+    def put(self, key, value):
+        w = self.weigh(value) if self.weigh else 1
+        with self._lock:
+            self.total -= self._w.get(key, 0)
+            self._d[key] = value; self._w[key] = w
+            self.total += w
+            self._d.move_to_end(key)
+            while self.total > self.capacity and len(self._d) > 1:
+                k, _ = self._d.popitem(last=False)
+                self.total -= self._w.pop(k)
+        return value
+
+    def __len__(self):
+        return len(self._d)
+
+class AssetRegistry:
+    def __init__(self, font_cache=FONT_CACHE_SIZE, logo_cache=LOGO_CACHE_SIZE, sprite_bytes=SPRITE_CACHE_BYTES):
+        self._font_bytes = {}
+        self._font_hash = {}
+        self._fonts = LRU(font_cache)
+        self._sprites = LRU(sprite_bytes, weigh=lambda sp: sp.nbytes)
+        self._logo_keys = {}      # abspath → ((mtime, size), content hash)
+        self._logos = {}          # content hash → RGBA
+        self._logo_sized = LRU(logo_cache)
+        self.font_fallbacks = 0   # 서브셋이 있는데 커버 못 해 원본을 쓴 횟수
+        self._lock = threading.Lock()
+
+    # ----- fonts -----
+    def preload_fonts(self, font_dir=FONT_DIR):
+        """font_dir 의 폰트 파일 바이트를 읽어 둠 (서브셋이 있으면 서브셋만). 반환: 읽은 경로 리스트."""
+        out = []
+        if not font_dir or not os.path.isdir(font_dir):
+            return out
+        for name in sorted(os.listdir(font_dir)):
+            if name.lower().endswith(FONT_EXTS) and not is_subset(name):
+                p = self.font_for_text(os.path.join(font_dir, name))
+                self.font_bytes(p)
+                out.append(p)
+        return out
+
+    def font_for_text(self, path, text=""):
+        """text를 그릴 폰트 경로: 서브셋이 커버하면 서브셋, 아니면 원본 (text가 비면 서브셋 우선)."""
+        p = select_font(path, text)
+        if p == path and text and select_font(path) != path:
+            self.font_fallbacks += 1
+        return p
+
+    def font_bytes(self, path):
+        key = os.path.abspath(path)
+        with self._lock:
+            data = self._font_bytes.get(key)
+        if data is None:
+            with open(key, "rb") as f:
+                data = f.read()
+            with self._lock:
+                data = self._font_bytes.setdefault(key, data)
+        return data
+
+    def font_hash(self, path):
+        """폰트 파일 내용 해시 (경로가 달라도 같은 폰트면 스프라이트 공유)."""
+        key = os.path.abspath(path)
+        h = self._font_hash.get(key)
+        if h is None:
+            h = self._font_hash[key] = hashlib.sha1(self.font_bytes(path)).hexdigest()
+        return h
+
+    def font(self, path, size):
+        """(path, size) → FreeTypeFont. OSError는 ImageFont.truetype와 동일하게 전달."""
+        key = (os.path.abspath(path), int(size))
+        f = self._fonts.get(key)
+        if f is None:
+            f = self._fonts.put(key, ImageFont.truetype(io.BytesIO(self.font_bytes(path)), int(size)))
+        return f
+
+    # ----- logos -----
+    def _logo_hash(self, path):
+        p = os.path.abspath(path)
+        st = os.stat(p)
+        sig = (st.st_mtime_ns, st.st_size)
+        with self._lock:
+            cached = self._logo_keys.get(p)
+        if cached and cached[0] == sig:
+            return cached[1]
+        with open(p, "rb") as f:
+            data = f.read()
+        h = hashlib.sha1(data).hexdigest()
+        with self._lock:
+            self._logo_keys[p] = (sig, h)
+            if h not in self._logos:
+                im = Image.open(io.BytesIO(data))
+                self._logos[h] = im.convert("RGBA")
+        return h
+
+    def logo(self, path):
+        """디코드된 RGBA 로고 (공유 객체 — 수정하지 말 것)."""
+        return self._logos[self._logo_hash(path)]
+
+    def logo_resized(self, path, size):
+        """size=(w,h) LANCZOS 리사이즈본 (공유 객체)."""
+        h = self._logo_hash(path)
+        key = (h, int(size[0]), int(size[1]))
+        im = self._logo_sized.get(key)
+        if im is None:
+            im = self._logo_sized.put(key, self._logos[h].resize(key[1:], Image.LANCZOS))
+        return im
+
+    # ----- text sprites -----
+    def sprite(self, key, build):
+        """key → 스프라이트 (없으면 build()로 만들어 저장). 스프라이트는 nbytes 속성을 가져야 함."""
+        sp = self._sprites.get(key)
+        if sp is None:
+            sp = self._sprites.put(key, build())
+        return sp
+
+    def stats(self):
+        return {
+            "fonts_loaded": len(self._font_bytes), "font_sizes": len(self._fonts),
+            "font_hits": self._fonts.hits, "font_misses": self._fonts.misses,
+            "logos": len(self._logos), "logo_sizes": len(self._logo_sized),
+            "sprites": len(self._sprites), "sprite_bytes": self._sprites.total,
+            "sprite_hits": self._sprites.hits, "sprite_misses": self._sprites.misses,
+            "font_fallbacks": self.font_fallbacks,
+        }
+
+_registry = None
+_registry_lock = threading.Lock()
+
+def get_registry():
+    global _registry
+    with _registry_lock:
+        if _registry is None:
+            _registry = AssetRegistry()
+        return _registry
@@ -5,13 +5,18 @@ import base64
 import tempfile
 import subprocess
 import logging
+import re
+import time
 import mimetypes
 import threading
 from typing import Optional, Tuple
 
 from fastapi import FastAPI, UploadFile, File, Form, HTTPException
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
 
+import speculative
+
 app = FastAPI(title="Compose Orchestrator", version="1.1.0")
 
 # ----------------------------
@@ -27,13 +32,39 @@ BG_MODEL    = os.getenv("COMPOSE_BG_MODEL", "gemini-2.5-flash-image-preview")
 QWEN_SCRIPT = os.getenv("COMPOSE_QWEN_SCRIPT", "qwen25_vl_layout_hybrid.py")
 NANO_SCRIPT = os.getenv("COMPOSE_NANOBANANA_SCRIPT", "nano_banana_generate.py")
 TEXT_SCRIPT = os.getenv("COMPOSE_TEXTRENDER_SCRIPT", "ad_text_render.py")
+ASPECT_SCRIPT = os.getenv("COMPOSE_ASPECT_SCRIPT", "aspect_export.py")
+SPEC_SCRIPT = os.getenv("COMPOSE_SPEC_SCRIPT", "speculative.py")
 
 QWEN_DIR = os.path.dirname(os.path.abspath(QWEN_SCRIPT)) or os.getcwd()
 NANO_DIR = os.path.dirname(os.path.abspath(NANO_SCRIPT)) or os.getcwd()
 TEXT_DIR = os.path.dirname(os.path.abspath(TEXT_SCRIPT)) or os.getcwd()
+ASPECT_DIR = os.path.dirname(os.path.abspath(ASPECT_SCRIPT)) or os.getcwd()
+SPEC_DIR = os.path.dirname(os.path.abspath(SPEC_SCRIPT)) or os.getcwd()
 
 SKIP_VERTEX_ENV_CHECK = os.getenv("COMPOSE_SKIP_VERTEX_ENV_CHECK", "0") == "1"
 
+# 최종 이미지 출력 포맷 (요청 Form으로 override). PNG는 무손실이라 JPEG/WebP보다 5~10배 큼
+OUTPUT_FORMAT  = os.getenv("COMPOSE_OUTPUT_FORMAT", "jpeg")
+OUTPUT_QUALITY = int(os.getenv("COMPOSE_OUTPUT_QUALITY", "90"))
+OUTPUT_MAX_KB  = int(os.getenv("COMPOSE_OUTPUT_MAX_KB", "0"))
+OUTPUT_EXT = {"png": ".png", "jpeg": ".jpg", "webp": ".webp"}
+
+# 멀티 포맷(aspects) 모드: 포맷별 출력 가로 픽셀 (0 → 크롭 원본 크기)
+ASPECT_WIDTH = int(os.getenv("COMPOSE_ASPECT_WIDTH", "1080"))
+ASPECT_RE = re.compile(r"^\d+(\.\d+)?[:x]\d+(\.\d+)?$")
+
+# 추측 실행(opt-in): Qwen이 도는 동안 에너지 기반 임시 레이아웃으로 배경 생성을 먼저 시작.
+# 최종 예약 영역이 짝별 IoU >= COMPOSE_SPEC_IOU면 그 배경을 쓰고, 아니면 최종 레이아웃으로 재생성
+SPECULATIVE = os.getenv("COMPOSE_SPECULATIVE", "0") == "1"
+SPEC_IOU = float(os.getenv("COMPOSE_SPEC_IOU", str(speculative.SPEC_IOU)))
+
+# 레이아웃 티어: vlm(Qwen) / visual(폴백 엔진만, ms 단위) / auto(Qwen 동시 실행이 한도 이상이면 visual)
+LAYOUT_MODES = ("vlm", "visual", "auto")
+LAYOUT_MODE = os.getenv("COMPOSE_LAYOUT_MODE", "vlm")
+VLM_MAX_INFLIGHT = int(os.getenv("COMPOSE_VLM_MAX_INFLIGHT", "0"))  # 0 → auto도 항상 vlm
+_vlm_inflight = 0
+_vlm_lock = threading.Lock()
+
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],
@@ -44,7 +75,7 @@ app.add_middleware(
 # ----------------------------
 # 공용 유틸 (1) run_argv: text=True로 경고 제거 + stdout/stderr 캡처
 # ----------------------------
-def run_argv(argv, timeout_s=1800, cwd=None, env=None, stream_prefix=None) -> Tuple[int, str, str]:
+def run_argv(argv, timeout_s=1800, cwd=None, env=None, stream_prefix=None, procs=None) -> Tuple[int, str, str]:
     merged_env = {**os.environ, **(env or {})}
     merged_env.update({"PYTHONIOENCODING": "utf-8", "PYTHONUTF8": "1"})
 
@@ -60,6 +91,8 @@ def run_argv(argv, timeout_s=1800, cwd=None, env=None, stream_prefix=None) -> Tu
         errors="backslashreplace",
         creationflags=(subprocess.CREATE_NO_WINDOW if os.name == "nt" else 0),
     )
+    if procs is not None:
+        procs.append(proc)   # 호출자가 중단(kill)할 수 있도록
 
     out_lines, err_lines = [], []
 
@@ -86,6 +119,159 @@ def run_argv(argv, timeout_s=1800, cwd=None, env=None, stream_prefix=None) -> Tu
     t1.join(); t2.join()
     return ret, "".join(out_lines), "".join(err_lines)
 
+def nano_argv(image, layout_json, out):
+    return [
+        sys.executable, NANO_SCRIPT,
+        "--image", image,
+        "--layout_json", layout_json,
+        "--out", out,
+        "--model", BG_MODEL
+    ]
+
+def _resolve_layout_mode(requested):
+    """요청 / 환경 모드 → 실제 티어 ("vlm" | "visual"). auto는 Qwen 동시 실행 수로 결정."""
+    mode = (requested or LAYOUT_MODE).strip().lower()
+    if mode not in LAYOUT_MODES:
+        raise HTTPException(status_code=400, detail=f"layout_mode must be one of {list(LAYOUT_MODES)}")
+    if mode == "auto":
+        with _vlm_lock:
+            busy = VLM_MAX_INFLIGHT > 0 and _vlm_inflight >= VLM_MAX_INFLIGHT
+        mode = "visual" if busy else "vlm"
+    return mode
+
+def run_visual_layout(img_path, product, save):
+    """Step1 대체: Qwen 없이 에너지 휴리스틱 + 기본 배경 프롬프트 레이아웃 (프로세스 내, 수십 ms)."""
+    from layout_fallback import provisional_layout
+
+    parsed = provisional_layout(img_path, product_name=product or None)
+    with open(save, "w", encoding="utf-8") as f:
+        json.dump(parsed, f, ensure_ascii=False, indent=2)
+
+def run_vlm_layout(argv):
+    """Step1 Qwen 서브프로세스 (auto 모드용 동시 실행 수 집계)."""
+    global _vlm_inflight
+    with _vlm_lock:
+        _vlm_inflight += 1
+    try:
+        return run_argv(argv, cwd=QWEN_DIR, timeout_s=1800, stream_prefix="[STEP1]")
+    finally:
+        with _vlm_lock:
+            _vlm_inflight -= 1
+
+class ProcGroup:
+    """
+    run_argv(procs=...)에 넘기는 하위 프로세스 묶음.
+    kill()과 등록(append)을 같은 락으로 묶어, kill() 이후 시작된 프로세스도 등록 즉시 종료.
+    """
+
+    def __init__(self):
+        self.killed = False
+        self._procs = []
+        self._lock = threading.Lock()
+
+    def append(self, proc):
+        with self._lock:
+            self._procs.append(proc)
+            if self.killed and proc.poll() is None:
+                proc.kill()
+
+    def kill(self):
+        with self._lock:
+            self.killed = True
+            for p in self._procs:
+                if p.poll() is None:
+                    p.kill()
+
+class SpeculativeStage2:
+    """
+    Qwen과 병렬: 임시 레이아웃 → (멀티 포맷이면 캔버스 plan) → Stage 2를 백그라운드 스레드에서 실행.
+    ready: 비교용 레이아웃 준비(또는 실패). cancel()은 실행 중인 하위 프로세스를 종료.
+    """
+
+    def __init__(self, img_path, product, aspect_list, td):
+        self.image = img_path
+        self.layout = os.path.join(td, "layout_spec.json")
+        self.out = os.path.join(td, "stage3_spec.png")
+        self.aspect_list = aspect_list
+        self.td = td
+        self.procs = ProcGroup()
+        self.layout_ok = False
+        self.ok = False
+        self.nano_s = 0.0
+        self.ready = threading.Event()
+        self.thread = threading.Thread(target=self._run, args=(product,), daemon=True)
+        self.thread.start()
+
+    @property
+    def cancelled(self):
+        return self.procs.killed
+
+    def _step(self, argv, cwd, prefix):
+        if self.cancelled:
+            return False
+        rc, out, err = run_argv(argv, cwd=cwd, timeout_s=1800, stream_prefix=prefix, procs=self.procs)
+        if rc != 0 and not self.cancelled:
+            log.warning("%s failed rc=%s. head(stderr)=%s", prefix, rc, (err or out or "")[:2000])
+        return rc == 0 and not self.cancelled
+
+    def _run(self, product):
+        try:
+            ok = self._step([sys.executable, SPEC_SCRIPT, "layout", "--image", self.image,
+                             "--save", self.layout, "--product_name", product or ""], SPEC_DIR, "[SPEC]")
+            if ok and self.aspect_list:
+                canvas_img = os.path.join(self.td, "canvas_spec.png")
+                canvas_json = os.path.join(self.td, "layout_canvas_spec.json")
+                ok = self._step([sys.executable, ASPECT_SCRIPT, "plan", "--image", self.image,
+                                 "--layout_json", self.layout, "--aspects", ",".join(self.aspect_list),
+                                 "--out_image", canvas_img, "--out_layout", canvas_json], ASPECT_DIR, "[SPEC-PLAN]")
+                self.image, self.layout = canvas_img, canvas_json
+            self.layout_ok = ok and os.path.exists(self.layout)
+            self.ready.set()
+            if self.layout_ok:
+                t0 = time.perf_counter()
+                ok = self._step(nano_argv(self.image, self.layout, self.out), NANO_DIR, "[SPEC-STEP2]")
+                self.nano_s = time.perf_counter() - t0
+                self.ok = ok and os.path.exists(self.out) and os.path.getsize(self.out) >= 10
+        finally:
+            self.ready.set()
+
+    def cancel(self):
+        self.procs.kill()
+
+    def resolve(self, final_layout, tol):
+        """
+        Qwen(+plan) 종료 직후 호출. 예약 영역이 tol 안이면 추측 배경 완료를 기다려 경로 반환, 아니면 취소.
+        반환: (stage3 경로 또는 None, 보고 dict)
+        """
+        t0 = time.perf_counter()
+        self.ready.wait()
+        rep = {"tol": tol}
+        if not self.layout_ok:
+            rep.update(hit=False, reason="provisional layout failed")
+        else:
+            try:
+                with open(self.layout, "r", encoding="utf-8") as f:
+                    prov = json.load(f)
+                with open(final_layout, "r", encoding="utf-8") as f:
+                    cmp = speculative.compare(prov, json.load(f), tol=tol)
+            except Exception as e:
+                cmp = {"hit": False, "reason": f"compare failed: {e}"}
+            rep.update(cmp)
+            if not rep["hit"]:
+                rep.setdefault("reason", "reserved areas moved")
+        if rep["hit"]:
+            self.thread.join()
+            if not self.ok:
+                rep.update(hit=False, reason="speculative Step2 failed")
+        else:
+            self.cancel()
+        wait_s = time.perf_counter() - t0
+        rep["wait_s"] = round(wait_s, 2)
+        rep["saved_s"] = round(max(0.0, self.nano_s - wait_s), 2) if rep["hit"] else 0.0
+        hist = speculative.record({k: rep.get(k) for k in ("hit", "min_iou", "saved_s", "reason")})
+        rep["hit_rate"] = speculative.hit_rate(hist)
+        return (self.out if rep["hit"] else None), rep
+
 def _check_vertex_env_or_400():
     if SKIP_VERTEX_ENV_CHECK:
         return
@@ -117,14 +303,40 @@ async def compose(
     headline: str = Form(""),
     logo_path: str = Form(""),
     font_kor: str = Form(r"C:\Windows\Fonts\malgunbd.ttf"),
+
+    # 출력 인코딩 (없으면 COMPOSE_OUTPUT_* 기본값)
+    output_format: Optional[str] = Form(None),
+    output_quality: Optional[int] = Form(None),
+    output_max_kb: Optional[int] = Form(None),
+
+    # 멀티 포맷: "1:1,4:5,9:16" → Qwen / 배경 생성은 1회, 포맷별 크롭 + 레이아웃 재배치 + 렌더
+    aspects: str = Form(""),
+
+    # 추측 실행: Qwen과 배경 생성을 겹침 (없으면 COMPOSE_SPECULATIVE)
+    speculative_bg: Optional[bool] = Form(None),
+
+    # 레이아웃 티어: vlm / visual / auto (없으면 COMPOSE_LAYOUT_MODE)
+    layout_mode: Optional[str] = Form(None),
 ):
     # 0) 입력 유효성
     resolved_file = image or image_file
     if resolved_file is None:
         raise HTTPException(status_code=400, detail="image (or image_file) is required")
 
+    out_format = (output_format or OUTPUT_FORMAT).strip().lower()
+    if out_format == "jpg":
+        out_format = "jpeg"
+    if out_format not in OUTPUT_EXT:
+        raise HTTPException(status_code=400, detail=f"output_format must be one of {sorted(OUTPUT_EXT)}")
+    out_quality = OUTPUT_QUALITY if output_quality is None else output_quality
+    out_max_kb = OUTPUT_MAX_KB if output_max_kb is None else output_max_kb
+    aspect_list = [a.strip().lower() for a in (aspects or "").split(",") if a.strip()]
+    if any(not ASPECT_RE.match(a) for a in aspect_list):
+        raise HTTPException(status_code=400, detail="aspects must look like '1:1,4:5,9:16'")
+
     resolved_headline = (text or caption or headline).strip()
     resolved_product = (product or "").strip()
+    resolved_layout_mode = _resolve_layout_mode(layout_mode)
 
     # 1) Step2 환경 체크
     _check_vertex_env_or_400()
@@ -145,42 +357,91 @@ async def compose(
         img_path    = os.path.join(td, f"input{guessed_ext}")
         layout_json = os.path.join(td, "layout_with_bg.json")
         stage3_path = os.path.join(td, "stage3.png")
-        final_path  = os.path.join(td, "final_ad.png")
+        final_path  = os.path.join(td, "final_ad" + OUTPUT_EXT[out_format])
+        out_report  = os.path.join(td, "final_ad.json")
         copy_json   = os.path.join(td, "copy.json")
+        canvas_img  = os.path.join(td, "canvas_input.png")
+        canvas_json = os.path.join(td, "layout_canvas.json")
+        formats_dir = os.path.join(td, "formats")
+        manifest    = os.path.join(td, "formats.json")
 
         with open(img_path, "wb") as f:
             f.write(raw)
 
-        # 3) Step1 — 레이아웃 생성
-        argv1 = [
-            sys.executable, QWEN_SCRIPT,
-            "--image", img_path,
-            "--bg_prompt",
-            "--save", layout_json,
-            "--product_name", (resolved_product or "")
-        ]
+        # 2-2) 추측 실행: 임시 레이아웃으로 Stage 2를 Qwen과 동시에 시작 (visual 티어는 기다릴 Qwen이 없음)
+        use_spec = SPECULATIVE if speculative_bg is None else speculative_bg
+        use_spec = use_spec and resolved_layout_mode == "vlm"
+        spec = SpeculativeStage2(img_path, resolved_product, aspect_list, td) if use_spec else None
 
-        # ✅ run_argv 반환 순서: (rc, out, err)
-        rc1, out1, err1 = run_argv(argv1, cwd=QWEN_DIR, timeout_s=1800, stream_prefix="[STEP1]")
+        # 3) Step1 — 레이아웃 생성
+        t_layout = time.perf_counter()
+        if resolved_layout_mode == "visual":
+            try:
+                await run_in_threadpool(run_visual_layout, img_path, resolved_product, layout_json)
+                rc1, out1, err1 = 0, "", ""
+            except Exception as e:
+                rc1, out1, err1 = 1, "", repr(e)
+        else:
+            argv1 = [
+                sys.executable, QWEN_SCRIPT,
+                "--image", img_path,
+                "--bg_prompt",
+                "--save", layout_json,
+                "--product_name", (resolved_product or "")
+            ]
+
+            # ✅ run_argv 반환 순서: (rc, out, err)
+            # 스레드풀에서 대기 → Qwen이 도는 동안 다른 요청이 들어와 auto 티어를 판정할 수 있음
+            rc1, out1, err1 = await run_in_threadpool(run_vlm_layout, argv1)
+        layout_ms = round((time.perf_counter() - t_layout) * 1000, 1)
+        log.info("Step1 layout_mode=%s %.1f ms", resolved_layout_mode, layout_ms)
 
         if rc1 != 0:
+            if spec:
+                spec.cancel()
             log.error("Step1 failed rc=%s. head(stderr)=%s", rc1, (err1 or "")[:2000])
             raise HTTPException(status_code=500, detail="Step1 (Qwen) failed. See server logs.")
 
         if not os.path.exists(layout_json) or os.path.getsize(layout_json) < 10:
+            if spec:
+                spec.cancel()
             log.error("Step1 produced no layout json. head(stdout)=%s", (out1 or "")[:2000])
             log.error("Step1 head(stderr)=%s", (err1 or "")[:2000])
             raise HTTPException(status_code=500, detail="Step1 (Qwen) did not generate layout JSON. See server logs.")
 
+        # 3-1) 멀티 포맷: 모든 종횡비를 담는 마스터 캔버스로 입력/레이아웃 변환 → Step2는 캔버스로 1회
+        stage2_image, stage2_layout = img_path, layout_json
+        if aspect_list:
+            argv_p = [
+                sys.executable, ASPECT_SCRIPT, "plan",
+                "--image", img_path,
+                "--layout_json", layout_json,
+                "--aspects", ",".join(aspect_list),
+                "--out_image", canvas_img,
+                "--out_layout", canvas_json,
+            ]
+            rcp, outp, errp = await run_in_threadpool(run_argv, argv_p, cwd=ASPECT_DIR, timeout_s=600, stream_prefix="[PLAN]")
+            if rcp != 0 or not os.path.exists(canvas_json):
+                if spec:
+                    spec.cancel()
+                log.error("Aspect plan failed rc=%s. head(stderr)=%s", rcp, (errp or outp or "")[:2000])
+                raise HTTPException(status_code=500, detail="Aspect plan failed. See server logs.")
+            stage2_image, stage2_layout = canvas_img, canvas_json
+
         # 4) Step2 — 배경 합성  (2) rc + 파일 존재 체크 추가
-        argv2 = [
-            sys.executable, NANO_SCRIPT,
-            "--image", img_path,
-            "--layout_json", layout_json,
-            "--out", stage3_path,
-            "--model", BG_MODEL
-        ]
-        rc2, out2, err2 = run_argv(argv2, cwd=NANO_DIR, timeout_s=1800, stream_prefix="[STEP2]")
+        #    하위 프로세스 / 추측 실행 대기는 모두 스레드풀에서 → 이벤트 루프는 다른 요청을 계속 받음
+        #    추측 실행 hit면 이미 생성된(또는 생성 중인) 배경을 사용, miss면 최종 레이아웃으로 생성
+        spec_rep = None
+        rc2, out2, err2 = 0, "", ""
+        if spec:
+            spec_path, spec_rep = await run_in_threadpool(spec.resolve, stage2_layout, SPEC_IOU)
+            log.info("Speculative Step2 hit=%s min_iou=%s saved=%.1fs rate=%s",
+                     spec_rep["hit"], spec_rep.get("min_iou"), spec_rep["saved_s"], spec_rep["hit_rate"]["rate"])
+            if spec_path:
+                stage3_path = spec_path
+        if not (spec_rep and spec_rep["hit"]):
+            argv2 = nano_argv(stage2_image, stage2_layout, stage3_path)
+            rc2, out2, err2 = await run_in_threadpool(run_argv, argv2, cwd=NANO_DIR, timeout_s=1800, stream_prefix="[STEP2]")
 
         if rc2 != 0:
             log.error("Step2 failed rc=%s. head(stderr)=%s", rc2, (err2 or "")[:2000])
@@ -199,20 +460,44 @@ async def compose(
             json.dump(copy_map, f, ensure_ascii=False, indent=2)
 
         # 6) Step3 — 텍스트/로고 렌더링  (2) rc + 파일 존재 체크 추가
-        argv3 = [
-            sys.executable, TEXT_SCRIPT,
-            "--image", stage3_path,
-            "--layout_json", layout_json,
+        encode_args = [
             "--copy_json", copy_json,
             "--font_kor", font_kor,
-            "--out", final_path,
-            "--skip_layout_underlays"
+            "--out_format", out_format,
+            "--out_quality", str(out_quality),
+            "--out_max_kb", str(max(0, out_max_kb)),
+            "--skip_layout_underlays",
         ]
         if logo_path and logo_path.strip():
-            argv3.insert(len(argv3) - 2, "--logo_path")
-            argv3.insert(len(argv3) - 2, logo_path.strip())
-
-        rc3, out3, err3 = run_argv(argv3, cwd=TEXT_DIR, timeout_s=1800, stream_prefix="[STEP3]")
+            encode_args += ["--logo_path", logo_path.strip()]
+
+        if aspect_list:
+            # 포맷별 크롭 + 레이아웃 재배치 + 렌더를 한 프로세스에서 (폰트 / 스프라이트 캐시 공유)
+            argv3 = [
+                sys.executable, ASPECT_SCRIPT, "export",
+                "--image", stage3_path,
+                "--layout_json", canvas_json,
+                "--aspects", ",".join(aspect_list),
+                "--out_dir", formats_dir,
+                "--manifest", manifest,
+                "--width", str(ASPECT_WIDTH),
+            ] + encode_args
+            rc3, out3, err3 = await run_in_threadpool(run_argv, argv3, cwd=ASPECT_DIR, timeout_s=1800, stream_prefix="[STEP3]")
+            try:
+                with open(manifest, "r", encoding="utf-8") as mf:
+                    formats = json.load(mf).get("formats") or []
+                final_path = formats[0]["path"]
+            except Exception:
+                formats = []
+        else:
+            argv3 = [
+                sys.executable, TEXT_SCRIPT,
+                "--image", stage3_path,
+                "--layout_json", layout_json,
+                "--out", final_path,
+                "--out_report", out_report,
+            ] + encode_args
+            rc3, out3, err3 = await run_in_threadpool(run_argv, argv3, cwd=TEXT_DIR, timeout_s=1800, stream_prefix="[STEP3]")
 
         if rc3 != 0:
             log.error("Step3 failed rc=%s. head(stderr)=%s", rc3, (err3 or "")[:2000])
@@ -221,7 +506,7 @@ async def compose(
         if not os.path.exists(final_path) or os.path.getsize(final_path) < 10:
             log.error("Step3 produced no final image. head(stdout)=%s", (out3 or "")[:2000])
             log.error("Step3 head(stderr)=%s", (err3 or "")[:2000])
-            raise HTTPException(status_code=500, detail="Step3 did not generate final_ad.png. See server logs.")
+            raise HTTPException(status_code=500, detail="Step3 did not generate final image. See server logs.")
 
         # 7) 결과 수집: 이미지 base64 + 레이아웃/카피 JSON + 메타
         try:
@@ -239,27 +524,62 @@ async def compose(
         with open(final_path, "rb") as f:
             b64 = base64.b64encode(f.read()).decode("utf-8")
 
+        try:
+            if aspect_list:
+                output_obj = dict(formats[0]["output"])
+            else:
+                with open(out_report, "r", encoding="utf-8") as rf:
+                    output_obj = json.load(rf)
+            output_obj.pop("path", None)
+        except Exception:
+            output_obj = {"format": out_format, "bytes": os.path.getsize(final_path)}
+
+        # 멀티 포맷: 포맷별 이미지 / 레이아웃 / 인코딩 요약 (image_base64는 첫 포맷)
+        formats_obj = []
+        for fm in formats if aspect_list else []:
+            try:
+                with open(fm["path"], "rb") as f:
+                    fb64 = base64.b64encode(f.read()).decode("utf-8")
+                with open(fm["layout_path"], "r", encoding="utf-8") as lf:
+                    flayout = json.load(lf)
+            except Exception as e:
+                log.error("Aspect %s output unreadable: %s", fm.get("aspect"), e)
+                continue
+            fout = dict(fm.get("output") or {})
+            fout.pop("path", None)
+            formats_obj.append({"aspect": fm.get("aspect"), "image_base64": fb64, "layout": flayout,
+                                "output": fout, "reframe": fm.get("reframe")})
+
         meta = {
             "model": {
                 "bg_model": BG_MODEL,
                 "qwen_script": os.path.basename(QWEN_SCRIPT),
                 "nano_script": os.path.basename(NANO_SCRIPT),
-                "text_script": os.path.basename(TEXT_SCRIPT),
+                "text_script": os.path.basename(ASPECT_SCRIPT if aspect_list else TEXT_SCRIPT),
             },
             "args": {
                 "product": resolved_product,
                 "headline": resolved_headline,
                 "logo_path": logo_path.strip() if logo_path else "",
                 "font_kor": font_kor,
-            }
+            },
+            "output": output_obj,
+            "layout_mode": resolved_layout_mode,
+            "layout_ms": layout_ms,
         }
 
-        return {
+        resp = {
             "image_base64": b64,
             "layout": layout_obj,
             "copy": copy_obj,
             "meta": meta
         }
+        if aspect_list:
+            meta["aspects"] = [f["aspect"] for f in formats_obj]
+            resp["formats"] = formats_obj
+        if spec_rep:
+            meta["speculative"] = spec_rep
+        return resp
 
 # ----------------------------
 # 호환용 간단 엔드포인트 (/generate)
@@ -281,6 +601,13 @@ async def generate(
         headline="",
         logo_path="",
         font_kor=r"C:\Windows\Fonts\malgunbd.ttf",
+        # 직접 호출이라 Form(...) 기본값이 그대로 들어오지 않도록 명시
+        output_format=None,
+        output_quality=None,
+        output_max_kb=None,
+        aspects="",
+        speculative_bg=None,
+        layout_mode=None,
     )
 
 # ----------------------------
@@ -0,0 +1,316 @@
+# -*- coding: utf-8 -*-
+"""
+energy_search.py
+소벨 에너지 맵 위에서 네거티브 스페이스(저에너지 윈도우)를 찾는 탐색 엔진.
+
+- 적분 영상(summed-area table)으로 윈도우 평균을 O(1)에 계산
+- stride 격자의 모든 위치를 한 번의 벡터 연산으로 평가 (무작위 부분샘플링 없음)
+- avoid 박스와의 IoU 패널티도 격자 전체에 대해 벡터화
+- 주제(subject) bbox: 행/열 에너지 합의 누적 분위 (단일/다중 박스)
+- coarse-to-fine: 적분 영상 축소본에서 여러 크기/종횡비를 훑고 상위 셀만 원해상도로 정밀화
+
+qwen_logic.py / qwen25_vl_layout_hybrid.py 에서 공용으로 임포트.
+의존: numpy
+"""
+
+import numpy as np
+
+OVERLAP_PENALTY = 0.8   # avoid 박스 1개당 IoU 가중치 (기존 grid search와 동일)
+INVALID_SCORE = 1e9
+
+# ---------------------------
+# Utils: Geo
+# ---------------------------
+def clip01(v: float) -> float:
+    return max(0.0, min(1.0, float(v)))
+
+def clip_bbox(b):
+    x,y,w,h = map(float, b)
+    x=clip01(x); y=clip01(y); w=clip01(w); h=clip01(h)
+    if x+w>1: w=max(0.0, 1-x)
+    if y+h>1: h=max(0.0, 1-y)
+    return [x,y,w,h]
+
+# ---------------------------
+# Summed-area table
+# ---------------------------
+def integral_image(a):
+    """
+    (H+1)x(W+1) 적분 영상. 0행/0열은 0 → 경계 분기 없이 rect_sums 사용 가능.
+    float64로 누적해 큰 이미지에서도 정밀도 손실 없음.
+    앞쪽 차원은 배치로 취급 (N x H x W → N x (H+1) x (W+1)).
+    """
+    *lead, H, W = a.shape
+    ii = np.zeros((*lead, H+1, W+1), dtype=np.float64)
+    np.cumsum(np.cumsum(a, axis=-2, dtype=np.float64), axis=-1, out=ii[..., 1:, 1:])
+    return ii
+
+def rect_sums(ii, x0, y0, x1, y1):
+    """
+    [y0:y1, x0:x1] 블록 합. 인자는 정수 스칼라 또는 브로드캐스트 가능한 정수 배열.
+    배치 적분 영상이면 앞쪽 차원이 결과 앞에 붙음 (N x R).
+    """
+    return ii[..., y1, x1] - ii[..., y0, x1] - ii[..., y1, x0] + ii[..., y0, x0]
+
+def norm_to_px(v, n):
+    """정규화 좌표 → 픽셀 인덱스 (np.rint 반올림)."""
+    return np.rint(np.asarray(v, dtype=np.float64) * n).astype(np.int64)
+
+def window_means(ii, x, y, w, h):
+    """
+    정규화 윈도우(x,y,w,h; 배열 브로드캐스트)의 평균 에너지.
+    빈 윈도우는 INVALID_SCORE. 시작 좌표는 [0, n-1], 끝 좌표는 [0, n]으로 클립.
+    """
+    H, W = ii.shape[0]-1, ii.shape[1]-1
+    x = np.asarray(x, dtype=np.float64); y = np.asarray(y, dtype=np.float64)
+    x0 = np.clip(norm_to_px(x, W), 0, W-1); x1 = np.clip(norm_to_px(x+w, W), 0, W)
+    y0 = np.clip(norm_to_px(y, H), 0, H-1); y1 = np.clip(norm_to_px(y+h, H), 0, H)
+    cnt = (x1-x0) * (y1-y0)
+    valid = (x1 > x0) & (y1 > y0)
+    s = rect_sums(ii, x0, y0, x1, y1)
+    return np.where(valid, s / np.maximum(cnt, 1), INVALID_SCORE)
+
+# ---------------------------
+# Subject estimation (energy marginals)
+# ---------------------------
+EPS_WEIGHT = 1e-6   # 픽셀당 바닥 가중치 (평탄한 이미지에서도 분위가 정의되도록)
+
+def marginal_quantiles(marginal, q_low, q_high):
+    """
+    1D 가중치(행/열 합)의 누적합에서 q_low/q_high 분위 인덱스.
+    전체 픽셀을 좌표순으로 정렬해 누적한 것과 같은 결과(같은 열의 픽셀은 정렬 후 연속이므로).
+    """
+    cdf = np.cumsum(marginal, dtype=np.float64)
+    cdf /= cdf[-1]
+    lo, hi = np.searchsorted(cdf, [q_low, q_high])
+    n = len(marginal)
+    return min(int(lo), n-1), min(int(hi), n-1)
+
+def _quantile_box(col, row, W, H, q_low, q_high, x_off=0):
+    x_lo, x_hi = marginal_quantiles(col, q_low, q_high)
+    y_lo, y_hi = marginal_quantiles(row, q_low, q_high)
+    x = (x_lo + x_off) / W; y = y_lo / H
+    w_box = max(2/W, (x_hi - x_lo) / W)
+    h_box = max(2/H, (y_hi - y_lo) / H)
+    return clip_bbox([x,y,w_box,h_box])
+
+def subject_bbox_from_energy(energy, q_low=0.15, q_high=0.85):
+    """
+    가중 분위수로 주제 bbox 추정 (에너지의 15~85% 분위 범위).
+    행/열 합(marginal)만 누적하므로 O(HW) 시간, O(H+W) 추가 메모리.
+    """
+    H,W = energy.shape
+    col = energy.sum(axis=0, dtype=np.float64) + EPS_WEIGHT*H
+    row = energy.sum(axis=1, dtype=np.float64) + EPS_WEIGHT*W
+    return _quantile_box(col, row, W, H, q_low, q_high)
+
+def subject_bboxes_from_energy(energy, max_boxes=3, q_low=0.15, q_high=0.85,
+                               gap_rel=0.35, min_mass=0.12, smooth=0.02):
+    """
+    제품이 여러 개인 이미지용: 열 에너지 프로파일의 골짜기(gap)로 구간을 나눠 구간마다 분위 박스.
+    gap_rel: 평활된 열 프로파일 평균 대비 이 비율 미만이면 빈 열로 간주
+    min_mass: 전체 에너지 대비 이 비율 미만인 구간은 버림
+    반환: 에너지 질량 내림차순 bbox 리스트. 분리되지 않으면 [subject_bbox_from_energy(...)].
+    """
+    H,W = energy.shape
+    col = energy.sum(axis=0, dtype=np.float64)
+    total = col.sum()
+    if total <= 0:
+        return [subject_bbox_from_energy(energy, q_low, q_high)]
+    # 이동 평균(누적합)으로 열 프로파일 평활
+    r = max(1, int(round(smooth*W)))
+    c = np.concatenate(([0.0], np.cumsum(col)))
+    lo = np.clip(np.arange(W)-r, 0, W); hi = np.clip(np.arange(W)+r+1, 0, W)
+    prof = (c[hi] - c[lo]) / (hi - lo)
+    active = prof >= gap_rel * prof.mean()
+    # active 구간 [a,b) 추출
+    edges = np.flatnonzero(np.diff(np.concatenate(([0], active.astype(np.int8), [0]))))
+    runs = [(int(a), int(b)) for a,b in zip(edges[0::2], edges[1::2])]
+    runs = [(a,b,float(col[a:b].sum())/total) for a,b in runs]
+    runs = [ru for ru in runs if ru[2] >= min_mass]
+    if len(runs) <= 1:
+        return [subject_bbox_from_energy(energy, q_low, q_high)]
+    runs.sort(key=lambda ru: ru[2], reverse=True)
+    boxes = []
+    for a,b,_ in runs[:max_boxes]:
+        sub_col = col[a:b] + EPS_WEIGHT*H
+        sub_row = energy[:, a:b].sum(axis=1, dtype=np.float64) + EPS_WEIGHT*(b-a)
+        boxes.append(_quantile_box(sub_col, sub_row, W, H, q_low, q_high, x_off=a))
+    return boxes
+
+# ---------------------------
+# Vectorized IoU
+# ---------------------------
+def iou_xywh_grid(x, y, w, h, b):
+    """윈도우 배열(x,y 브로드캐스트, 고정 w,h)과 박스 b 하나의 IoU. iou_xywh의 벡터판."""
+    x2,y2,w2,h2 = map(float, b)
+    ix = np.clip(np.minimum(x+w, x2+w2) - np.maximum(x, x2), 0.0, None)
+    iy = np.clip(np.minimum(y+h, y2+h2) - np.maximum(y, y2), 0.0, None)
+    inter = ix * iy
+    u = max(0.0, w*h) + max(0.0, w2*h2) - inter
+    return np.where(u > 0, inter / np.where(u > 0, u, 1.0), 0.0)
+
+# ---------------------------
+# Grid search
+# ---------------------------
+def score_grid(energy, win_w, win_h, margin, avoid=(), stride=0.01, ii=None):
+    """
+    stride 격자 전체의 점수(평균 에너지 + 겹침 패널티)를 계산.
+    반환: xs(len Nx), ys(len Ny), scores(Ny x Nx). 격자가 비면 scores=None.
+    ii: 미리 계산된 integral_image(energy) (여러 번 탐색할 때 재사용)
+    """
+    xs = np.arange(margin, 1.0 - margin - win_w + 1e-6, stride)
+    ys = np.arange(margin, 1.0 - margin - win_h + 1e-6, stride)
+    if len(xs)==0 or len(ys)==0:
+        return xs, ys, None
+    if ii is None:
+        ii = integral_image(energy)
+    return xs, ys, score_windows(ii, xs[None, :], ys[:, None], win_w, win_h, avoid)
+
+def score_windows(ii, X, Y, win_w, win_h, avoid=()):
+    """윈도우 좌표 배열(X,Y 브로드캐스트)의 점수 = 평균 에너지 + avoid IoU 패널티."""
+    scores = window_means(ii, X, Y, win_w, win_h)
+    for a in avoid:
+        if a is None: continue
+        scores = scores + OVERLAP_PENALTY * iou_xywh_grid(X, Y, win_w, win_h, a)
+    return scores
+
+def grid_search_topk(energy, win_w, win_h, margin, avoid=(), stride=0.01, k=5, ii=None):
+    """점수 오름차순 상위 k개 [(score, bbox), ...]. 격자가 비면 []."""
+    xs, ys, scores = score_grid(energy, win_w, win_h, margin, avoid=avoid, stride=stride, ii=ii)
+    if scores is None:
+        return []
+    flat = scores.ravel()
+    k = max(1, min(int(k), flat.size))
+    idx = np.argpartition(flat, k-1)[:k]
+    idx = idx[np.lexsort((idx, flat[idx]))]   # 점수 → 행우선 순서로 안정 정렬
+    out = []
+    for i in idx:
+        r, c = divmod(int(i), len(xs))
+        out.append((float(flat[i]), clip_bbox([xs[c], ys[r], win_w, win_h])))
+    return out
+
+def grid_search_low_energy(energy, win_w, win_h, margin, avoid=[], stride=0.01, seed=None, ii=None):
+    """
+    에너지 평균 + overlap penalty가 최소인 위치 탐색 (격자 전수 탐색)
+    avoid: [bbox, ...] (xywh, norm)
+    seed: 과거 무작위 부분샘플링용 인자. 전수 탐색이라 결과에 영향 없음(호환용).
+    """
+    best = grid_search_topk(energy, win_w, win_h, margin, avoid=avoid, stride=stride, k=1, ii=ii)
+    if not best:
+        return [margin, margin, win_w, win_h]
+    return best[0][1]
+
+# ---------------------------
+# Coarse-to-fine multi-scale search
+# ---------------------------
+COARSE_FACTOR = 4       # 피라미드 축소 배율 (f x f 블록 평균)
+COARSE_STRIDE = 0.04
+FINE_STRIDE = 0.01
+REFINE_K = 6            # 크기별로 정밀 탐색할 coarse 상위 셀 수
+SIZE_PRIOR = 0.05       # 기준 크기/종횡비에서 벗어날수록 더하는 비용 (log 배율당)
+
+def coarse_integral(ii, f=COARSE_FACTOR):
+    """
+    적분 영상을 f 간격으로 뽑으면 f x f 블록 합 영상의 적분 영상이 됨 → /f² 로 블록 평균.
+    에너지 맵을 다시 축소/누적할 필요 없이 O((H/f)(W/f)).
+    """
+    return ii[::f, ::f] / float(f*f)
+
+def window_sizes(base_w, base_h, max_w=1.0, max_h=1.0,
+                 area_scales=(0.85, 1.0, 1.15), ar_scales=(0.8, 1.0, 1.25),
+                 ar_range=(0.0, float("inf"))):
+    """
+    기준 (w,h) 주변의 크기/종횡비 변형 [(w, h, prior), ...].
+    prior: 기준에서 벗어난 정도에 비례하는 비용(점수에 더해짐). ar_range 밖 변형은 제외(기준은 항상 포함).
+    """
+    out = []
+    for sa in area_scales:
+        for sr in ar_scales:
+            w = min(base_w*np.sqrt(sa*sr), max_w)
+            h = min(base_h*np.sqrt(sa/sr), max_h)
+            if w <= 0 or h <= 0: continue
+            base = (sa == 1.0 and sr == 1.0)
+            if not base and not (ar_range[0] <= w/h <= ar_range[1]): continue
+            prior = SIZE_PRIOR * (abs(np.log(sa)) + abs(np.log(sr)))
+            out.append((float(w), float(h), float(prior)))
+    return out
+
+def _intersects(b, boxes):
+    x,y,w,h = b
+    for x2,y2,w2,h2 in boxes:
+        if min(x+w, x2+w2) > max(x, x2) and min(y+h, y2+h2) > max(y, y2):
+            return True
+    return False
+
+def _refine(ii, seeds, w, h, margin, avoid, radius, stride):
+    """
+    coarse 셀들 주변 ±radius를 stride 격자로 원해상도 정밀 평가 (셀 K개를 한 번에 브로드캐스트).
+    seeds: [(x0,y0), ...] → [(score, x, y), ...] (셀별 최솟값)
+    """
+    hi_x = 1.0 - margin - w; hi_y = 1.0 - margin - h
+    if hi_x < margin - 1e-6 or hi_y < margin - 1e-6 or not seeds:
+        return []
+    off = np.arange(-radius, radius + 1e-6, stride)
+    S = np.asarray(seeds, dtype=np.float64)
+    X = np.clip(S[:, 0, None, None] + off[None, None, :], margin, max(margin, hi_x))   # K x 1 x R
+    Y = np.clip(S[:, 1, None, None] + off[None, :, None], margin, max(margin, hi_y))   # K x R x 1
+    sc = score_windows(ii, X, Y, w, h, avoid).reshape(len(S), -1)
+    best = np.argmin(sc, axis=1)
+    R = len(off)
+    return [(float(sc[k, b]), float(X[k, 0, b % R]), float(Y[k, b // R, 0]))
+            for k, b in enumerate(best)]
+
+def multiscale_search(energy, sizes, margin, avoid=(), exclude=(), top_n=5,
+                      coarse_factor=COARSE_FACTOR, coarse_stride=COARSE_STRIDE,
+                      fine_stride=FINE_STRIDE, refine_k=REFINE_K, ii=None):
+    """
+    피라미드 탐색: 축소 에너지에서 모든 크기/종횡비를 coarse 격자로 채점 →
+    크기별 상위 refine_k 셀 주변만 원해상도 fine 격자로 정밀화.
+    sizes: [(w,h) 또는 (w,h,prior), ...]
+    avoid: IoU 패널티 대상 박스 / exclude: 겹치면 안 되는 박스(이미 배치된 요소 등)
+    반환: 점수 오름차순 [(score, bbox), ...], 서로 겹치지 않는 최대 top_n개.
+    """
+    if ii is None:
+        ii = integral_image(energy)
+    f = max(1, int(coarse_factor))
+    ii_c = coarse_integral(ii, f) if f > 1 else ii
+    avoid = [a for a in avoid if a is not None]
+    exclude = [e for e in exclude if e is not None]
+    cands = []
+    for sz in sizes:
+        w, h = float(sz[0]), float(sz[1])
+        prior = float(sz[2]) if len(sz) > 2 else 0.0
+        seeds = grid_search_topk(None, w, h, margin, avoid=avoid, stride=coarse_stride, k=refine_k, ii=ii_c)
+        for sc, x, y in _refine(ii, [b[:2] for _, b in seeds], w, h, margin, avoid, coarse_stride, fine_stride):
+            cands.append((sc + prior, clip_bbox([x, y, w, h])))
+    cands.sort(key=lambda t: t[0])
+    out = []
+    for sc, b in cands:
+        if _intersects(b, exclude) or _intersects(b, [k for _, k in out]):
+            continue
+        out.append((sc, b))
+        if len(out) >= top_n: break
+    return out
+
+def place_elements(energy, elements, margin, avoid=(), ii=None, **search_kw):
+    """
+    여러 요소(headline, logo, 추가 요소...)를 순서대로 배치.
+    elements: [{"name": str, "sizes": [(w,h[,prior]), ...]}, ...] — 앞쪽 요소가 우선.
+    이미 배치된 요소는 다음 요소의 avoid(패널티)이자 exclude(겹침 금지).
+    반환: [{"name", "bbox", "score"}, ...] (배치 불가 요소는 bbox=None)
+    """
+    if ii is None:
+        ii = integral_image(energy)
+    placed = []
+    out = []
+    for el in elements:
+        ranked = multiscale_search(energy, el["sizes"], margin, avoid=list(avoid)+placed,
+                                   exclude=placed, top_n=1, ii=ii, **search_kw)
+        if ranked:
+            sc, b = ranked[0]
+            placed.append(b)
+            out.append({"name": el.get("name"), "bbox": b, "score": sc})
+        else:
+            out.append({"name": el.get("name"), "bbox": None, "score": None})
+    return out
@@ -0,0 +1,298 @@
+# -*- coding: utf-8 -*-
+"""
+font_subset.py
+광고 렌더링(ad_text_render)용 폰트 서브셋 빌드 / 선택 / 벤치마크.
+
+- build: 폰트 디렉터리의 TTF/OTF마다 한글 음절 + 자모 + 라틴 + 숫자 + 문장부호만 남긴
+  <이름>.subset.<확장자> 를 원본 옆에 만들고, 커버리지(코드포인트 구간)를 subsets.json 에 기록
+  - 한글 음절: ksx1001(완성형 2,350자, 기본) 또는 all(11,172자 전체)
+  - 힌팅 / GSUB·GPOS 기능은 그대로 유지 → 커버되는 문자열은 원본과 픽셀 단위로 동일하게 렌더
+- 런타임(select_font): 문자열의 모든 글자가 서브셋 커버리지 안이면 서브셋, 아니면 원본(필요할 때만 로드)
+  원본 크기가 기록과 다르면(폰트 교체) 서브셋은 무시
+- bench: 폰트마다 새 프로세스에서 원본/서브셋 로드 시간과 RSS 증가량 비교
+
+빌드 의존: fontTools (런타임 선택은 표준 라이브러리만 사용)
+
+USAGE
+  python font_subset.py build [--font_dir fonts] [--hangul ksx1001|all]
+  python font_subset.py bench [--font_dir fonts] [--report bench.json]
+"""
+
+import os
+import sys
+import json
+import time
+import bisect
+import argparse
+import threading
+import subprocess
+
+FONT_DIR = os.getenv("AD_FONT_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "fonts"))
+FONT_EXTS = (".ttf", ".otf")
+SUBSET_TAG = ".subset"
+MANIFEST = "subsets.json"
+
+# (시작, 끝) 포함 구간
+BASE_RANGES = [
+    (0x0020, 0x007E),   # Basic Latin (라틴 / 숫자 / ASCII 문장부호)
+    (0x00A0, 0x00FF),   # Latin-1 (·, ©, ® 등)
+    (0x1100, 0x11FF),   # 한글 자모
+    (0x2000, 0x206F),   # 일반 문장부호 (—, ‘’, “”, …)
+    (0x20A9, 0x20A9),   # ₩
+    (0x2190, 0x2199),   # 화살표
+    (0x3000, 0x303F),   # CJK 기호 / 문장부호 (「」, 『』, 〈〉)
+    (0x3130, 0x318F),   # 한글 호환 자모 (ㅋㅋ, ㅠㅠ)
+    (0xFF01, 0xFF5E),   # 전각 ASCII
+]
+HANGUL_SYLLABLES = (0xAC00, 0xD7A3)
+HANGUL_SETS = ("ksx1001", "all")
+
+def ksx1001_syllables():
+    """KS X 1001 완성형 한글 2,350자 (EUC-KR 0xB0A1–0xC8FE)."""
+    return [ord(bytes((hi, lo)).decode("euc-kr")) for hi in range(0xB0, 0xC9) for lo in range(0xA1, 0xFF)]
+
+def codepoints(hangul="ksx1001"):
+    if hangul not in HANGUL_SETS:
+        raise ValueError(f"unknown hangul set: {hangul}")
+    cps = {c for a, b in BASE_RANGES for c in range(a, b + 1)}
+    if hangul == "all":
+        cps.update(range(HANGUL_SYLLABLES[0], HANGUL_SYLLABLES[1] + 1))
+    else:
+        cps.update(ksx1001_syllables())
+    return sorted(cps)
+
+def to_ranges(cps):
+    """정렬된 코드포인트 → [[시작, 끝], ...] (JSON 기록용)."""
+    out = []
+    for c in cps:
+        if out and out[-1][1] == c - 1:
+            out[-1][1] = c
+        else:
+            out.append([c, c])
+    return out
+
+def subset_path(path):
+    root, ext = os.path.splitext(path)
+    return root + SUBSET_TAG + ext
+
+def is_subset(path):
+    return os.path.splitext(os.path.splitext(path)[0])[1] == SUBSET_TAG
+
+# -----------------------------
+# Runtime selection
+# -----------------------------
+
+class Coverage:
+    """서브셋 코드포인트 구간 (bisect)."""
+
+    def __init__(self, ranges):
+        self.starts = [a for a, _ in ranges]
+        self.ends = [b for _, b in ranges]
+
+    def __contains__(self, cp):
+        i = bisect.bisect_right(self.starts, cp) - 1
+        return i >= 0 and cp <= self.ends[i]
+
+    def covers(self, text):
+        # 제어 문자(줄바꿈 등)는 글리프로 그리지 않으므로 제외
+        return all(ord(c) < 0x20 or ord(c) in self for c in set(text or ""))
+
+_index = {}       # font dir → (manifest mtime, {원본 이름: (서브셋 abspath, 원본 bytes, Coverage)})
+_index_lock = threading.Lock()
+
+def load_index(font_dir):
+    """font_dir/subsets.json → {원본 파일명: (서브셋 경로, 원본 크기, Coverage)} (mtime 기준 캐시)."""
+    mpath = os.path.join(font_dir, MANIFEST)
+    try:
+        mtime = os.stat(mpath).st_mtime_ns
+    except OSError:
+        return {}
+    with _index_lock:
+        hit = _index.get(font_dir)
+    if hit and hit[0] == mtime:
+        return hit[1]
+    try:
+        with open(mpath, "r", encoding="utf-8") as f:
+            man = json.load(f)
+    except (OSError, ValueError):
+        man = {}
+    idx = {}
+    for src, ent in (man.get("fonts") or {}).items():
+        sp = os.path.join(font_dir, ent["subset"])
+        if os.path.exists(sp):
+            idx[src] = (sp, int(ent["source_bytes"]), Coverage(ent["ranges"]))
+    with _index_lock:
+        _index[font_dir] = (mtime, idx)
+    return idx
+
+def select_font(path, text=""):
+    """(폰트 경로, 문자열) → 실제로 열 경로. 커버되는 서브셋이 있으면 서브셋, 없으면 path 그대로."""
+    if not path or is_subset(path):
+        return path
+    ap = os.path.abspath(path)
+    ent = load_index(os.path.dirname(ap)).get(os.path.basename(ap))
+    if ent is None:
+        return path
+    sp, src_bytes, cov = ent
+    try:
+        if os.path.getsize(ap) != src_bytes:
+            return path   # 원본이 바뀜 → 서브셋 재빌드 전까지 무시
+    except OSError:
+        return path
+    return sp if cov.covers(text) else path
+
+# -----------------------------
+# Build (fontTools)
+# -----------------------------
+
+def build_subset(src, dst, cps):
+    """src 폰트를 cps로 서브셋해 dst에 저장. 힌팅 / 레이아웃 기능 / name 테이블 유지. 반환: 바이트 수."""
+    from fontTools import subset
+    from fontTools.ttLib import TTFont
+
+    o = subset.Options()
+    o.layout_features = ["*"]
+    o.name_IDs = ["*"]
+    o.name_languages = ["*"]
+    o.notdef_outline = True
+    o.hinting = True
+    o.glyph_names = False
+    font = TTFont(src)
+    s = subset.Subsetter(o)
+    s.populate(unicodes=cps)
+    s.subset(font)
+    font.save(dst)
+    font.close()
+    return os.path.getsize(dst)
+
+def font_files(font_dir):
+    return [os.path.join(font_dir, n) for n in sorted(os.listdir(font_dir))
+            if n.lower().endswith(FONT_EXTS) and not is_subset(n)]
+
+def cmd_build(args):
+    cps = codepoints(args.hangul)
+    ranges = to_ranges(cps)
+    mpath = os.path.join(args.font_dir, MANIFEST)
+    man = {"hangul": args.hangul, "fonts": {}}
+    t_all = time.perf_counter()
+    for src in font_files(args.font_dir):
+        t0 = time.perf_counter()
+        dst = subset_path(src)
+        try:
+            n = build_subset(src, dst, cps)
+        except Exception as e:
+            print(f"[subset] skip {os.path.basename(src)}: {e}", file=sys.stderr)
+            continue
+        src_n = os.path.getsize(src)
+        man["fonts"][os.path.basename(src)] = {
+            "subset": os.path.basename(dst), "source_bytes": src_n, "bytes": n, "ranges": ranges,
+        }
+        print(f"[subset] {os.path.basename(src)}: {src_n // 1024} KB -> {n // 1024} KB "
+              f"({n / src_n:.0%}) in {time.perf_counter() - t0:.1f} s")
+    with open(mpath, "w", encoding="utf-8") as f:
+        json.dump(man, f, ensure_ascii=False)
+    print(f"[subset] {len(man['fonts'])} font(s), {args.hangul}, {time.perf_counter() - t_all:.1f} s -> {mpath}")
+
+# -----------------------------
+# Benchmark
+# -----------------------------
+
+PROBE_TEXT = "신제품 출시! 지금 구매하면 30% 할인 — Fresh & Clean 100ml"
+PROBE_SIZES = (18, 48, 96)
+
+def _rss_kb():
+    try:
+        with open("/proc/self/status", "r") as f:
+            for ln in f:
+                if ln.startswith("VmRSS:"):
+                    return int(ln.split()[1])
+    except OSError:
+        pass
+    import resource
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss   # Linux 외: 최대 RSS로 근사
+
+def cmd_probe(args):
+    """(bench 자식 프로세스) 레지스트리와 같은 방식으로 폰트 로드 + 샘플 렌더 → 시간 / RSS 증가량 JSON."""
+    import io
+    from PIL import Image, ImageDraw, ImageFont
+
+    canvas = Image.new("L", (16, 16))
+    ImageDraw.Draw(canvas).text((0, 0), "a", fill=255)    # Pillow / FreeType 초기화는 측정에서 제외
+    rss0 = _rss_kb()
+    t0 = time.perf_counter()
+    with open(args.path, "rb") as f:
+        data = f.read()
+    fonts = [ImageFont.truetype(io.BytesIO(data), s) for s in PROBE_SIZES]
+    load_ms = (time.perf_counter() - t0) * 1000
+    for ft in fonts:
+        ft.getmask(PROBE_TEXT, "L")
+    total_ms = (time.perf_counter() - t0) * 1000
+    print(json.dumps({"load_ms": round(load_ms, 2), "first_render_ms": round(total_ms, 2),
+                      "rss_kb": _rss_kb() - rss0}))
+
+def _probe(path, repeat):
+    runs = []
+    for _ in range(repeat):
+        out = subprocess.run([sys.executable, os.path.abspath(__file__), "_probe", "--path", path],
+                             capture_output=True, text=True, check=True).stdout
+        runs.append(json.loads(out))
+    # 프로세스 기동 편차 → 중앙값
+    return {k: sorted(r[k] for r in runs)[len(runs) // 2] for k in runs[0]}
+
+def cmd_bench(args):
+    rows = []
+    for src in font_files(args.font_dir):
+        sp = select_font(src)
+        if sp == src:
+            print(f"[bench] {os.path.basename(src)}: no subset (run build first)", file=sys.stderr)
+            continue
+        full, sub = _probe(src, args.repeat), _probe(sp, args.repeat)
+        rows.append({"font": os.path.basename(src),
+                     "bytes": os.path.getsize(src), "subset_bytes": os.path.getsize(sp),
+                     "full": full, "subset": sub})
+    if not rows:
+        return
+    hdr = f"{'font':32} {'KB':>6} {'sub KB':>6} {'load ms':>8} {'sub':>6} {'1st ms':>7} {'sub':>6} {'RSS KB':>7} {'sub':>6}"
+    print(hdr)
+    print("-" * len(hdr))
+    tot = {"bytes": 0, "subset_bytes": 0, "load": 0.0, "sub_load": 0.0, "rss": 0, "sub_rss": 0}
+    for r in rows:
+        f, s = r["full"], r["subset"]
+        print(f"{r['font'][:32]:32} {r['bytes'] // 1024:6d} {r['subset_bytes'] // 1024:6d} "
+              f"{f['load_ms']:8.2f} {s['load_ms']:6.2f} {f['first_render_ms']:7.2f} {s['first_render_ms']:6.2f} "
+              f"{f['rss_kb']:7d} {s['rss_kb']:6d}")
+        tot["bytes"] += r["bytes"]; tot["subset_bytes"] += r["subset_bytes"]
+        tot["load"] += f["load_ms"]; tot["sub_load"] += s["load_ms"]
+        tot["rss"] += f["rss_kb"]; tot["sub_rss"] += s["rss_kb"]
+    print("-" * len(hdr))
+    print(f"{'total':32} {tot['bytes'] // 1024:6d} {tot['subset_bytes'] // 1024:6d} "
+          f"{tot['load']:8.2f} {tot['sub_load']:6.2f} {'':7} {'':6} {tot['rss']:7d} {tot['sub_rss']:6d}")
+    if args.report:
+        with open(args.report, "w", encoding="utf-8") as f:
+            json.dump({"repeat": args.repeat, "fonts": rows}, f, ensure_ascii=False, indent=2)
+
+def main():
+    ap = argparse.ArgumentParser(description="렌더링 폰트 서브셋 빌드 / 벤치마크")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+
+    b = sub.add_parser("build", help="폰트별 서브셋 + subsets.json 생성 (fontTools 필요)")
+    b.add_argument("--font_dir", default=FONT_DIR)
+    b.add_argument("--hangul", choices=HANGUL_SETS, default="ksx1001",
+                   help="한글 음절 범위 (ksx1001: 완성형 2,350자, 그 외 글자는 원본 폰트로 폴백)")
+    b.set_defaults(func=cmd_build)
+
+    m = sub.add_parser("bench", help="원본 vs 서브셋 로드 시간 / RSS (폰트마다 새 프로세스)")
+    m.add_argument("--font_dir", default=FONT_DIR)
+    m.add_argument("--repeat", type=int, default=5, help="측정 반복 (중앙값)")
+    m.add_argument("--report", default=None, help="결과 JSON 경로")
+    m.set_defaults(func=cmd_bench)
+
+    p = sub.add_parser("_probe")
+    p.add_argument("--path", required=True)
+    p.set_defaults(func=cmd_probe)
+
+    args = ap.parse_args()
+    args.func(args)
+
+if __name__ == "__main__":
+    main()
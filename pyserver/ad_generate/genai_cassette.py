@@ -0,0 +1,190 @@
+# -*- coding: utf-8 -*-
+"""
+genai_cassette.py
+Stage 2(nano_banana_generate) 이미지 생성 백엔드 교체용. 네트워크 없이 벤치마크 / 회귀 테스트.
+
+- live:      실제 genai 호출 (generate_one)
+- record:    live 호출 + 카세트에 (요청 해시 → 응답 PNG, 지연) 저장
+- replay:    카세트에서 응답을 돌려줌. 같은 요청의 응답이 여러 장이면 순서대로 돌려 씀.
+             latency="recorded"면 해당 응답의 기록 지연, "sample"이면 기록된 지연 분포에서 무작위로 대기
+- synthetic: 절차적 배경(저해상 색 격자 보간 + 디테일 노이즈)을 지정 지연(로그정규) 후 반환
+
+요청 해시 = sha256(model, prompt, 업로드 바이트(또는 입력 이미지 크기/모드/픽셀)). cfg는 해시에 넣지 않음(후보 수 1 고정).
+카세트 디렉터리: index.json {"version", "entries": {hash: [{"file", "latency", "model"}]}} + PNG 파일들.
+의존: numpy, Pillow
+"""
+
+import os
+import json
+import time
+import random
+import hashlib
+import threading
+
+import numpy as np
+from PIL import Image
+
+BACKENDS = ("live", "record", "replay", "synthetic")
+INDEX_NAME = "index.json"
+
+def request_key(model, prompt_text, image):
+    """image: upload_policy.UploadPayload(인코딩 바이트) 또는 PIL 이미지."""
+    h = hashlib.sha256()
+    h.update(str(model).encode("utf-8")); h.update(b"\0")
+    h.update(str(prompt_text).encode("utf-8")); h.update(b"\0")
+    data = getattr(image, "data", None)
+    if data is not None:
+        h.update(image.mime_type.encode("ascii")); h.update(data)
+    else:
+        h.update(f"{image.mode}:{image.width}x{image.height}".encode("ascii"))
+        h.update(image.tobytes())
+    return h.hexdigest()
+
+class CassetteMiss(KeyError):
+    pass
+
+# ---------------------------
+# Backends
+# ---------------------------
+class LiveBackend:
+    """generate_fn(model, prompt_text, image, cfg) -> PIL.Image | None 를 그대로 호출."""
+
+    def __init__(self, generate_fn):
+        self.generate_fn = generate_fn
+
+    def generate(self, model, prompt_text, image, cfg):
+        return self.generate_fn(model, prompt_text, image, cfg)
+
+class Cassette:
+    """index.json + PNG 디렉터리. 스레드 안전 (프로세스 간 동시 기록은 지원하지 않음)."""
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self.entries = {}
+        idx = os.path.join(path, INDEX_NAME)
+        if os.path.exists(idx):
+            with open(idx, "r", encoding="utf-8") as f:
+                self.entries = json.load(f).get("entries", {})
+
+    def add(self, key, img, latency, model):
+        os.makedirs(self.path, exist_ok=True)
+        with self._lock:
+            lst = self.entries.setdefault(key, [])
+            fname = f"{key[:16]}_{len(lst):03d}.png"
+            img.save(os.path.join(self.path, fname))
+            lst.append({"file": fname, "latency": round(float(latency), 3), "model": model})
+            tmp = os.path.join(self.path, INDEX_NAME + ".tmp")
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump({"version": 1, "entries": self.entries}, f, ensure_ascii=False, indent=1)
+            os.replace(tmp, os.path.join(self.path, INDEX_NAME))
+
+    def load(self, entry):
+        return Image.open(os.path.join(self.path, entry["file"])).convert("RGB")
+
+    def latencies(self):
+        return [e["latency"] for lst in self.entries.values() for e in lst]
+
+class RecordBackend:
+    def __init__(self, live, cassette):
+        self.live = live
+        self.cassette = cassette
+
+    def generate(self, model, prompt_text, image, cfg):
+        t0 = time.monotonic()
+        img = self.live.generate(model, prompt_text, image, cfg)
+        if img is not None:
+            self.cassette.add(request_key(model, prompt_text, image), img, time.monotonic() - t0, model)
+        return img
+
+class ReplayBackend:
+    """
+    on_miss: "error" → CassetteMiss / "any" → 카세트 전체 응답을 순서대로 사용 (프롬프트가 바뀐 벤치마크용)
+    latency: "none" | "recorded" | "sample", latency_scale로 배속 조절
+    """
+
+    def __init__(self, cassette, on_miss="error", latency="recorded", latency_scale=1.0, seed=0):
+        if not cassette.entries:
+            raise CassetteMiss(f"empty cassette: {cassette.path}")
+        self.cassette = cassette
+        self.on_miss = on_miss
+        self.latency = latency
+        self.latency_scale = float(latency_scale)
+        self._all = [e for lst in cassette.entries.values() for e in lst]
+        self._lat = cassette.latencies()
+        self._next = {}
+        self._lock = threading.Lock()
+        self._rng = random.Random(seed)
+
+    def _pick(self, key):
+        lst = self.cassette.entries.get(key)
+        if not lst:
+            if self.on_miss != "any":
+                raise CassetteMiss(f"no recorded response for request {key[:16]}")
+            key, lst = "*", self._all
+        with self._lock:
+            k = self._next.get(key, 0)
+            self._next[key] = k + 1
+            wait = self._rng.choice(self._lat) if self.latency == "sample" else None
+        entry = lst[k % len(lst)]
+        if self.latency == "recorded":
+            wait = entry["latency"]
+        return entry, (wait or 0.0) * self.latency_scale
+
+    def generate(self, model, prompt_text, image, cfg):
+        entry, wait = self._pick(request_key(model, prompt_text, image))
+        if wait > 0: time.sleep(wait)
+        return self.cassette.load(entry)
+
+class SyntheticBackend:
+    """
+    delay: 지연 중앙값(초), jitter: 로그정규 sigma (0 → 고정 지연)
+    detail: 고주파 노이즈 세기(0..1) — 높을수록 reserved 영역 busy_score가 커짐
+    """
+
+    def __init__(self, delay=2.0, jitter=0.3, detail=0.02, grid=4, seed=0):
+        self.delay = float(delay)
+        self.jitter = float(jitter)
+        self.detail = float(detail)
+        self.grid = max(2, int(grid))
+        self._seed = int(seed)
+        self._count = 0
+        self._lock = threading.Lock()
+
+    def render(self, size, rng):
+        w, h = size
+        base = rng.integers(40, 230, size=(self.grid, self.grid, 3), dtype=np.uint8)
+        bg = np.asarray(Image.fromarray(base, "RGB").resize((w, h), Image.BICUBIC), dtype=np.float32)
+        if self.detail > 0:
+            bg += rng.normal(0.0, 255.0 * self.detail, size=(h, w, 1)).astype(np.float32)
+        return Image.fromarray(np.clip(bg, 0, 255).astype(np.uint8), "RGB")
+
+    def generate(self, model, prompt_text, image, cfg):
+        with self._lock:
+            k = self._count; self._count += 1
+        rng = np.random.default_rng([self._seed, k])
+        wait = self.delay * float(np.exp(rng.normal(0.0, self.jitter))) if self.jitter > 0 else self.delay
+        if wait > 0: time.sleep(wait)
+        return self.render(image.size, rng)
+
+# ---------------------------
+# Factory
+# ---------------------------
+def make_backend(mode, live_factory=None, cassette=None, on_miss="error", replay_latency="recorded",
+                 latency_scale=1.0, synthetic_delay=2.0, synthetic_jitter=0.3, synthetic_detail=0.02, seed=0):
+    """
+    live_factory: () -> generate_fn. live / record 모드에서만 호출 (replay / synthetic은 인증·네트워크 불필요).
+    """
+    if mode not in BACKENDS:
+        raise ValueError(f"unknown backend: {mode}")
+    if mode == "synthetic":
+        return SyntheticBackend(delay=synthetic_delay, jitter=synthetic_jitter, detail=synthetic_detail, seed=seed)
+    if mode in ("record", "replay") and not cassette:
+        raise ValueError(f"--cassette is required for backend '{mode}'")
+    if mode == "replay":
+        return ReplayBackend(Cassette(cassette), on_miss=on_miss, latency=replay_latency,
+                             latency_scale=latency_scale, seed=seed)
+    live = LiveBackend(live_factory())
+    if mode == "record":
+        return RecordBackend(live, Cassette(cassette))
+    return live
@@ -0,0 +1,217 @@
+# -*- coding: utf-8 -*-
+"""
+genai_pool.py
+Gemini(genai) 호출 공용 계층: 프로세스당 클라이언트 1개 + 호스트 공유 레이트 리미터 + 재시도 스케줄.
+
+- get_client(): API Key / Vertex 설정으로 genai.Client를 한 번만 만들고 스레드 간 공유 (커넥션 재사용)
+- RateLimiter: 분당 요청 수 / 분당 이미지 수 토큰 버킷.
+  상태를 임시 디렉터리의 JSON 파일(flock)로 두어 같은 호스트의 모든 stage-2 프로세스
+  (동시에 들어온 /compose 요청들)가 한도를 함께 씀. 429를 받으면 전 프로세스가 같이 쉼.
+- call_with_retry(): 재시도 가능한 오류(429/5xx/timeout)에 지수 백오프 + full jitter,
+  Retry-After / RetryInfo가 있으면 그 값을 우선.
+
+환경변수: GENAI_RPM, GENAI_IPM (0이면 해당 버킷 비활성), GENAI_LIMITER_STATE, GENAI_MAX_ATTEMPTS
+의존: google-genai
+"""
+
+import os
+import re
+import json
+import time
+import random
+import tempfile
+import threading
+from contextlib import contextmanager
+from email.utils import parsedate_to_datetime
+
+try:
+    import fcntl  # POSIX: 프로세스 간 공유. 없으면(Windows) 프로세스 내부에서만 공유
+except ImportError:
+    fcntl = None
+
+from google import genai
+
+RPM = float(os.getenv("GENAI_RPM", "60"))
+IPM = float(os.getenv("GENAI_IPM", "60"))
+STATE_PATH = os.getenv("GENAI_LIMITER_STATE", os.path.join(tempfile.gettempdir(), "genai_limiter.json"))
+MAX_ATTEMPTS = int(os.getenv("GENAI_MAX_ATTEMPTS", "5"))
+BACKOFF_BASE = 1.0      # 초
+BACKOFF_CAP = 30.0
+MAX_SLEEP_SLICE = 2.0   # 대기 중에도 다른 프로세스의 반납/차단 해제를 다시 확인하는 주기
+
+RETRYABLE_CODES = {408, 429, 500, 502, 503, 504}
+RETRYABLE_STATUS = ("RESOURCE_EXHAUSTED", "UNAVAILABLE", "DEADLINE_EXCEEDED", "INTERNAL")
+
+# ---------------------------
+# Client
+# ---------------------------
+class ClientConfigError(RuntimeError):
+    pass
+
+_client = None
+_client_lock = threading.Lock()
+
+def get_client():
+    """프로세스 전역 genai.Client. GEMINI_API_KEY가 있으면 API Key, 없으면 Vertex 환경변수."""
+    global _client
+    with _client_lock:
+        if _client is not None:
+            return _client
+        api_key = os.environ.get("GEMINI_API_KEY")
+        if api_key:
+            print("--- [Nano] Using GEMINI_API_KEY mode ---")
+            _client = genai.Client(api_key=api_key)
+            return _client
+        print("--- [Nano] Using Vertex AI mode (Checking env vars...) ---")
+        need_vars = ["GOOGLE_CLOUD_PROJECT", "GOOGLE_CLOUD_LOCATION", "GOOGLE_GENAI_USE_VERTEXAI"]
+        missing = [v for v in need_vars if not os.environ.get(v)]
+        if missing:
+            raise ClientConfigError(f"Missing API Key OR Vertex Env Vars: {', '.join(missing)}")
+        _client = genai.Client(
+            vertexai=True,
+            project=os.environ["GOOGLE_CLOUD_PROJECT"],
+            location=os.getenv("GOOGLE_CLOUD_LOCATION", "global"),
+        )
+        return _client
+
+# ---------------------------
+# Rate limiter (token bucket, host-shared)
+# ---------------------------
+class RateLimiter:
+    """
+    버킷별 분당 한도(rates: {name: per_minute}). 용량 = 분당 한도(최대 1분치 버스트).
+    state 파일: {name: {"tokens", "ts"}, "blocked_until": epoch}
+    """
+
+    def __init__(self, rates, path=STATE_PATH):
+        self.rates = {k: float(v) for k, v in rates.items() if v and v > 0}
+        self.path = path
+        self._tlock = threading.Lock()
+        self._mem = {}
+
+    @contextmanager
+    def _state(self):
+        with self._tlock:
+            if fcntl is None or not self.path:
+                yield self._mem
+                return
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            with open(self.path, "a+", encoding="utf-8") as f:
+                fcntl.flock(f, fcntl.LOCK_EX)
+                try:
+                    f.seek(0)
+                    raw = f.read()
+                    try:
+                        state = json.loads(raw) if raw.strip() else {}
+                    except ValueError:
+                        state = {}
+                    yield state
+                    f.seek(0); f.truncate()
+                    json.dump(state, f)
+                    f.flush()
+                finally:
+                    fcntl.flock(f, fcntl.LOCK_UN)
+
+    def _refill(self, state, now):
+        for name, per_min in self.rates.items():
+            b = state.get(name) or {"tokens": per_min, "ts": now}
+            b["tokens"] = min(per_min, b["tokens"] + (now - b["ts"]) * per_min / 60.0)
+            b["ts"] = now
+            state[name] = b
+
+    def acquire(self, **need):
+        """need: {bucket: 개수}. 모든 버킷에 토큰이 생길 때까지 대기 후 차감. 반환: 대기한 초."""
+        need = {k: float(v) for k, v in need.items() if k in self.rates and v}
+        t0 = time.time()
+        while True:
+            with self._state() as st:
+                now = time.time()
+                self._refill(st, now)
+                wait_s = max(0.0, float(st.get("blocked_until", 0.0)) - now)
+                for name, n in need.items():
+                    deficit = min(n, self.rates[name]) - st[name]["tokens"]
+                    if deficit > 0:
+                        wait_s = max(wait_s, deficit * 60.0 / self.rates[name])
+                if wait_s <= 0:
+                    for name, n in need.items():
+                        st[name]["tokens"] -= n
+                    return time.time() - t0
+            time.sleep(min(wait_s, MAX_SLEEP_SLICE))
+
+    def block_for(self, seconds):
+        """429 등 한도 초과 신호: 공유 상태에 차단 시각을 기록해 모든 프로세스가 함께 대기."""
+        if seconds <= 0: return
+        with self._state() as st:
+            st["blocked_until"] = max(float(st.get("blocked_until", 0.0)), time.time() + seconds)
+
+_limiter = None
+
+def get_limiter():
+    global _limiter
+    with _client_lock:
+        if _limiter is None:
+            _limiter = RateLimiter({"requests": RPM, "images": IPM})
+        return _limiter
+
+# ---------------------------
+# Retry
+# ---------------------------
+def _status_code(e):
+    for attr in ("code", "status_code"):
+        v = getattr(e, attr, None)
+        if isinstance(v, int):
+            return v
+    resp = getattr(e, "response", None)
+    v = getattr(resp, "status_code", None)
+    return v if isinstance(v, int) else None
+
+def is_retryable(e):
+    code = _status_code(e)
+    if code is not None:
+        return code in RETRYABLE_CODES
+    msg = f"{getattr(e, 'status', '')} {e}".upper()
+    return any(s in msg for s in RETRYABLE_STATUS) or isinstance(e, (TimeoutError, ConnectionError))
+
+def retry_after_seconds(e):
+    """Retry-After 헤더(초 또는 HTTP-date) 또는 google.rpc.RetryInfo retryDelay("12s"). 없으면 None."""
+    resp = getattr(e, "response", None)
+    headers = getattr(resp, "headers", None) or {}
+    try:
+        ra = headers.get("retry-after") or headers.get("Retry-After")
+    except Exception:
+        ra = None
+    if ra:
+        try:
+            return max(0.0, float(ra))
+        except ValueError:
+            try:
+                return max(0.0, parsedate_to_datetime(ra).timestamp() - time.time())
+            except Exception:
+                pass
+    m = re.search(r'retryDelay["\']?\s*[:=]\s*["\']?(\d+(?:\.\d+)?)s', str(getattr(e, "details", "") or e))
+    return float(m.group(1)) if m else None
+
+def backoff_delay(attempt, base=BACKOFF_BASE, cap=BACKOFF_CAP):
+    """full jitter: U(0, min(cap, base * 2^attempt))."""
+    return random.uniform(0.0, min(cap, base * (2 ** attempt)))
+
+def call_with_retry(fn, limiter=None, images=1, max_attempts=MAX_ATTEMPTS, label="genai"):
+    """
+    limiter 토큰을 받은 뒤 fn() 호출. 재시도 가능한 오류면 Retry-After 또는 백오프만큼 쉬고 재시도.
+    429는 limiter.block_for로 같은 호스트의 다른 요청도 함께 늦춤.
+    """
+    limiter = limiter or get_limiter()
+    for attempt in range(max(1, max_attempts)):
+        limiter.acquire(requests=1, images=images)
+        try:
+            return fn()
+        except Exception as e:
+            if attempt + 1 >= max_attempts or not is_retryable(e):
+                raise
+            ra = retry_after_seconds(e)
+            delay = ra if ra is not None else backoff_delay(attempt)
+            if _status_code(e) == 429 or "RESOURCE_EXHAUSTED" in str(e).upper():
+                limiter.block_for(delay)
+            print(f"[{label}] retryable error ({_status_code(e) or type(e).__name__}); "
+                  f"retry {attempt+1}/{max_attempts-1} in {delay:.1f}s")
+            time.sleep(delay)
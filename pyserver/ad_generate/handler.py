@@ -64,6 +64,7 @@ def handler(job):
     image_b64 = job_input.get("image")
     product_name = job_input.get("product_name", "")
     headline = job_input.get("headline", "")
+    layout_mode = job_input.get("layout_mode", "vlm")  # "visual": VLM 없이 휴리스틱 레이아웃 (부하 시 빠른 경로)
     
     if not image_b64:
         return {"error": "No image provided"}
@@ -82,7 +83,7 @@ def handler(job):
         # ---------------------------
         print("--- [Step 1] Generating Layout (Qwen) ---")
         # qwen_logic.py의 함수 호출
-        layout_result = generate_layout(MODEL, PROCESSOR, img_path, product_name=product_name)
+        layout_result = generate_layout(MODEL, PROCESSOR, img_path, product_name=product_name, layout_mode=layout_mode)
         
         # 레이아웃 JSON 파일 저장 (다음 단계 스크립트가 읽어야 함)
         layout_json_path = os.path.join(tmp_dir, "layout.json")
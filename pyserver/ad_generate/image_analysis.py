@@ -0,0 +1,289 @@
+# -*- coding: utf-8 -*-
+"""
+image_analysis.py
+한 번 디코드한 이미지로 모든 단계가 공유하는 분석 객체 (ImageAnalysis).
+
+- 레이아웃(qwen_logic / qwen25_vl_layout_hybrid): gray, Sobel 에너지 + 적분 영상, 팔레트(numpy k-means)
+- 배경 후보 채점(nano_banana_generate): 후보 배치 Laplacian 크기 + 배치 적분 영상 (busy_rect_scores)
+- 텍스트 렌더(ad_text_render): 상대 휘도(luma, sRGB LUT) 맵 + 적분 영상, WCAG 대비율
+
+각 맵은 처음 요청될 때 한 번만 계산되고(memoize) 이후 재사용됨.
+박스 평균은 적분 영상으로 O(1).
+의존: Pillow, numpy
+"""
+
+from functools import cached_property
+
+import numpy as np
+from PIL import Image
+
+from energy_search import integral_image, rect_sums
+
+DEFAULT_MAX_SIDE = 1280
+MAPS = ("gray", "sobel", "laplacian", "luma")
+PALETTE_SAMPLE = 4096   # 팔레트 추출용 고정 샘플 픽셀 수 (격자 간격 샘플 → 결정적)
+PALETTE_ITERS = 10      # k-means(Lloyd) 최대 반복
+FALLBACK_PALETTE = ["#ffffff", "#000000"]
+
+# ---------------------------
+# Filters
+# ---------------------------
+def load_gray(image_path, max_side=DEFAULT_MAX_SIDE):
+    return ImageAnalysis.from_path(image_path, max_side=max_side).gray  # HxW
+
+def sobel_energy(gray):
+    Kx = np.array([[1,0,-1],[2,0,-2],[1,0,-1]], dtype=np.float32)
+    Ky = np.array([[1,2,1],[0,0,0],[-1,-2,-1]], dtype=np.float32)
+    g = np.pad(gray, 1, mode='edge')
+    sx = (Kx[0,0]*g[:-2,:-2] + Kx[0,1]*g[:-2,1:-1] + Kx[0,2]*g[:-2,2:] +
+          Kx[1,0]*g[1:-1,:-2] + Kx[1,1]*g[1:-1,1:-1] + Kx[1,2]*g[1:-1,2:] +
+          Kx[2,0]*g[2:,:-2] + Kx[2,1]*g[2:,1:-1] + Kx[2,2]*g[2:,2:])
+    sy = (Ky[0,0]*g[:-2,:-2] + Ky[0,1]*g[:-2,1:-1] + Ky[0,2]*g[:-2,2:] +
+          Ky[1,0]*g[1:-1,:-2] + Ky[1,1]*g[1:-1,1:-1] + Ky[1,2]*g[1:-1,2:] +
+          Ky[2,0]*g[2:,:-2] + Ky[2,1]*g[2:,1:-1] + Ky[2,2]*g[2:,2:])
+    mag = np.sqrt(sx*sx + sy*sy)
+    if mag.max() > 0: mag = mag / mag.max()
+    return mag  # 0..1
+
+def laplacian_abs(gray):
+    """|4-이웃 Laplacian| (reflect pad). 앞쪽 차원은 배치 (N x H x W 한 번에)."""
+    p = np.pad(gray, ((0,0),)*(gray.ndim-2) + ((1,1),(1,1)), mode="reflect")
+    conv = (p[...,:-2,1:-1] + p[...,1:-1,:-2] + p[...,1:-1,2:] + p[...,2:,1:-1]
+            - 4.0*p[...,1:-1,1:-1])
+    return np.abs(conv)
+
+def _srgb_to_linear_lut():
+    c = np.arange(256, dtype=np.float64) / 255.0
+    return np.where(c <= 0.04045, c/12.92, ((c + 0.055) / 1.055) ** 2.4).astype(np.float32)
+
+SRGB_TO_LINEAR = _srgb_to_linear_lut()                # uint8 → 선형 (256 엔트리)
+LUMA_WEIGHTS = np.array([0.2126, 0.7152, 0.0722], dtype=np.float32)
+_LUMA_LUT = SRGB_TO_LINEAR[None, :] * LUMA_WEIGHTS[:, None]   # 3 x 256, 채널 가중치까지 미리 곱함
+
+def relative_luminance(rgb_u8):
+    """sRGB uint8 HxWx3 → 선형 상대 휘도 HxW (0..1, WCAG 정의). 채널별 LUT 조회 3번."""
+    rgb_u8 = np.asarray(rgb_u8, dtype=np.uint8)
+    return _LUMA_LUT[0][rgb_u8[...,0]] + _LUMA_LUT[1][rgb_u8[...,1]] + _LUMA_LUT[2][rgb_u8[...,2]]
+
+def color_luminance(rgb):
+    """(r,g,b) uint8 색 하나의 상대 휘도."""
+    return float(sum(_LUMA_LUT[i][int(rgb[i])] for i in range(3)))
+
+def contrast_ratio(l1, l2):
+    """WCAG 대비율 (1..21). 인자는 상대 휘도."""
+    hi, lo = max(l1, l2), min(l1, l2)
+    return (hi + 0.05) / (lo + 0.05)
+
+def best_contrast(bg_luma, colors):
+    """colors 중 배경 휘도와 대비율이 가장 큰 색과 그 대비율."""
+    scored = [(contrast_ratio(bg_luma, color_luminance(c)), i) for i, c in enumerate(colors)]
+    ratio, i = max(scored)
+    return colors[i], ratio
+
+def extract_palette(rgb_u8, k=5, sample=PALETTE_SAMPLE, iters=PALETTE_ITERS):
+    """
+    uint8 HxWx3 → 대표색 (k' x 3 uint8), 비중 (k', 합 1) — 비중 내림차순.
+    격자 간격으로 뽑은 고정 샘플에 median cut으로 초기 중심을 잡고 k-means로 다듬음.
+    난수를 쓰지 않으므로 같은 입력이면 항상 같은 결과(캐시 키로 안전).
+    """
+    H, W = rgb_u8.shape[:2]
+    s = max(1, int(np.ceil(np.sqrt(H*W / float(sample)))))
+    pts = rgb_u8[::s, ::s].reshape(-1, 3).astype(np.float32)
+    # median cut: 범위가 가장 큰 상자를 가장 긴 채널의 중앙값에서 분할
+    boxes = [pts]
+    while len(boxes) < k:
+        spans = [float(np.ptp(b, axis=0).max()) if len(b) > 1 else 0.0 for b in boxes]
+        i = int(np.argmax(spans))
+        if spans[i] <= 0: break
+        b = boxes.pop(i)
+        ch = int(np.argmax(np.ptp(b, axis=0)))
+        order = np.argsort(b[:, ch], kind="stable")
+        half = len(b) // 2
+        boxes += [b[order[:half]], b[order[half:]]]
+    centers = np.stack([b.mean(axis=0) for b in boxes])
+    # Lloyd 반복 (샘플 x 중심 거리 행렬 한 번에)
+    for _ in range(iters):
+        d = ((pts[:, None, :] - centers[None, :, :])**2).sum(axis=2)
+        lab = d.argmin(axis=1)
+        counts = np.bincount(lab, minlength=len(centers))
+        sums = np.stack([np.bincount(lab, weights=pts[:, c], minlength=len(centers)) for c in range(3)], axis=1)
+        new = centers.copy()
+        nz = counts > 0
+        new[nz] = sums[nz] / counts[nz, None]
+        if np.allclose(new, centers, atol=0.25):
+            centers = new; break
+        centers = new
+    d = ((pts[:, None, :] - centers[None, :, :])**2).sum(axis=2)
+    counts = np.bincount(d.argmin(axis=1), minlength=len(centers)).astype(np.float64)
+    keep = counts > 0
+    colors = np.clip(np.rint(centers[keep]), 0, 255).astype(np.uint8)
+    weights = counts[keep] / counts[keep].sum()
+    order = np.argsort(-weights, kind="stable")
+    return colors[order], weights[order]
+
+def palette_to_hex(colors):
+    """대표색 배열 → 중복 없는 '#rrggbb' 리스트 (순서 유지)."""
+    out = []
+    for r, g, b in colors:
+        h = '#%02x%02x%02x' % (int(r), int(g), int(b))
+        if h not in out: out.append(h)
+    return out
+
+# ---------------------------
+# Batch busy score (background candidates)
+# ---------------------------
+def _analysis_size(size, max_side):
+    W, H = size
+    scale = 1.0 if not max_side else min(1.0, max_side / max(W, H))
+    return (int(W*scale), int(H*scale)) if scale < 1.0 else (W, H)
+
+def busy_rect_scores(images, rects, max_side=None):
+    """
+    후보 이미지들의 reserved rect별 평균 |Laplacian|.
+    images: PIL 이미지 리스트 (분석 해상도가 같은 것끼리 N x H x W 한 배열로 묶어 계산)
+    rects: 정규화 (x1,y1,x2,y2) 리스트. 분석 해상도에서 픽셀로 바꾼 뒤 빈 rect는 NaN.
+    max_side: 분석 해상도 상한 (None → 후보 원본 해상도; Laplacian 크기는 해상도에 민감)
+    반환: N x R float64
+    """
+    n, r = len(images), len(rects)
+    out = np.full((n, r), np.nan)
+    if n == 0 or r == 0:
+        return out
+    R = np.clip(np.asarray(rects, dtype=np.float64).reshape(-1, 4), 0.0, 1.0)
+    groups = {}
+    for i, im in enumerate(images):
+        groups.setdefault(_analysis_size(im.size, max_side), []).append(i)
+    for (w, h), idx in groups.items():
+        stack = np.empty((len(idx), h, w), dtype=np.float32)
+        for j, i in enumerate(idx):
+            im = images[i] if images[i].size == (w, h) else images[i].resize((w, h), Image.BICUBIC)
+            stack[j] = np.asarray(im.convert("L"), dtype=np.float32) / 255.0
+        ii = integral_image(laplacian_abs(stack))
+        x1 = (R[:,0]*w).astype(np.int64); x2 = (R[:,2]*w).astype(np.int64)
+        y1 = (R[:,1]*h).astype(np.int64); y2 = (R[:,3]*h).astype(np.int64)
+        x1, x2 = np.clip(np.minimum(x1, x2), 0, w-1), np.clip(np.maximum(x1, x2), 0, w-1)
+        y1, y2 = np.clip(np.minimum(y1, y2), 0, h-1), np.clip(np.maximum(y1, y2), 0, h-1)
+        area = (x2-x1) * (y2-y1)
+        ok = area > 0
+        vals = rect_sums(ii, x1, y1, x2, y2) / np.where(ok, area, 1)
+        out[idx] = np.where(ok, vals, np.nan)
+    return out
+
+def busy_scores(per_rect, agg="mean"):
+    """N x R rect 점수 → 후보별 점수 (mean: 평균 / max: 가장 복잡한 rect). 유효 rect가 없으면 0."""
+    if per_rect.size == 0:
+        return np.zeros(len(per_rect))
+    valid = ~np.isnan(per_rect)
+    filled = np.where(valid, per_rect, 0.0)
+    cnt = valid.sum(axis=1)
+    if agg == "max":
+        s = np.where(valid, per_rect, -np.inf).max(axis=1)
+    else:
+        s = filled.sum(axis=1) / np.maximum(cnt, 1)
+    return np.where(cnt > 0, s, 0.0)
+
+# ---------------------------
+# Shared analysis object
+# ---------------------------
+class ImageAnalysis:
+    """
+    이미지 1장에 대한 분석 결과 캐시.
+    image: PIL 이미지(아무 모드). max_side 로 분석 해상도를 제한(None이면 원본 해상도).
+    좌표 규약: *_px 메서드는 원본(source) 픽셀 좌표, *_norm 메서드는 정규화 xywh.
+    """
+
+    def __init__(self, image: Image.Image, max_side=DEFAULT_MAX_SIDE):
+        rgb = image if image.mode == "RGB" else image.convert("RGB")
+        W, H = rgb.size
+        self.source_size = (W, H)
+        scale = 1.0 if not max_side else min(1.0, max_side / max(W, H))
+        if scale < 1.0:
+            rgb = rgb.resize((int(W*scale), int(H*scale)), Image.BICUBIC)
+        self.image = rgb
+        self.size = rgb.size
+        self.sx = self.size[0] / W
+        self.sy = self.size[1] / H
+        self._ii = {}
+        self._palettes = {}
+
+    @classmethod
+    def from_path(cls, image_path, max_side=DEFAULT_MAX_SIDE):
+        im = Image.open(image_path)
+        W, H = im.size
+        if max_side and max(W, H) > 2*max_side:
+            # JPEG은 DCT 단계에서 축소 디코드 (결과는 항상 요청 크기 이상)
+            s = max_side / max(W, H)
+            im.draft("RGB", (max(1, int(W*s)), max(1, int(H*s))))
+        im.load()  # 단일 프레임이면 load 후 파일 핸들이 닫힘
+        obj = cls(im, max_side=max_side)
+        # draft로 축소 디코드된 경우에도 좌표 변환은 원본 헤더 크기 기준
+        obj.source_size = (W, H)
+        obj.sx = obj.size[0] / W
+        obj.sy = obj.size[1] / H
+        return obj
+
+    # ----- lazily computed maps -----
+    @cached_property
+    def rgb(self):
+        return np.asarray(self.image, dtype=np.uint8)  # HxWx3
+
+    @cached_property
+    def gray(self):
+        return np.asarray(self.image.convert("L"), dtype=np.float32) / 255.0
+
+    @cached_property
+    def sobel(self):
+        return sobel_energy(self.gray)
+
+    @cached_property
+    def laplacian(self):
+        return laplacian_abs(self.gray)
+
+    @cached_property
+    def luma(self):
+        return relative_luminance(self.rgb)
+
+    def integral(self, name):
+        if name not in MAPS:
+            raise ValueError(f"unknown map: {name}")
+        ii = self._ii.get(name)
+        if ii is None:
+            ii = self._ii[name] = integral_image(getattr(self, name))
+        return ii
+
+    @property
+    def sobel_ii(self):
+        return self.integral("sobel")
+
+    # ----- box queries -----
+    def mean_px(self, name, box, default=0.0):
+        """원본 픽셀 (x0,y0,x1,y1) 박스의 평균값. 빈 박스면 default."""
+        x0, y0, x1, y1 = box
+        W, H = self.size
+        ax0 = min(max(int(round(x0*self.sx)), 0), W); ax1 = min(max(int(round(x1*self.sx)), 0), W)
+        ay0 = min(max(int(round(y0*self.sy)), 0), H); ay1 = min(max(int(round(y1*self.sy)), 0), H)
+        if ax1 <= ax0 or ay1 <= ay0:
+            return default
+        s = rect_sums(self.integral(name), ax0, ay0, ax1, ay1)
+        return float(s / ((ax1-ax0) * (ay1-ay0)))
+
+    def mean_norm(self, name, bbox, default=0.0):
+        """정규화 [x,y,w,h] 박스의 평균값."""
+        x, y, w, h = bbox
+        W, H = self.source_size
+        return self.mean_px(name, (x*W, y*H, (x+w)*W, (y+h)*H), default=default)
+
+    # ----- palette -----
+    def palette(self, k=5):
+        """(colors k'x3 uint8, weights k') — 분석 해상도 버퍼에서 계산, k별로 memoize."""
+        pal = self._palettes.get(k)
+        if pal is None:
+            pal = self._palettes[k] = extract_palette(self.rgb, k)
+        return pal
+
+    def palette_hex(self, k=5):
+        try:
+            colors, _ = self.palette(k)
+            return palette_to_hex(colors)[:k] or list(FALLBACK_PALETTE)
+        except Exception:
+            return list(FALLBACK_PALETTE)
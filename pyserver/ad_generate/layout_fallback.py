@@ -0,0 +1,216 @@
+# -*- coding: utf-8 -*-
+"""
+layout_fallback.py
+VLM 결과 없이도 쓸 수 있는 레이아웃 폴백 / 배경 프롬프트 보강 (torch 불필요).
+
+- cond 규칙 파싱, 힌트 → 목표 면적 / 종횡비
+- 소벨 에너지 기반 headline / logo 제안 (propose_fallback_*), 텍스트 언더레이
+- 배경 프롬프트 요약 / 기본 프롬프트 보강 (ensure_background_prompts)
+- provisional_layout: 이미지 에너지만으로 만든 임시 레이아웃 (Qwen 출력과 같은 모양, 수십 ms)
+  → Qwen이 도는 동안 Stage 2 배경 생성을 먼저 시작할 때 사용 (speculative.py)
+  → VLM 없는 visual 레이아웃 티어로도 사용 (layout_mode="visual", 부하 시 compose auto 라우팅)
+
+qwen_logic.py / qwen25_vl_layout_hybrid.py / speculative.py / compose_service.py 에서 공용으로 임포트.
+의존: numpy, Pillow
+"""
+
+import json
+
+from energy_search import clip_bbox, multiscale_search, subject_bbox_from_energy, window_sizes
+from image_analysis import ImageAnalysis
+
+# ---------------------------
+# Rules & Hints
+# ---------------------------
+def rules_from_cond(cond):
+    """cond(text_rules / logo_rules) → (text_rules, logo_rules) 기본값 채운 dict."""
+    cond = cond or {}
+    text_rules = {
+        "min_margin": float(cond.get("text_rules",{}).get("min_margin", 0.03)),
+        "min_ar": float(cond.get("text_rules",{}).get("min_ar", 1.8)),
+        "max_area": float(cond.get("text_rules",{}).get("max_area", 0.20)),
+        "max_iou_subject": float(cond.get("text_rules",{}).get("max_iou_with_subject", 0.20)),
+    }
+    logo_rules = {
+        "min_margin": float(cond.get("logo_rules",{}).get("min_margin", 0.03)),
+        "max_area": float(cond.get("logo_rules",{}).get("max_area", 0.12)),
+        "ar_range": tuple(cond.get("logo_rules",{}).get("ar_range", [0.7, 3.0])),
+        "max_iou_subject": float(cond.get("logo_rules",{}).get("max_iou_with_subject", 0.20)),
+        "max_iou_text": float(cond.get("logo_rules",{}).get("max_iou_with_text", 0.25)),
+    }
+    return text_rules, logo_rules
+
+def bbox_from_center_ratio(center, ratio):
+    cx,cy = center; rw,rh = ratio
+    return clip_bbox([cx-rw/2, cy-rh/2, rw, rh])
+
+def area_from_text_hint(hint: dict):
+    if not isinstance(hint, dict): return None
+    chars = max(0, int(hint.get("approx_chars", 0)))
+    lines = max(1, int(hint.get("lines", 1)))
+    base = 0.06 * (chars / 14.0)
+    area = base + 0.03*(lines-1)
+    return float(min(0.20, max(0.02, area)))
+
+def area_from_logo_hint(hint: dict):
+    if not isinstance(hint, dict): return None
+    try:
+        return float(min(0.12, max(0.01, float(hint.get("target_area", 0.05)))))
+    except Exception:
+        return 0.05
+
+def ar_from_logo_hint(hint: dict):
+    if not isinstance(hint, dict): return None
+    try:
+        ar = float(hint.get("aspect_ratio", 2.2))
+        return float(min(3.5, max(0.6, ar)))
+    except Exception:
+        return 2.2
+
+# ---------------------------
+# Visual fallback
+# ---------------------------
+def propose_fallback_text_visual(energy, subject_bbox, rules, hint=None, seed=None, ii=None):
+    target_area = area_from_text_hint(hint) if hint else 0.06
+    aspect = max(rules["min_ar"], 2.2)
+    h = (target_area/aspect)**0.5
+    w = aspect*h
+    w = min(w, 1 - 2*rules["min_margin"])
+    h = min(h, 0.22)
+    # 기준 크기 주변 크기/종횡비 변형까지 coarse-to-fine 탐색 (가로형 min_ar 유지)
+    sizes = window_sizes(w, h, max_w=1 - 2*rules["min_margin"], max_h=0.22, ar_range=(rules["min_ar"], float("inf")))
+    ranked = multiscale_search(energy, sizes, margin=rules["min_margin"], avoid=[subject_bbox], top_n=1, ii=ii)
+    b = ranked[0][1] if ranked else [rules["min_margin"], rules["min_margin"], w, h]
+    return {"type":"headline","content":"","bbox":b,"confidence":0.6}
+
+def propose_fallback_logo_visual(energy, subject_bbox, text_bbox, rules, hint=None, seed=None, ii=None):
+    targ = area_from_logo_hint(hint) if hint else 0.05
+    ar = ar_from_logo_hint(hint) if hint else 2.2
+    w = (targ)**0.5
+    h = max(0.04, w/ar)
+    w = min(w, 1 - 2*rules["min_margin"])
+    h = min(h, 0.15)
+    sizes = window_sizes(w, h, max_w=1 - 2*rules["min_margin"], max_h=0.15, ar_range=tuple(rules["ar_range"]))
+    ranked = multiscale_search(
+        energy, sizes, margin=rules["min_margin"], avoid=[subject_bbox, text_bbox],
+        exclude=[text_bbox], top_n=1, ii=ii
+    ) or multiscale_search(energy, sizes, margin=rules["min_margin"], avoid=[subject_bbox, text_bbox], top_n=1, ii=ii)
+    b = ranked[0][1] if ranked else [rules["min_margin"], rules["min_margin"], w, h]
+    return {"type":"logo","content":"","bbox":b,"confidence":0.6}
+
+def add_text_underlays(layout, pad=0.015, opacity=0.6, radius=0.08):
+    texts = layout.get("nongraphic_layout", []) or []
+    layout.setdefault("graphic_layout", [])
+    for idx,t in enumerate(texts):
+        b=t.get("bbox"); 
+        if not (isinstance(b,list) and len(b)==4): continue
+        x,y,w,h=b
+        under={
+            "type":"underlay",
+            "for": t.get("type","text")+f"#{idx}",
+            "bbox": clip_bbox([x-pad, y-pad, w+2*pad, h+2*pad]),
+            "style":{"shape":"rounded","radius":radius,"opacity":opacity},
+            "confidence": min(0.9, float(t.get("confidence",0.5))+0.1)
+        }
+        layout["graphic_layout"].append(under)
+
+# ---------------------------
+# Background prompt
+# ---------------------------
+def summarize_layout_for_bg(parsed):
+    if not isinstance(parsed, dict) or "layout" not in parsed: return "no layout"
+    layout=parsed["layout"]
+    subj=layout.get("subject_layout", {"center":[0.5,0.5], "ratio":[0.3,0.3]})
+    cx,cy=subj.get("center",[0.5,0.5]); rw,rh=subj.get("ratio",[0.3,0.3])
+    subj_bbox=[cx-rw/2, cy-rh/2, rw, rh]
+    texts=layout.get("nongraphic_layout", []) or []
+    logos=layout.get("graphic_layout", []) or []
+    top_free = cy - rh/2; bottom_free = 1 - (cy + rh/2)
+    left_free = cx - rw/2; right_free = 1 - (cx + rw/2)
+    hints=[]
+    if top_free>0.25: hints.append("top has ample negative space")
+    if bottom_free>0.25: hints.append("bottom has ample negative space")
+    if left_free>0.25: hints.append("left side has ample negative space")
+    if right_free>0.25: hints.append("right side has ample negative space")
+    return json.dumps({
+        "subject_bbox": subj_bbox,
+        "text_boxes": [t.get("bbox") for t in texts if isinstance(t.get("bbox"), list)],
+        "logo_boxes": [g.get("bbox") for g in logos if isinstance(g.get("bbox"), list)],
+        "free_space_hints": hints
+    }, ensure_ascii=False)
+
+def ensure_background_prompts(parsed, product_name, context_json, min_chars=800):
+    bg=parsed.setdefault("background", {})
+    prompt=(bg.get("prompt") or '').strip()
+    negative=(bg.get("negative_prompt") or '').strip()
+    cam=bg.get("camera") or {}; light=bg.get("lighting") or {}
+    angle=str(cam.get("angle","eye-level")).replace('_','-')
+    distance=str(cam.get("distance","closeup"))
+    ltype=(light.get("type") or "soft").lower()
+    ldir=(light.get("direction") or "front").lower()
+    palette=bg.get("palette") or []
+    if len(prompt) < min_chars:
+        try:
+            ctx=json.loads(context_json) if isinstance(context_json,str) else (context_json or {})
+            free_hints=ctx.get("free_space_hints", []) or []
+        except Exception:
+            free_hints=[]
+        free_txt = f" The composition preserves ample {', '.join(free_hints)} for copy layers." if free_hints else ""
+        palette_txt = f" The color harmony follows {', '.join(palette)}." if palette else ""
+        product_txt = f" The scene flatters the {product_name}." if product_name else " The scene flatters the product."
+        prompt = (
+            f"A minimal studio scene viewed {angle} at a {distance} distance, built on a clean white base with a "
+            f"uniform, smooth surface. The background feels airy and uncluttered so the jewelry remains the visual anchor. "
+            f"Lighting is {ltype} from the {ldir}, creating gentle highlights on metal and controlled shadows that avoid the subject. "
+            f"Subtle gradients and a clean vignette guide the eye toward the center without stealing attention. "
+            f"Props are placed behind the product and outside text/logo areas; their scale is modest and their edges soft to prevent occlusion. "
+            f"Depth cues are introduced with a mild blur in the far plane and a crisp focus on the subject plane. "
+            f"Micro-texture is barely perceptible, keeping reflections smooth and elegant. "
+            f"Overall mood is calm, premium, and editorial." + palette_txt + free_txt + product_txt
+        )
+        bg["prompt"]=prompt
+    if not negative:
+        bg["negative_prompt"]=(
+            "busy patterns, harsh shadows, specular clipping on metal, occluding props, "
+            "off-palette colors, tilted horizon, text overlays, watermarks, low resolution"
+        )
+    cam["angle"]=angle; cam["distance"]=distance
+    light["type"]=ltype; light["direction"]=ldir
+    bg["camera"]=cam; bg["lighting"]=light
+    parsed["background"]=bg
+    return parsed
+
+# ---------------------------
+# Provisional layout (VLM 없이)
+# ---------------------------
+def subject_layout_from_bbox(b):
+    return {
+        "center":[round(b[0]+b[2]/2,3), round(b[1]+b[3]/2,3)],
+        "ratio":[round(b[2],3), round(b[3],3)]
+    }
+
+def provisional_layout(image_path, product_name=None, cond=None, analysis=None, bg_min_chars=900, seed=1234):
+    """
+    이미지 에너지만으로 Qwen 출력과 같은 모양의 레이아웃 JSON 생성:
+    subject = subject_bbox_from_energy, headline / logo = 폴백 제안, 언더레이 + 기본 배경 프롬프트.
+    (Qwen의 "모든 후보가 규칙에서 드랍됨 → 폴백" 경로와 같은 결과)
+    """
+    cond = cond or {}
+    text_rules, logo_rules = rules_from_cond(cond)
+    analysis = analysis or ImageAnalysis.from_path(image_path)
+    energy = analysis.sobel
+    subject_bbox = subject_bbox_from_energy(energy)
+    text = propose_fallback_text_visual(energy, subject_bbox, text_rules, hint=cond.get("headline_hint", {}),
+                                        seed=seed, ii=analysis.sobel_ii)
+    logo = propose_fallback_logo_visual(energy, subject_bbox, text["bbox"], logo_rules, hint=cond.get("logo_hint", {}),
+                                        seed=seed, ii=analysis.sobel_ii)
+    layout = {
+        "subject_layout": subject_layout_from_bbox(subject_bbox),
+        "nongraphic_layout": [text],
+        "graphic_layout": [logo]
+    }
+    underlay = cond.get("underlay", {})
+    add_text_underlays(layout, pad=float(underlay.get("pad", 0.015)),
+                       opacity=float(underlay.get("opacity", 0.6)), radius=float(underlay.get("radius", 0.08)))
+    parsed = {"layout": layout, "background": {"palette": analysis.palette_hex(k=5)}}
+    return ensure_background_prompts(parsed, product_name, summarize_layout_for_bg(parsed), min_chars=bg_min_chars)
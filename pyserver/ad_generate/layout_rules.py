@@ -0,0 +1,218 @@
+# -*- coding: utf-8 -*-
+"""
+layout_rules.py
+레이아웃 후보(headline / logo) 규칙 필터 + NMS + 단일 선택을 numpy 테이블 하나로 처리.
+
+- CandidateTable: 후보 N개를 boxes(N x 4, xywh norm) / conf(N) / types(N) / drop(N, 비트마스크)로 보관
+- 여백 / 종횡비 / 면적 / subject·text IoU 검사를 후보 전체에 대해 한 번에 계산
+- NMS는 쌍별 IoU 행렬 1회 계산 후 신뢰도 순으로 억제
+- 드랍 사유는 debug 튜플 대신 drop 열의 비트(DROP_*)로 기록 → drop_summary()로 집계
+- 규칙은 quiet 여부와 무관하게 항상 적용. 이전 enforce_*_rules는 `if not quiet: debug.append(...); continue`
+  형태라 quiet 모드에서 여백 / 종횡비 / 면적 / IoU 위반 후보를 드랍하지 않았음 (버그 수정, quiet 실행의 선택이 달라질 수 있음)
+
+qwen_logic.py / qwen25_vl_layout_hybrid.py 에서 공용으로 임포트.
+의존: numpy
+"""
+
+import numpy as np
+
+# ---------------------------
+# Drop reasons (bitmask)
+# ---------------------------
+DROP_INVALID     = 1 << 0   # bbox가 길이 4 리스트가 아님
+DROP_MARGIN      = 1 << 1
+DROP_MIN_AR      = 1 << 2
+DROP_AR_RANGE    = 1 << 3
+DROP_MAX_AREA    = 1 << 4
+DROP_IOU_SUBJECT = 1 << 5
+DROP_IOU_TEXT    = 1 << 6
+DROP_NMS         = 1 << 7
+
+DROP_NAMES = {
+    DROP_INVALID: "invalid_bbox",
+    DROP_MARGIN: "margin",
+    DROP_MIN_AR: "min_ar",
+    DROP_AR_RANGE: "ar_range",
+    DROP_MAX_AREA: "max_area",
+    DROP_IOU_SUBJECT: "iou_subject",
+    DROP_IOU_TEXT: "iou_text",
+    DROP_NMS: "nms",
+}
+
+# ---------------------------
+# Vectorized geometry
+# ---------------------------
+def clip_boxes(boxes):
+    """clip_bbox의 벡터판 (N x 4)."""
+    b = np.clip(np.asarray(boxes, dtype=np.float64), 0.0, 1.0)
+    x, y, w, h = b[:,0], b[:,1], b[:,2], b[:,3]
+    w = np.where(x+w > 1, np.maximum(0.0, 1-x), w)
+    h = np.where(y+h > 1, np.maximum(0.0, 1-y), h)
+    return np.stack([x, y, w, h], axis=1)
+
+def iou_boxes(boxes, b):
+    """boxes(N x 4)와 박스 b 하나의 IoU (N). b가 None/빈 값이면 0."""
+    n = len(boxes)
+    if not b:
+        return np.zeros(n)
+    x2,y2,w2,h2 = map(float, b)
+    x, y, w, h = boxes[:,0], boxes[:,1], boxes[:,2], boxes[:,3]
+    ix = np.maximum(0.0, np.minimum(x+w, x2+w2) - np.maximum(x, x2))
+    iy = np.maximum(0.0, np.minimum(y+h, y2+h2) - np.maximum(y, y2))
+    inter = ix * iy
+    u = np.maximum(0.0, w*h) + max(0.0, w2*h2) - inter
+    return np.where(u > 0, inter / np.where(u > 0, u, 1.0), 0.0)
+
+def iou_matrix(boxes):
+    """쌍별 IoU 행렬 (N x N)."""
+    x, y, w, h = (boxes[:,i] for i in range(4))
+    ix = np.maximum(0.0, np.minimum((x+w)[:,None], (x+w)[None,:]) - np.maximum(x[:,None], x[None,:]))
+    iy = np.maximum(0.0, np.minimum((y+h)[:,None], (y+h)[None,:]) - np.maximum(y[:,None], y[None,:]))
+    inter = ix * iy
+    a = np.maximum(0.0, w*h)
+    u = a[:,None] + a[None,:] - inter
+    return np.where(u > 0, inter / np.where(u > 0, u, 1.0), 0.0)
+
+# ---------------------------
+# Candidate table
+# ---------------------------
+class CandidateTable:
+    """
+    후보 dict 리스트를 감싼 열 지향 테이블. 원본 dict는 items로 유지(최종 반환용).
+    drop==0 인 행이 살아있는 후보.
+    """
+
+    def __init__(self, items, boxes, conf, types, drop):
+        self.items = items
+        self.boxes = boxes
+        self.conf = conf
+        self.types = types
+        self.drop = drop
+
+    @classmethod
+    def from_items(cls, items, kind=None):
+        """kind가 주어지면 type==kind 인 후보만 담음 (logo 필터와 동일)."""
+        rows = [it for it in items if kind is None or it.get("type") == kind]
+        n = len(rows)
+        raw = np.zeros((n, 4), dtype=np.float64)
+        drop = np.zeros(n, dtype=np.uint16)
+        for i, it in enumerate(rows):
+            b = it.get("bbox")
+            try:
+                if not (isinstance(b, list) and len(b) == 4): raise ValueError
+                raw[i] = [float(v) for v in b]
+            except (TypeError, ValueError):
+                drop[i] |= DROP_INVALID
+        conf = np.array([float(it.get("confidence", 0.5)) for it in rows], dtype=np.float64)
+        types = np.array([str(it.get("type", "")) for it in rows], dtype=object)
+        return cls(rows, clip_boxes(raw), conf, types, drop)
+
+    def __len__(self):
+        return len(self.items)
+
+    @property
+    def alive(self):
+        return self.drop == 0
+
+    # ----- per-column features -----
+    @property
+    def area(self):
+        return self.boxes[:,2] * self.boxes[:,3]
+
+    @property
+    def aspect(self):
+        w, h = self.boxes[:,2], self.boxes[:,3]
+        return np.where(h > 0, w / np.where(h > 0, h, 1.0), 999.0)
+
+    def _flag(self, mask, bit):
+        self.drop[mask & ((self.drop & DROP_INVALID) == 0)] |= bit
+
+    def _check_margin(self, m):
+        x, y, w, h = (self.boxes[:,i] for i in range(4))
+        self._flag((x < m) | (y < m) | (x+w > 1-m) | (y+h > 1-m), DROP_MARGIN)
+
+    # ----- rules -----
+    def enforce_text_rules(self, rules, subject_bbox):
+        self._check_margin(rules["min_margin"])
+        self._flag(self.aspect < rules["min_ar"], DROP_MIN_AR)
+        self._flag(self.area > rules["max_area"], DROP_MAX_AREA)
+        self._flag(iou_boxes(self.boxes, subject_bbox) > rules["max_iou_subject"], DROP_IOU_SUBJECT)
+        return self
+
+    def enforce_logo_rules(self, rules, subject_bbox, text_bbox=None):
+        lo, hi = rules["ar_range"]
+        ar = self.aspect
+        self._check_margin(rules["min_margin"])
+        self._flag(self.area > rules["max_area"], DROP_MAX_AREA)
+        self._flag(~((lo <= ar) & (ar <= hi)), DROP_AR_RANGE)
+        self._flag(iou_boxes(self.boxes, subject_bbox) > rules["max_iou_subject"], DROP_IOU_SUBJECT)
+        self._flag(iou_boxes(self.boxes, text_bbox) > rules["max_iou_text"], DROP_IOU_TEXT)
+        return self
+
+    def order(self):
+        """살아있는 행 인덱스, 신뢰도 내림차순 (동점은 입력 순서 유지)."""
+        idx = np.flatnonzero(self.alive)
+        return idx[np.argsort(-self.conf[idx], kind="stable")]
+
+    def nms(self, iou_thr=0.3):
+        """쌍별 IoU 행렬로 greedy NMS. 억제된 행은 DROP_NMS."""
+        idx = self.order()
+        if len(idx) < 2:
+            return self
+        iou = iou_matrix(self.boxes[idx])
+        suppressed = np.zeros(len(idx), dtype=bool)
+        for r in range(len(idx)):
+            if suppressed[r]: continue
+            suppressed[r+1:] |= iou[r, r+1:] >= iou_thr
+        self.drop[idx[suppressed]] |= DROP_NMS
+        return self
+
+    # ----- selection -----
+    def text_scores(self, subject_bbox):
+        """가로형, 약간 넓은 면적 선호, subject와의 겹침 패널티."""
+        w, h = self.boxes[:,2], self.boxes[:,3]
+        return (self.conf + 0.1*np.minimum((w/np.maximum(h, 1e-6))/3, 1.0) + 0.03*(w*h)
+                - 0.6*iou_boxes(self.boxes, subject_bbox))
+
+    def logo_scores(self, subject_bbox, text_bbox=None):
+        pen = 0.6*iou_boxes(self.boxes, subject_bbox) + 0.4*iou_boxes(self.boxes, text_bbox)
+        return self.conf + 0.05*self.area - pen
+
+    def pick_single(self, scores):
+        """살아있는 행 중 최고 점수 1개를 [item]으로 (없으면 [])."""
+        idx = self.order()
+        if len(idx) == 0:
+            return []
+        i = int(idx[np.argmax(scores[idx])])
+        return [self._finalize(i)]
+
+    def kept_items(self):
+        return [self._finalize(int(i)) for i in self.order()]
+
+    def _finalize(self, i):
+        it = self.items[i]
+        it["bbox"] = [float(v) for v in self.boxes[i]]
+        it["confidence"] = float(self.conf[i]); it["content"] = ""
+        return it
+
+    def drop_summary(self):
+        """{사유: 개수} — 한 후보가 여러 사유에 걸리면 각각 집계."""
+        out = {}
+        for bit, name in DROP_NAMES.items():
+            c = int(np.count_nonzero(self.drop & bit))
+            if c: out[name] = c
+        return out
+
+# ---------------------------
+# Pipeline helpers
+# ---------------------------
+def select_text(texts, subject_bbox, rules, iou_thr=0.3):
+    """규칙 → NMS → 단일 선택. 반환: ([item] 또는 [], table)."""
+    tbl = CandidateTable.from_items(texts)
+    tbl.enforce_text_rules(rules, subject_bbox).nms(iou_thr)
+    return tbl.pick_single(tbl.text_scores(subject_bbox)), tbl
+
+def select_logo(graphics, subject_bbox, text_bbox, rules, iou_thr=0.3):
+    tbl = CandidateTable.from_items(graphics, kind="logo")
+    tbl.enforce_logo_rules(rules, subject_bbox, text_bbox).nms(iou_thr)
+    return tbl.pick_single(tbl.logo_scores(subject_bbox, text_bbox)), tbl
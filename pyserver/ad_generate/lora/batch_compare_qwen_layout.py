@@ -2,7 +2,8 @@
 """
 postprocess_layout_json.py
 - 광고 레이아웃 JSON(모델 출력)을 후처리:
-  * 텍스트-로고 분리 (IoU>thr → 반대 방향 밀어내기)
+  * 텍스트/로고/추가 요소(subhead, badge, CTA)/background_objects 배치
+    (점유 격자에서 한도를 넘는 요소만 가장 가까운 빈 자리로 이동, occupancy.py)
   * 정렬 스냅 (cx,cy → {0.1,0.5,0.9}, tol 내인 경우)
   * 면적 클램프 (텍스트/로고 스윗스팟 범위로 스케일)
   * AR 제약 (text>=2.0, logo∈[0.8,2.2])
@@ -23,8 +24,11 @@ postprocess_layout_json.py
   python postprocess_layout_json.py --in_json .\_cmp_out\json\lora --out_dir .\_cmp_out\json\lora_pp
 """
 
-import os, json, math, argparse, glob
-from typing import List, Dict, Any, Tuple
+import os, sys, json, math, argparse, glob
+from typing import List, Dict, Any
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))  # ad_generate/
+from occupancy import GRID_RES, OVERLAY_TYPES, OccupancyGrid, place_elements
 
 # =============== geometry utils ===============
 def clip01(v: float) -> float:
@@ -61,18 +65,6 @@ def from_center(cx, cy, w, h):
     y = clip01(cy - h/2.0)
     return clip_box_xywh([x,y,w,h])
 
-def move(b, dx, dy, min_margin=0.0):
-    """중심을 이동. 마진 고려하여 벽에 닿으면 clamp."""
-    x,y,w,h = b
-    cx,cy = center(b)
-    cx = clip01(cx + dx)
-    cy = clip01(cy + dy)
-    x = cx - w/2.0; y = cy - h/2.0
-    # 마진 클램프
-    x = max(min_margin, min(x, 1.0 - min_margin - w))
-    y = max(min_margin, min(y, 1.0 - min_margin - h))
-    return [x,y,w,h]
-
 def snap_to_grid(cx, cy, guides=(0.1,0.5,0.9), tol=0.03):
     def nearest(v):
         g = min(guides, key=lambda g: abs(g - v))
@@ -122,13 +114,6 @@ def ensure_min_margin(b, min_margin) -> List[float]:
     y = max(min_margin, min(y, 1.0 - min_margin - h))
     return [x,y,w,h]
 
-def unit_vec(from_pt, to_pt):
-    dx = to_pt[0] - from_pt[0]
-    dy = to_pt[1] - from_pt[1]
-    n = math.hypot(dx, dy)
-    if n < 1e-6: return (0.0, 0.0)
-    return (dx/n, dy/n)
-
 # =============== JSON helpers ===============
 def load_json(path) -> Dict[str, Any]:
     with open(path, "r", encoding="utf-8") as f:
@@ -151,6 +136,16 @@ def get_logos(js) -> List[Dict[str,Any]]:
     gr = (js.get("layout") or {}).get("graphic_layout") or []
     return [it for it in gr if (it.get("type") or "").lower()=="logo" and isinstance(it.get("bbox"), list) and len(it["bbox"])==4]
 
+def get_overlays(js) -> List[Dict[str,Any]]:
+    """headline/logo 외 추가 오버레이 요소 (subhead, badge, CTA ...)."""
+    lay = js.get("layout") or {}
+    items = (lay.get("nongraphic_layout") or []) + (lay.get("graphic_layout") or [])
+    return [it for it in items if (it.get("type") or "").lower() in OVERLAY_TYPES and isinstance(it.get("bbox"), list) and len(it["bbox"])==4]
+
+def get_background_objects(js) -> List[Dict[str,Any]]:
+    objs = js.get("background_objects") or []
+    return [o for o in objs if isinstance(o, dict) and isinstance(o.get("bbox_hint"), list) and len(o["bbox_hint"])==4]
+
 def get_underlays(js) -> List[Dict[str,Any]]:
     gr = (js.get("layout") or {}).get("graphic_layout") or []
     return [it for it in gr if (it.get("type") or "").lower()=="underlay" and isinstance(it.get("bbox"), list) and len(it["bbox"])==4]
@@ -176,26 +171,7 @@ def subject_boxes(js) -> List[List[float]]:
                     out.append(clip_box_xywh(it["bbox"]))
     return [b for b in out if b]
 
-# =============== pairing & metrics ===============
-def pair_by_nearest(heads: List[Dict[str,Any]], logos: List[Dict[str,Any]]) -> List[Tuple[int,int]]:
-    """headline 인덱스와 가장 가까운 logo 인덱스를 그리디 매칭."""
-    pairs=[]
-    used_logo=set()
-    for hi,h in enumerate(heads):
-        hc = center(clip_box_xywh(h["bbox"]))
-        # 가장 가까운 로고 찾기
-        best, best_d = -1, 1e9
-        for li,l in enumerate(logos):
-            if li in used_logo: continue
-            lc = center(clip_box_xywh(l["bbox"]))
-            d = math.hypot(hc[0]-lc[0], hc[1]-lc[1])
-            if d < best_d:
-                best, best_d = li, d
-        if best>=0:
-            pairs.append((hi, best))
-            used_logo.add(best)
-    return pairs
-
+# =============== metrics ===============
 def ali_score(boxes: List[List[float]], guides=(0.1,0.5,0.9), tol=0.03):
     """정렬 점수: 가이드에 tol 이내로 붙은 축(x 또는 y)이 있으면 1, 아니면 0; 평균."""
     if not boxes: return float("nan")
@@ -210,8 +186,7 @@ def ali_score(boxes: List[List[float]], guides=(0.1,0.5,0.9), tol=0.03):
 # =============== post-process steps ===============
 def postprocess_one(js: Dict[str,Any],
                     iou_thr_tl=0.15,
-                    sep_step=0.01,
-                    sep_iters=60,
+                    grid_res=GRID_RES,
                     guides=(0.1,0.5,0.9),
                     snap_tol=0.03,
                     text_area_range=(0.06,0.16),
@@ -227,11 +202,12 @@ def postprocess_one(js: Dict[str,Any],
 
     heads = get_headlines(js)
     logos = get_logos(js)
+    extras = get_overlays(js)
+    objs  = get_background_objects(js)
     subs  = subject_boxes(js)
 
     # clip
-    for it in heads: set_box(it, clip_box_xywh(it["bbox"]))
-    for it in logos: set_box(it, clip_box_xywh(it["bbox"]))
+    for it in heads + logos + extras: set_box(it, clip_box_xywh(it["bbox"]))
 
     # ------- pre metrics -------
     def cur_metrics():
@@ -289,48 +265,33 @@ def postprocess_one(js: Dict[str,Any],
             set_box(it,b); changed=True
     if changed: log["ops"].append("margin_enforced")
 
-    # ------- 3) text-logo separation (pairwise) -------
-    pairs = pair_by_nearest(heads, logos)
-    for hi, li in pairs:
-        hb = clip_box_xywh(heads[hi]["bbox"])
-        lb = clip_box_xywh(logos[li]["bbox"])
-        if not hb or not lb: continue
-        # 반복 밀어내기
-        iters=0
-        while iou_xywh(hb, lb) > iou_thr_tl and iters < sep_iters:
-            hc = center(hb); lc = center(lb)
-            ux, uy = unit_vec(lc, hc)  # 로고→텍스트 방향 단위벡터
-            # 서로 반대 방향으로 이동
-            hb = move(hb, +sep_step*ux, +sep_step*uy, min_margin=min_margin)
-            lb = move(lb, -sep_step*ux, -sep_step*uy, min_margin=min_margin)
-            iters += 1
-        set_box(heads[hi], hb); set_box(logos[li], lb)
-        if iters>0: log["ops"].append(f"sep_text_logo:{iters}")
-
-    # ------- 4) subject separation -------
-    if subs:
-        subj = subs[0]  # 첫 주제 박스 사용
-        for it in heads:
-            hb = clip_box_xywh(it["bbox"]); iters=0
-            while iou_xywh(hb, subj) > subj_iou_thr and iters < sep_iters:
-                hc = center(hb); sc = center(subj)
-                ux, uy = unit_vec(sc, hc)  # 주제→텍스트 방향
-                hb = move(hb, +sep_step*ux, +sep_step*uy, min_margin=min_margin)
-                iters += 1
-            set_box(it, hb)
-            if iters>0: log["ops"].append(f"sep_text_subject:{iters}")
-        for it in logos:
-            lb = clip_box_xywh(it["bbox"]); iters=0
-            while iou_xywh(lb, subj) > subj_iou_thr and iters < sep_iters:
-                lc = center(lb); sc = center(subj)
-                ux, uy = unit_vec(sc, lc)
-                lb = move(lb, +sep_step*ux, +sep_step*uy, min_margin=min_margin)
-                iters += 1
-            set_box(it, lb)
-            if iters>0: log["ops"].append(f"sep_logo_subject:{iters}")
-
-    # ------- 5) alignment snap -------
-    for it in heads + logos:
+    # ------- 3) occupancy-grid placement (subject / text / logo / objects) -------
+    # 앞쪽 요소 우선: headline → logo → 추가 요소 → background_objects.
+    # 한도(IoU)를 넘는 요소만 현재 중심에서 가장 가까운 빈 자리로 이동.
+    grid = OccupancyGrid(res=grid_res, margin=min_margin)
+    for sb in subs: grid.mark(sb, "subject")
+    overlay_limits = {"subject": subj_iou_thr, "text": iou_thr_tl, "logo": iou_thr_tl}
+    elems = ([("text", it, "bbox") for it in heads] + [("logo", it, "bbox") for it in logos]
+             + [("text", it, "bbox") for it in extras] + [("object", o, "bbox_hint") for o in objs])
+    specs = []
+    for layer, it, key in elems:
+        if layer == "object":
+            # avoid_iou_with: "subject,text_boxes,logo_boxes" (behind_product 소품은 보통 subject 겹침 허용)
+            avoid = str(it.get("avoid_iou_with", "subject,text_boxes,logo_boxes")).lower()
+            limits = {L: iou_thr_tl for L, tag in (("subject","subject"),("text","text"),("logo","logo")) if tag in avoid}
+        else:
+            limits = overlay_limits
+        specs.append({"bbox": clip_box_xywh(it[key]), "layer": layer, "limits": limits})
+    for (layer, it, key), res in zip(elems, place_elements(grid, specs)):
+        if key == "bbox_hint":
+            it["bbox_hint"] = [round(float(v), 6) for v in res["bbox"]]
+        else:
+            set_box(it, res["bbox"])
+        if res["moved"]: log["ops"].append(f"relocate_{(it.get('type') or layer).lower()}")
+        elif not res["placed"]: log["ops"].append(f"no_free_slot_{(it.get('type') or layer).lower()}")
+
+    # ------- 4) alignment snap -------
+    for it in heads + logos + extras:
         b = clip_box_xywh(it["bbox"])
         cx, cy = center(b)
         cx2, cy2 = snap_to_grid(cx, cy, guides=guides, tol=snap_tol)
@@ -340,7 +301,7 @@ def postprocess_one(js: Dict[str,Any],
             set_box(it, b)
             log["ops"].append("snap")
 
-    # ------- 6) optional: underlay sync -------
+    # ------- 5) optional: underlay sync -------
     if update_underlay:
         # headline#k 매칭이 없는 underlay는 가장 IoU 높은 헤드라인을 찾아 bbox를 패딩 확장
         gr = (js.get("layout") or {}).get("graphic_layout") or []
@@ -393,8 +354,7 @@ def main():
     ap.add_argument("--in_json", required=True, help="입력 JSON 파일 또는 디렉토리")
     ap.add_argument("--out_dir", default="", help="출력 폴더(비우면 원본 옆에 .pp.json)")
     ap.add_argument("--iou_thr_tl", type=float, default=0.15)
-    ap.add_argument("--sep_step", type=float, default=0.01)
-    ap.add_argument("--sep_iters", type=int, default=60)
+    ap.add_argument("--grid_res", type=int, default=GRID_RES, help="점유 격자 해상도(한 변 셀 수)")
     ap.add_argument("--guides", default="0.1,0.5,0.9")
     ap.add_argument("--snap_tol", type=float, default=0.03)
     ap.add_argument("--text_area_range", default="0.06,0.16")
@@ -422,8 +382,7 @@ def main():
         js2 = postprocess_one(
             js,
             iou_thr_tl=args.iou_thr_tl,
-            sep_step=args.sep_step,
-            sep_iters=args.sep_iters,
+            grid_res=args.grid_res,
             guides=guides,
             snap_tol=args.snap_tol,
             text_area_range=text_area_range,
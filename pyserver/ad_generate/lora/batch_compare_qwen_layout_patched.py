@@ -35,7 +35,7 @@ Notes
 - If you want LoRA to be deterministic single-shot, set --lora_best_of 1 (default greedy decoding).
 """
 
-import os, json, glob, csv, argparse
+import os, sys, json, glob, csv, argparse
 from dataclasses import dataclass
 from typing import List, Optional, Dict, Any, Tuple
 
@@ -48,6 +48,9 @@ from transformers import Qwen2_5_VLForConditionalGeneration as QwenVL
 from peft import PeftModel, get_peft_model_state_dict
 from qwen_vl_utils import process_vision_info
 
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))  # ad_generate/
+from energy_search import marginal_quantiles
+
 # ----------------- I/O utils -----------------
 def ensure_dir(p: str) -> None:
     os.makedirs(p, exist_ok=True)
@@ -133,19 +136,10 @@ def window_energy_safe(energy: np.ndarray, b: Optional[List[float]]) -> float:
         return -1.0
 
 def subject_from_energy(energy: np.ndarray, q_low=0.15, q_high=0.85) -> List[float]:
+    """에너지 행/열 합(marginal)의 누적합으로 15~85% 분위 박스. O(HW) 시간, O(H+W) 메모리."""
     H, W = energy.shape
-    yy, xx = np.mgrid[0:H, 0:W]
-    w = energy + 1e-6
-    w = w / w.sum()
-    x_flat = xx.flatten(); y_flat = yy.flatten(); w_flat = w.flatten()
-    order_x = np.argsort(x_flat)
-    order_y = np.argsort(y_flat)
-    cdf_x = np.cumsum(w_flat[order_x])
-    cdf_y = np.cumsum(w_flat[order_y])
-    x_lo = x_flat[order_x][np.searchsorted(cdf_x, q_low)]
-    x_hi = x_flat[order_x][np.searchsorted(cdf_x, q_high)]
-    y_lo = y_flat[order_y][np.searchsorted(cdf_y, q_low)]
-    y_hi = y_flat[order_y][np.searchsorted(cdf_y, q_high)]
+    x_lo, x_hi = marginal_quantiles(energy.sum(axis=0, dtype=np.float64) + 1e-6*H, q_low, q_high)
+    y_lo, y_hi = marginal_quantiles(energy.sum(axis=1, dtype=np.float64) + 1e-6*W, q_low, q_high)
     x = x_lo / W; y = y_lo / H
     w_box = max(2 / W, (x_hi - x_lo) / W)
     h_box = max(2 / H, (y_hi - y_lo) / H)
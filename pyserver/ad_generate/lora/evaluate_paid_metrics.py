@@ -367,3 +367,6 @@ def main():
         echo(f"\n=== MODEL: {r['model']} ===")
         for k in metrics:
             echo(f"{k:>10}: mean={r.get(f'{k}_mean','')}  std={r.get(f'{k}_std','')}")
+
+if __name__ == "__main__":
+    main()
@@ -6,63 +6,92 @@ import os
 import sys
 import io
 import json
+import time
 import argparse
+import tempfile
+import queue
+import threading
 import numpy as np
-from PIL import Image, ImageFilter, ImageDraw
-from typing import List
+from PIL import Image
 
 # Google Gen AI SDK
-from google import genai
 from google.genai.types import GenerateContentConfig, Modality
 
-def get_reserved_rects_px(meta: dict, out_w: int, out_h: int):
+from genai_cassette import BACKENDS, make_backend
+from genai_pool import ClientConfigError, call_with_retry, get_client
+from image_analysis import busy_rect_scores, busy_scores
+from roi_filters import blur_rects
+from upload_policy import FORMATS, SUBSAMPLING, UploadPolicy
+
+POLL_SEC = 0.5  # 후보별 타임아웃 / hedge 확인 주기
+LATENCY_HISTORY = os.getenv("NANO_LATENCY_HISTORY", os.path.join(tempfile.gettempdir(), "nano_latency.json"))
+LATENCY_KEEP = 100  # 최근 N개 생성 지연만 유지
+HEDGE_AFTER_DEFAULT = float(os.getenv("NANO_HEDGE_AFTER", "10"))  # 지연 히스토리가 없을 때(새 호스트) hedge 기준(초)
+
+def load_latencies(path=LATENCY_HISTORY):
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return [float(v) for v in json.load(f)][-LATENCY_KEEP:]
+    except Exception:
+        return []
+
+def save_latencies(new, path=LATENCY_HISTORY):
+    if not new: return
+    try:
+        hist = (load_latencies(path) + list(new))[-LATENCY_KEEP:]
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(hist, f)
+        os.replace(tmp, path)
+    except Exception as e:
+        print(f"latency history save failed: {e}")
+
+def p50_latency(path=LATENCY_HISTORY):
+    hist = load_latencies(path)
+    return float(np.median(hist)) if hist else 0.0
+
+def get_reserved_rects_norm(meta: dict):
+    """text / graphic bbox → 정규화 (x1,y1,x2,y2) 리스트 (기존 규약대로 bbox 값을 그대로 모서리로 사용)."""
     rects = []
     layout = meta.get("layout", {}) or {}
     ng = layout.get("nongraphic_layout", []) or []
     gg = layout.get("graphic_layout", []) or []
+    for t in list(ng) + list(gg):
+        b = t.get("bbox")
+        if isinstance(b, list) and len(b) == 4:
+            rects.append(tuple(float(v) for v in b))
+    return rects
 
-    def n2p(b):
+def get_reserved_rects_px(meta: dict, out_w: int, out_h: int):
+    rects = []
+    for b in get_reserved_rects_norm(meta):
         x1 = int(np.clip(b[0], 0, 1) * out_w)
         y1 = int(np.clip(b[1], 0, 1) * out_h)
         x2 = int(np.clip(b[2], 0, 1) * out_w)
         y2 = int(np.clip(b[3], 0, 1) * out_h)
         if x2 < x1: x1, x2 = x2, x1
         if y2 < y1: y1, y2 = y2, y1
-        return (x1, y1, x2, y2)
-
-    for t in ng:
-        b = t.get("bbox")
-        if isinstance(b, list) and len(b) == 4:
-            rects.append(n2p(b))
-    for g in gg:
-        b = g.get("bbox")
-        if isinstance(b, list) and len(b) == 4:
-            rects.append(n2p(b))
+        rects.append((x1, y1, x2, y2))
     return rects
 
-def rect_busy_score(img: Image.Image, rects_px):
-    if not rects_px:
-        return 0.0
-    g = img.convert("L")
-    a = np.asarray(g, dtype=np.float32) / 255.0
-    k = np.array([[0, 1, 0], [1,-4, 1], [0, 1, 0]], dtype=np.float32)
-    pad = np.pad(a, ((1,1),(1,1)), mode="reflect")
-    conv = (k[0,0]*pad[:-2, :-2] + k[0,1]*pad[:-2,1:-1] + k[0,2]*pad[:-2,2:] +
-            k[1,0]*pad[1:-1, :-2] + k[1,1]*pad[1:-1,1:-1] + k[1,2]*pad[1:-1,2:] +
-            k[2,0]*pad[2:, :-2] + k[2,1]*pad[2:,1:-1] + k[2,2]*pad[2:,2:])
-    conv = np.abs(conv)
-
-    vals = []
-    h, w = a.shape
-    for (x1,y1,x2,y2) in rects_px:
-        x1 = np.clip(x1, 0, w-1); x2 = np.clip(x2, 0, w-1)
-        y1 = np.clip(y1, 0, h-1); y2 = np.clip(y2, 0, h-1)
-        if x2 <= x1 or y2 <= y1: continue
-        patch = conv[y1:y2, x1:x2]
-        if patch.size == 0: continue
-        vals.append(float(patch.mean()))
-    if not vals: return 0.0
-    return float(np.mean(vals))
+def score_candidates(images, rects_norm, max_side=None, agg="mean"):
+    """
+    후보 여러 장을 한 번에 채점. 반환: (후보별 busy_score N, rect별 점수 N x R)
+    같은 분석 해상도의 후보는 한 배열로 묶어 Laplacian / 적분 영상을 한 번에 계산.
+    """
+    per_rect = busy_rect_scores(images, rects_norm, max_side=max_side)
+    return busy_scores(per_rect, agg=agg), per_rect
+
+def score_arrivals(arrivals, rects_norm, args):
+    """도착한 후보 [(idx, img, elapsed_s)]를 한 번에 채점하고 로그. 반환: [(busy_score, idx, img)] (도착 순)."""
+    if not arrivals: return []
+    sc, per_rect = score_candidates([a[1] for a in arrivals], rects_norm, max_side=args.busy_side or None, agg=args.busy_agg)
+    out = []
+    for (i, imgc, elapsed), s, pr in zip(arrivals, sc, per_rect):
+        rect_s = " ".join("-" if np.isnan(v) else f"{v:.3f}" for v in pr)
+        print(f"   candidate#{i+1} busy_score={float(s):.4f} rects=[{rect_s}] ({elapsed:.1f}s)")
+        out.append((float(s), i, imgc))
+    return out
 
 def load_mask(mask_path: str, size):
     m = Image.open(mask_path).convert("L").resize(size, Image.LANCZOS)
@@ -75,14 +104,8 @@ def composite_product(original_rgb: Image.Image, generated_rgb: Image.Image, pro
 
 def soften_reserved_areas(img: Image.Image, rects_px, radius=2):
     if not rects_px: return img
-    base = img.copy()
-    blurred = img.filter(ImageFilter.GaussianBlur(radius=radius))
-    m = Image.new("L", img.size, 0)
-    dr = ImageDraw.Draw(m)
-    for (x1,y1,x2,y2) in rects_px:
-        dr.rectangle([x1,y1,x2,y2], fill=255)
-    m = m.filter(ImageFilter.GaussianBlur(radius=1.5))
-    return Image.composite(blurred, base, m)
+    # rect 주변 패딩 타일만 블러 + 페더 마스크 합성 (roi_filters)
+    return blur_rects(img, rects_px, radius=radius, feather=1.5)
 
 def pil_from_response(resp):
     cand = getattr(resp, "candidates", None)
@@ -97,74 +120,173 @@ def pil_from_response(resp):
                 return Image.open(io.BytesIO(data)).convert("RGB")
     return None
 
-def generate_one(client, model, prompt_text, pil_img, cfg):
-    resp = client.models.generate_content(model=model, contents=[prompt_text, pil_img], config=cfg)
+def generate_one(client, model, prompt_text, payload, cfg):
+    # 호스트 공유 리미터(요청/분, 이미지/분) 토큰을 받은 뒤 호출, 429/5xx는 백오프 후 재시도
+    # payload: upload_policy.UploadPayload (인코딩 1회, Part 재사용)
+    n_img = int(getattr(cfg, "candidate_count", None) or 1)
+    part = payload.part()
+    resp = call_with_retry(
+        lambda: client.models.generate_content(model=model, contents=[prompt_text, part], config=cfg),
+        images=n_img, label="Nano")
     return pil_from_response(resp)
 
-def choose_best_candidate(client, model, prompt_text, input_img_rgb, out_path, meta, args, cfg):
-    work_img = resize_max_side(input_img_rgb, args.internal_side)
+def iter_generated(backend, model, prompt_text, payload, cfg, n, concurrency=0, timeout=0,
+                   hedge=0, hedge_after=0.0, latencies=None):
+    """
+    후보 n개를 동시에 요청하고 도착하는 순서대로 (idx, img, elapsed_s)를 yield.
+    backend: genai_cassette 백엔드 (live / record / replay / synthetic)
+    payload: 인코딩된 요청 이미지 (모든 후보가 같은 바이트를 공유)
+    concurrency: 동시 요청(in-flight) 상한 (0 → n). 슬롯은 소비자 쪽에서 관리 —
+                 완료 / 실패 / 타임아웃된 후보의 슬롯을 돌려받아 대기 후보를 시작.
+    timeout: 후보당 제한 시간(초, 요청 시작 기준; 0 → 무제한). 초과한 후보는 버리고 슬롯을 반환.
+             아직 시작 못 한 후보는 전체 마감(timeout x 슬롯 회차 수)을 넘기면 버림.
+    hedge / hedge_after: hedge_after초가 지나도록 한 장도 도착하지 않으면 후보를 hedge개까지 추가 요청
+                         (in-flight 상한과 별도).
+    latencies: 리스트를 주면 완료된 요청의 지연(초)을 덧붙임.
+    실패/빈 응답 후보는 로그만 남기고 건너뜀. 소비자가 중간에 멈추면(race) 대기 중인 요청은 보내지 않고
+    이미 나간 요청은 무시. 워커는 daemon 스레드라 무시된 요청이 프로세스 종료를 붙잡지 않음.
+    """
+    limit = max(1, min(n, concurrency or n))
+    results = queue.Queue()
+    started = {}
+    waiting = list(range(n))  # 아직 보내지 않은 후보
+    running = set()           # 슬롯을 차지한 후보
+
+    def _run(i):
+        try:
+            results.put((i, backend.generate(model, prompt_text, payload, cfg), None))
+        except Exception as e:
+            results.put((i, None, e))
+
+    def _spawn(i, limited=True):
+        started[i] = time.monotonic()
+        if limited: running.add(i)
+        threading.Thread(target=_run, args=(i,), daemon=True).start()
+
+    def _fill():
+        while waiting and len(running) < limit:
+            _spawn(waiting.pop(0))
+
+    t0 = time.monotonic()
+    _fill()
+    pending = set(range(n))
+    deadline = t0 + timeout * -(-n // limit) if timeout else None
+    got_any = False
+    hedged = 0
+    poll = min(POLL_SEC, timeout or POLL_SEC) if (timeout or (hedge and hedge_after > 0)) else None
+    try:
+        while pending:
+            try:
+                i, img, err = results.get(timeout=poll)
+            except queue.Empty:
+                i = None
+            if i is not None and i in pending:
+                pending.discard(i); running.discard(i)
+                _fill()
+                if err is not None:
+                    print(f"Generate Error (candidate {i+1}): {err}")
+                else:
+                    if latencies is not None:
+                        latencies.append(time.monotonic() - started[i])
+                    if img is not None:
+                        got_any = True
+                        yield i, img, time.monotonic() - started[i]
+            now = time.monotonic()
+            if timeout:
+                expired = {k for k in pending if k in started and now - started[k] > timeout}
+                for k in sorted(expired):
+                    print(f"Generate Timeout (candidate {k+1}): > {timeout:g}s")
+                pending -= expired; running -= expired
+                if waiting and now > deadline:
+                    print(f"Generate Timeout: {len(waiting)} candidate(s) not started within {deadline - t0:g}s")
+                    pending -= set(waiting); waiting.clear()
+                _fill()
+            if hedge and hedge_after > 0 and not got_any and hedged < hedge and now - t0 > hedge_after:
+                k = n + hedged; hedged += 1
+                print(f"   hedging: no candidate after {hedge_after:.1f}s -> extra request #{k+1}")
+                _spawn(k, limited=False); pending.add(k)
+    finally:
+        in_flight = pending - set(waiting)
+        if in_flight: print(f"   ignoring {len(in_flight)} request(s) still pending")
+
+def choose_best_candidate(backend, model, prompt_text, input_img_rgb, out_path, meta, args, cfg, upload_img=None):
+    # 요청 이미지는 한 번만 인코딩해 모든 후보 / 재시도에 재사용
+    policy = UploadPolicy(fmt=args.upload_format, quality=args.upload_quality,
+                          max_side=args.upload_side or args.internal_side,
+                          subsampling=args.upload_subsampling, color=args.upload_color)
+    # upload_img: 디코드 원본(알파 / ICC 유지) — 색 처리는 정책이 담당
+    payload = policy.prepare(upload_img if upload_img is not None else input_img_rgb)
+    print(f"   upload: {payload.describe()}")
     best = None
     best_score = 1e9
-    rects_px = []
+    rects_norm = get_reserved_rects_norm(meta)
+    concurrency = args.concurrency or args.candidates
+    # race: busy_threshold보다 race_margin 이상 낮은 후보가 오면 즉시 채택 (나머지 요청은 무시)
+    good_enough = args.busy_threshold - args.race_margin if args.race else None
+    hist_p50 = p50_latency()
+    hedge_after = args.hedge_after or hist_p50 or HEDGE_AFTER_DEFAULT
+    latencies = []
 
     for round_idx in range(max(1, args.max_retries)):
-        candidates = []
-        for i in range(args.candidates):
-            print(f"... generating candidate {i+1}/{args.candidates} (round {round_idx+1}) ...")
-            try:
-                cand_img = generate_one(client, model, prompt_text, work_img, cfg)
-            except Exception as e:
-                print(f"Generate Error: {e}")
-                continue
-                
-            if cand_img is None: continue
-            
-            # (옵션) 후보 이미지 저장 - 디버깅용
-            # root, ext = os.path.splitext(out_path)
-            # cand_path = f"{root}_cand{i+1}_r{round_idx+1}.png"
-            # cand_img.save(cand_path)
-            
-            candidates.append(cand_img)
-
-        if not candidates: continue
-
-        rects_px = get_reserved_rects_px(meta, candidates[0].width, candidates[0].height)
+        print(f"... generating {args.candidates} candidates (round {round_idx+1}, in-flight <= {concurrency}) ...")
         survivors = []
-        for i, imgc in enumerate(candidates):
-            sc = rect_busy_score(imgc, rects_px)
-            print(f"   candidate#{i+1} busy_score={sc:.4f}")
+        # race면 도착하는 대로 1장씩 채점, 아니면 모두 도착한 뒤 한 번에 채점 (N x R 배치, reserved 영역은 후보 해상도 기준)
+        scored, arrived = [], []
+        for i, imgc, elapsed in iter_generated(backend, model, prompt_text, payload, cfg, args.candidates,
+                                               concurrency=concurrency, timeout=args.candidate_timeout,
+                                               hedge=args.hedge, hedge_after=hedge_after, latencies=latencies):
+            if good_enough is None:
+                arrived.append((i, imgc, elapsed))
+                continue
+            scored += score_arrivals([(i, imgc, elapsed)], rects_norm, args)
+            if scored[-1][0] <= good_enough:
+                print(f"   race: candidate#{i+1} clears {good_enough:.4f}; stop waiting")
+                break
+        scored += score_arrivals(arrived, rects_norm, args)
+        for sc, i, imgc in scored:
             if sc <= args.busy_threshold:
-                survivors.append((sc, imgc, i))
+                survivors.append((sc, i, imgc))
             if sc < best_score:
-                best_score = sc
-                best = imgc
+                best_score, best = sc, imgc
 
         if survivors:
-            survivors.sort(key=lambda x: x[0])
-            best_score, best, best_idx = survivors[0]
+            survivors.sort(key=lambda x: (x[0], x[1]))
+            best_score, best_idx, best = survivors[0]
             print(f" -> picked candidate#{best_idx+1} with busy_score={best_score:.4f}")
             break
         else:
             print("   no survivor under threshold; retrying...")
 
+    save_latencies(latencies)
+    report_upload(payload, latencies, hist_p50, args.upload_report)
     if best is None:
         raise RuntimeError("No image could be generated.")
 
     if best_score > args.busy_threshold and args.post_blur_reserved:
         print(f" busy_score {best_score:.4f} > threshold; softening reserved areas...")
-        best = soften_reserved_areas(best, rects_px, radius=2)
+        best = soften_reserved_areas(best, get_reserved_rects_px(meta, best.width, best.height), radius=2)
 
     return best
 
-def resize_max_side(img: Image.Image, max_side: int = 1024) -> Image.Image:
-    w, h = img.size
-    if max(w, h) <= max_side: return img
-    if w >= h:
-        nh = int(h * max_side / w)
-        return img.resize((max_side, nh), Image.LANCZOS)
-    else:
-        nw = int(w * max_side / h)
-        return img.resize((nw, max_side), Image.LANCZOS)
+def report_upload(payload, latencies, hist_p50, path=None):
+    """업로드 크기와 이번 실행의 요청 지연 요약 (path가 있으면 JSON으로도 저장)."""
+    run_p50 = float(np.median(latencies)) if latencies else 0.0
+    w, h = payload.size
+    rep = {
+        "format": payload.fmt, "quality": payload.quality, "size": [w, h],
+        "bytes": payload.nbytes, "raw_bytes": w*h*3, "encode_ms": round(payload.encode_s*1000, 1),
+        "requests": len(latencies), "latencies_s": [round(v, 3) for v in latencies],
+        "p50_s": round(run_p50, 3), "history_p50_s": round(hist_p50, 3),
+    }
+    print(f"   upload stats: {payload.nbytes/1024:.1f} KB x {len(latencies)} request(s), "
+          f"p50 {run_p50:.1f}s (history p50 {hist_p50:.1f}s)")
+    if path:
+        try:
+            with open(path, "w", encoding="utf-8") as f:
+                json.dump(rep, f, indent=2)
+        except Exception as e:
+            print(f"upload report save failed: {e}")
+    return rep
 
 def build_prompt(meta: dict) -> str:
     product = meta.get("product", {})
@@ -260,38 +382,69 @@ def main():
     ap.add_argument("--image", required=True)
     ap.add_argument("--layout_json", required=True)
     ap.add_argument("--out", default="stage3_output.png")
-    ap.add_argument("--max_side", type=int, default=1024)
+    ap.add_argument("--max_side", type=int, default=1024, help="(미사용, 호환용) 업로드 해상도는 --upload_side")
     ap.add_argument("--model", default="gemini-2.0-flash-exp") # 모델명 기본값 수정
     ap.add_argument("--internal_side", type=int, default=1536)
+    # 업로드 정책 (upload_policy 참고)
+    ap.add_argument("--upload_format", choices=list(FORMATS), default="jpeg")
+    ap.add_argument("--upload_quality", type=int, default=85)
+    ap.add_argument("--upload_side", type=int, default=0, help="업로드 긴 변 상한 (0 → --internal_side)")
+    ap.add_argument("--upload_subsampling", choices=list(SUBSAMPLING), default="4:2:0")
+    ap.add_argument("--upload_color", choices=["srgb", "strip"], default="srgb",
+                    help="ICC 프로파일: sRGB로 변환 / 그냥 제거")
+    ap.add_argument("--upload_report", default=None, help="업로드 크기 / 지연 요약 JSON 경로")
     ap.add_argument("--candidates", type=int, default=4)
+    ap.add_argument("--concurrency", type=int, default=0, help="동시 요청 상한 (0 → candidates 전부 동시)")
+    ap.add_argument("--candidate_timeout", type=float, default=180.0, help="후보당 제한 시간(초, 0 → 무제한)")
+    ap.add_argument("--race", action="store_true", help="busy_threshold - race_margin 이하 후보가 오면 즉시 채택")
+    ap.add_argument("--race_margin", type=float, default=0.02)
+    ap.add_argument("--hedge", type=int, default=0, help="첫 후보가 늦으면 추가로 보낼 요청 수")
+    ap.add_argument("--hedge_after", type=float, default=0.0, help="hedge 기준 시간(초, 0 → 최근 생성 지연 p50, 히스토리 없으면 NANO_HEDGE_AFTER)")
     ap.add_argument("--max_retries", type=int, default=1)
     ap.add_argument("--busy_threshold", type=float, default=0.12)
+    ap.add_argument("--busy_side", type=int, default=0,
+                    help="busy_score 분석 해상도 상한 (0 → 후보 원본 해상도; threshold는 해상도에 따라 달라짐)")
+    ap.add_argument("--busy_agg", choices=["mean", "max"], default="mean",
+                    help="rect별 점수 집계: 평균 / 가장 복잡한 rect")
     ap.add_argument("--mask", default=None)
     ap.add_argument("--post_blur_reserved", action="store_true")
+    # 생성 백엔드 (오프라인 벤치마크 / 회귀 테스트용, genai_cassette 참고)
+    ap.add_argument("--backend", choices=BACKENDS, default=os.getenv("NANO_BACKEND", "live"))
+    ap.add_argument("--cassette", default=os.getenv("NANO_CASSETTE"), help="record / replay 카세트 디렉터리")
+    ap.add_argument("--cassette_miss", choices=["error", "any"], default="error",
+                    help="replay에서 요청 해시가 없을 때: 실패 / 카세트 응답 아무거나 순서대로")
+    ap.add_argument("--replay_latency", choices=["none", "recorded", "sample"], default="recorded")
+    ap.add_argument("--latency_scale", type=float, default=1.0, help="replay 지연 배율")
+    ap.add_argument("--synthetic_delay", type=float, default=2.0, help="synthetic 지연 중앙값(초)")
+    ap.add_argument("--synthetic_jitter", type=float, default=0.3, help="synthetic 지연 로그정규 sigma")
+    ap.add_argument("--synthetic_detail", type=float, default=0.02, help="synthetic 배경 노이즈 세기(0..1)")
+    ap.add_argument("--seed", type=int, default=0)
 
     args = ap.parse_args()
 
-    # ★★★ API Key 인증 방식 우선 적용 (RunPod용) ★★★
-    api_key = os.environ.get("GEMINI_API_KEY")
-
-    if api_key:
-        print(f"--- [Nano] Using GEMINI_API_KEY mode ---")
-        client = genai.Client(api_key=api_key)
-    else:
-        # 기존 Vertex AI 방식 (로컬 개발용 or 인증 파일이 있을 때)
-        print(f"--- [Nano] Using Vertex AI mode (Checking env vars...) ---")
-        need_vars = ["GOOGLE_CLOUD_PROJECT", "GOOGLE_CLOUD_LOCATION", "GOOGLE_GENAI_USE_VERTEXAI"]
-        missing = [v for v in need_vars if not os.environ.get(v)]
-        if missing:
-            print(f"ERROR: Missing API Key OR Vertex Env Vars: {', '.join(missing)}")
-            print("Please set GEMINI_API_KEY in RunPod environment variables.")
-            sys.exit(1)
-            
-        client = genai.Client(
-            vertexai=True,
-            project=os.environ["GOOGLE_CLOUD_PROJECT"],
-            location=os.getenv("GOOGLE_CLOUD_LOCATION", "global"),
+    # ★★★ API Key 인증 방식 우선 적용 (RunPod용), 없으면 Vertex AI ★★★
+    # 클라이언트는 프로세스당 1개 (genai_pool) — 후보 스레드들이 커넥션을 공유
+    # replay / synthetic 백엔드는 클라이언트를 만들지 않음 (인증·네트워크 불필요)
+    def live_factory():
+        client = get_client()
+        return lambda model, prompt_text, payload, cfg: generate_one(client, model, prompt_text, payload, cfg)
+
+    try:
+        backend = make_backend(
+            args.backend, live_factory=live_factory, cassette=args.cassette, on_miss=args.cassette_miss,
+            replay_latency=args.replay_latency, latency_scale=args.latency_scale,
+            synthetic_delay=args.synthetic_delay, synthetic_jitter=args.synthetic_jitter,
+            synthetic_detail=args.synthetic_detail, seed=args.seed,
         )
+    except ClientConfigError as e:
+        print(f"ERROR: {e}")
+        print("Please set GEMINI_API_KEY in RunPod environment variables.")
+        sys.exit(1)
+    except (ValueError, KeyError) as e:
+        print(f"Backend init failed: {e}")
+        sys.exit(1)
+    if args.backend != "live":
+        print(f"--- [Nano] backend={args.backend} cassette={args.cassette} ---")
 
     # 입력 로드
     try:
@@ -302,13 +455,14 @@ def main():
         sys.exit(1)
 
     try:
-        img = Image.open(args.image).convert("RGB")
+        src_img = Image.open(args.image)
+        src_img.load()
+        img = src_img.convert("RGB")
     except Exception as e:
         print(f"Image load failed: {e}")
         sys.exit(1)
 
     original_rgb = img.copy()
-    img = resize_max_side(img, args.max_side)
     
     prompt_text = build_prompt(meta)
 
@@ -320,14 +474,15 @@ def main():
     print(f"... Requesting '{args.model}' ...")
     try:
         best_img = choose_best_candidate(
-            client=client,
+            backend=backend,
             model=args.model,
             prompt_text=prompt_text,
             input_img_rgb=original_rgb,
             out_path=args.out,
             meta=meta,
             args=args,
-            cfg=cfg
+            cfg=cfg,
+            upload_img=src_img,
         )
     except Exception as e:
         print(f"Generation Failed: {e}")
@@ -0,0 +1,224 @@
+# -*- coding: utf-8 -*-
+"""
+occupancy.py
+정규화 캔버스를 래스터 격자로 두고 N개 오버레이 요소(headline, subhead, badge, CTA, logo,
+background_objects ...)를 순서대로 배치하는 엔진.
+
+- 레이어별 점유 격자(subject / text / logo / object / 사용자 정의)를 유지
+- 후보 위치 전체의 레이어별 IoU(한도) / 점유율(비용)을 적분 영상으로 한 번에 조회 (격자 크기에 선형)
+  IoU = 교집합 / (요소 면적 + 레이어 점유 면적 - 교집합) — 레이어에 박스가 하나면 박스 간 IoU와 같음
+- 요소 1개 배치 = 적분 영상 갱신 O(G) + 벡터 조회 O(G) → 요소 수에 선형
+  (쌍별 IoU + 0.01 스텝 밀어내기 반복의 제곱 비용 대체)
+
+좌표: bbox는 [x,y,w,h] (정규화 0..1).
+의존: numpy
+"""
+
+import math
+
+import numpy as np
+
+from energy_search import clip_bbox, integral_image, rect_sums
+
+GRID_RES = 128          # 격자 한 변 셀 수 (1셀 ≈ 0.008)
+ANCHOR_WEIGHT = 1.0     # 선호 위치(기존 중심)에서 멀어지는 거리 비용
+OVERLAY_TYPES = ("subhead", "badge", "cta", "button", "caption")  # headline 외 추가 텍스트 요소
+
+# 요소 타입 → 점유 레이어
+LAYER_OF = {"headline": "text", "logo": "logo", "subject": "subject", "object": "object"}
+for _t in OVERLAY_TYPES:
+    LAYER_OF[_t] = "text"
+
+class OccupancyGrid:
+    """
+    레이어별 점유율 격자. mark()로 채우고 best_position()으로 빈 자리를 찾음.
+    margin: 캔버스 가장자리 여백 (후보 위치 범위를 제한).
+    """
+
+    def __init__(self, res=GRID_RES, margin=0.0):
+        self.res = int(res)
+        self.margin = float(margin)
+        self.layers = {}
+        self._ii = {}
+
+    # ----- raster -----
+    def _cells(self, b):
+        """bbox → 덮는 셀 범위 [x0,x1) x [y0,y1) (부분 셀 포함)."""
+        n = self.res
+        x, y, w, h = map(float, b)
+        x0 = min(max(int(math.floor(x*n)), 0), n); x1 = min(max(int(math.ceil((x+w)*n)), 0), n)
+        y0 = min(max(int(math.floor(y*n)), 0), n); y1 = min(max(int(math.ceil((y+h)*n)), 0), n)
+        return x0, y0, x1, y1
+
+    def layer(self, name):
+        g = self.layers.get(name)
+        if g is None:
+            g = self.layers[name] = np.zeros((self.res, self.res), dtype=np.float32)
+        return g
+
+    def mark(self, bbox, layer, value=1.0):
+        if not bbox: return
+        x0, y0, x1, y1 = self._cells(bbox)
+        if x1 <= x0 or y1 <= y0: return
+        g = self.layer(layer)
+        np.maximum(g[y0:y1, x0:x1], value, out=g[y0:y1, x0:x1])
+        self._ii.pop(layer, None)
+
+    def integral(self, name):
+        ii = self._ii.get(name)
+        if ii is None:
+            ii = self._ii[name] = integral_image(self.layer(name))
+        return ii
+
+    # ----- queries -----
+    def coverage(self, bbox, layer):
+        """bbox 하나가 layer를 덮는 비율 (0..1, 교집합 / 요소 면적)."""
+        if layer not in self.layers: return 0.0
+        x0, y0, x1, y1 = self._cells(bbox)
+        if x1 <= x0 or y1 <= y0: return 0.0
+        return float(rect_sums(self.integral(layer), x0, y0, x1, y1) / ((x1-x0)*(y1-y0)))
+
+    def iou(self, bbox, layer):
+        """bbox 하나와 layer 점유 영역의 IoU (0..1)."""
+        if layer not in self.layers: return 0.0
+        x0, y0, x1, y1 = self._cells(bbox)
+        if x1 <= x0 or y1 <= y0: return 0.0
+        ii = self.integral(layer)
+        inter = float(rect_sums(ii, x0, y0, x1, y1))
+        union = (x1-x0)*(y1-y0) + float(ii[-1, -1]) - inter
+        return inter / union if union > 0 else 0.0
+
+    def fits(self, bbox, limits):
+        """limits: {layer: 허용 IoU}. 모든 레이어가 한도 이하면 True."""
+        return all(self.iou(bbox, L) <= lim for L, lim in limits.items())
+
+    def best_position(self, w, h, limits, anchor=None, anchor_weight=ANCHOR_WEIGHT, costs=None):
+        """
+        (w,h) 요소를 둘 수 있는 모든 셀 위치를 한 번에 평가.
+        limits: {layer: 허용 IoU} (hard) / costs: {layer: 가중치} (soft, 점유율 x 가중치)
+        anchor: 선호 중심 (cx,cy). 없으면 점유/비용만으로 선택.
+        반환: (bbox, cost) 또는 None (한도 내 자리가 없음)
+        """
+        n = self.res
+        wc = max(1, int(math.ceil(w*n))); hc = max(1, int(math.ceil(h*n)))
+        m = int(math.ceil(self.margin*n))
+        xs = np.arange(m, n - m - wc + 1); ys = np.arange(m, n - m - hc + 1)
+        if len(xs) == 0 or len(ys) == 0:
+            return None
+        X0 = xs[None, :]; Y0 = ys[:, None]
+        X1 = X0 + wc; Y1 = Y0 + hc
+        area = float(wc*hc)
+        ok = np.ones((len(ys), len(xs)), dtype=bool)
+        cost = np.zeros((len(ys), len(xs)), dtype=np.float64)
+        for L, lim in (limits or {}).items():
+            if L not in self.layers: continue
+            ii = self.integral(L)
+            inter = rect_sums(ii, X0, Y0, X1, Y1)
+            ok &= inter / np.maximum(area + float(ii[-1, -1]) - inter, 1e-9) <= lim + 1e-9
+        for L, wt in (costs or {}).items():
+            if L not in self.layers: continue
+            cost = cost + wt * rect_sums(self.integral(L), X0, Y0, X1, Y1) / area
+        if anchor is not None:
+            cx = (X0 + wc/2.0) / n; cy = (Y0 + hc/2.0) / n
+            cost = cost + anchor_weight * np.hypot(cx - anchor[0], cy - anchor[1])
+        if not ok.any():
+            return None
+        cost = np.where(ok, cost, np.inf)
+        r, c = np.unravel_index(int(np.argmin(cost)), cost.shape)
+        # 격자에 정렬된 좌상단 + 원래 크기 유지
+        x = min(max(xs[c]/n, self.margin), 1.0 - self.margin - w)
+        y = min(max(ys[r]/n, self.margin), 1.0 - self.margin - h)
+        return [float(x), float(y), float(w), float(h)], float(cost[r, c])
+
+# ---------------------------
+# Greedy placement
+# ---------------------------
+def place_elements(grid, elements, keep_if_fits=True, mark_unplaced=True):
+    """
+    elements를 순서대로(앞쪽 우선) 배치하고 grid에 점유를 기록.
+    element: {
+      "bbox": [x,y,w,h] (현재/제안 위치, 크기의 기준),
+      "layer": 점유 레이어 이름,
+      "limits": {layer: 허용 IoU},
+      "costs": {layer: 가중치} (선택),
+      "sizes": [(w,h), ...] (선택; 기본은 bbox 크기 하나),
+    }
+    keep_if_fits: 현재 위치가 한도를 만족하면 그대로 둠(최소 변경).
+    mark_unplaced: 자리가 없는 요소도 원래 위치로 점유 기록 (요소를 버릴 호출자는 False).
+    반환: 요소별 {"bbox", "moved", "placed"} — 자리가 없으면 원래 bbox 유지, placed=False.
+    """
+    out = []
+    for el in elements:
+        b = clip_bbox(el["bbox"])
+        limits = el.get("limits", {})
+        if keep_if_fits and grid.fits(b, limits):
+            grid.mark(b, el["layer"])
+            out.append({"bbox": b, "moved": False, "placed": True})
+            continue
+        anchor = (b[0] + b[2]/2.0, b[1] + b[3]/2.0)
+        best = None
+        for w, h in el.get("sizes") or [(b[2], b[3])]:
+            r = grid.best_position(w, h, limits, anchor=anchor, costs=el.get("costs"))
+            if r is not None and (best is None or r[1] < best[1]):
+                best = r
+        if best is None:
+            if mark_unplaced: grid.mark(b, el["layer"])
+            out.append({"bbox": b, "moved": False, "placed": False})
+            continue
+        grid.mark(best[0], el["layer"])
+        out.append({"bbox": best[0], "moved": True, "placed": True})
+    return out
+
+# ---------------------------
+# Layout helpers (qwen_logic / qwen25_vl_layout_hybrid)
+# ---------------------------
+def _valid_bbox(b):
+    return isinstance(b, list) and len(b) == 4
+
+def layout_grid(layout, subject_bbox, margin, res=GRID_RES):
+    """확정된 layout(subject, nongraphic, graphic)을 점유 격자로. underlay는 text 레이어."""
+    grid = OccupancyGrid(res=res, margin=margin)
+    if subject_bbox: grid.mark(subject_bbox, "subject")
+    for t in layout.get("nongraphic_layout") or []:
+        if _valid_bbox(t.get("bbox")):
+            grid.mark(t["bbox"], LAYER_OF.get(str(t.get("type", "")).lower(), "text"))
+    for g in layout.get("graphic_layout") or []:
+        if _valid_bbox(g.get("bbox")):
+            grid.mark(g["bbox"], "logo" if g.get("type") == "logo" else "text")
+    return grid
+
+def place_overlay_extras(layout, extras, subject_bbox, margin, limit=0.15, res=GRID_RES):
+    """
+    headline/logo 확정 후 추가 텍스트 요소(subhead, badge, CTA ...)를 빈 자리에 배치해
+    nongraphic_layout 뒤에 붙임. 한도 내 자리가 없는 요소는 버림. 반환: 추가된 요소 리스트.
+    """
+    items = [e for e in extras if _valid_bbox(e.get("bbox"))]
+    if not items: return []
+    grid = layout_grid(layout, subject_bbox, margin, res=res)
+    limits = {"subject": limit, "text": limit, "logo": limit}
+    specs = [{"bbox": e["bbox"], "layer": "text", "limits": limits} for e in items]
+    added = []
+    for e, r in zip(items, place_elements(grid, specs, mark_unplaced=False)):
+        if not r["placed"]: continue
+        e["bbox"] = r["bbox"]; e["content"] = ""
+        e["confidence"] = float(e.get("confidence", 0.5))
+        added.append(e)
+    layout.setdefault("nongraphic_layout", []).extend(added)
+    return added
+
+def fit_background_objects(layout, objects, subject_bbox, margin=0.0, limit=0.15, res=GRID_RES):
+    """
+    background_objects의 bbox_hint를 avoid_iou_with(subject,text_boxes,logo_boxes)에 맞게 조정.
+    자리가 없으면 원래 힌트 유지. objects는 제자리 수정.
+    """
+    objs = [o for o in (objects or []) if isinstance(o, dict) and _valid_bbox(o.get("bbox_hint"))]
+    if not objs: return objects
+    grid = layout_grid(layout, subject_bbox, margin, res=res)
+    specs = []
+    for o in objs:
+        avoid = str(o.get("avoid_iou_with", "subject,text_boxes,logo_boxes")).lower()
+        limits = {L: limit for L in ("subject", "text", "logo") if L in avoid}
+        specs.append({"bbox": o["bbox_hint"], "layer": "object", "limits": limits})
+    for o, r in zip(objs, place_elements(grid, specs)):
+        o["bbox_hint"] = [round(v, 4) for v in r["bbox"]]
+    return objects
@@ -0,0 +1,120 @@
+# -*- coding: utf-8 -*-
+"""
+output_encoder.py
+최종 광고 이미지(ad_text_render 출력) 인코더.
+
+- 포맷: PNG / JPEG / WebP ("auto"면 출력 경로 확장자로 결정, 모르면 PNG)
+- JPEG: quality, optimize, progressive, 크로마 서브샘플링
+- WebP: quality, method(0..6, 클수록 느리고 작음)
+- PNG: optimize (무손실 — quality 무시)
+- max_bytes: JPEG/WebP에서 상한 이하가 되는 가장 높은 quality를 [min_quality, quality] 이분 탐색
+  (quality는 파일 크기에 대해 단조라고 가정, 인코딩 ~log2(범위)회). 최저 품질로도 넘으면 그 결과 + fits=False
+
+모든 포맷이 알파 없이 RGB로 저장 (기존 save_final과 동일).
+의존: Pillow
+"""
+
+import io
+import os
+import time
+
+from upload_policy import FORMATS, SUBSAMPLING
+
+EXTENSIONS = {".png": "png", ".jpg": "jpeg", ".jpeg": "jpeg", ".webp": "webp"}
+DEFAULT_EXT = {"png": ".png", "jpeg": ".jpg", "webp": ".webp"}
+
+def format_for_path(path, default="png"):
+    return EXTENSIONS.get(os.path.splitext(path or "")[1].lower(), default)
+
+class EncodedImage:
+    def __init__(self, data, fmt, quality, size, encode_s, attempts, fits=True):
+        self.data = data
+        self.fmt = fmt
+        self.mime_type = FORMATS[fmt][1]
+        self.quality = quality
+        self.size = size
+        self.encode_s = encode_s
+        self.attempts = attempts
+        self.fits = fits
+
+    @property
+    def nbytes(self):
+        return len(self.data)
+
+    def save(self, path):
+        with open(path, "wb") as f:
+            f.write(self.data)
+        return path
+
+    def describe(self):
+        """meta / 로그용 요약 (JSON 직렬화 가능)."""
+        w, h = self.size
+        return {
+            "format": self.fmt, "mime_type": self.mime_type,
+            "quality": None if self.fmt == "png" else self.quality,
+            "width": w, "height": h, "bytes": self.nbytes, "fits": self.fits,
+            "encode_ms": round(self.encode_s * 1000, 1), "attempts": self.attempts,
+        }
+
+class OutputEncoder:
+    def __init__(self, fmt="auto", quality=90, optimize=True, progressive=True,
+                 subsampling="4:2:0", webp_method=4, max_bytes=0, min_quality=50):
+        if fmt != "auto" and fmt not in FORMATS:
+            raise ValueError(f"unknown output format: {fmt}")
+        if subsampling not in SUBSAMPLING:
+            raise ValueError(f"unknown chroma subsampling: {subsampling}")
+        self.fmt = fmt
+        self.quality = max(1, min(100, int(quality)))
+        self.optimize = bool(optimize)
+        self.progressive = bool(progressive)
+        self.subsampling = subsampling
+        self.webp_method = int(webp_method)
+        self.max_bytes = int(max_bytes or 0)
+        self.min_quality = max(1, min(self.quality, int(min_quality)))
+
+    def resolve(self, path=None):
+        """실제 포맷: fmt가 auto면 경로 확장자로."""
+        return format_for_path(path) if self.fmt == "auto" else self.fmt
+
+    def _save_opts(self, fmt, quality):
+        if fmt == "jpeg":
+            return {"quality": quality, "optimize": self.optimize, "progressive": self.progressive,
+                    "subsampling": SUBSAMPLING[self.subsampling]}
+        if fmt == "webp":
+            return {"quality": quality, "method": self.webp_method}
+        return {"optimize": self.optimize}
+
+    def _encode(self, rgb, fmt, quality):
+        buf = io.BytesIO()
+        rgb.save(buf, format=FORMATS[fmt][0], **self._save_opts(fmt, quality))
+        return buf.getvalue()
+
+    def encode(self, img, path=None):
+        """PIL 이미지 → EncodedImage. path는 fmt=auto일 때 포맷 결정에만 사용."""
+        t0 = time.perf_counter()
+        fmt = self.resolve(path)
+        rgb = img if img.mode == "RGB" else img.convert("RGB")
+        q = self.quality
+        data = self._encode(rgb, fmt, q)
+        attempts, fits = 1, True
+        if self.max_bytes and len(data) > self.max_bytes:
+            if fmt == "png":
+                fits = False
+            else:
+                # 불변식: hi 이상은 넘침, lo는 들어가는 품질 (min_quality-1이면 아직 모름)
+                tried = {q: data}
+                lo, hi = self.min_quality - 1, q
+                while hi - lo > 1:
+                    mid = (lo + hi) // 2
+                    tried[mid] = self._encode(rgb, fmt, mid); attempts += 1
+                    if len(tried[mid]) <= self.max_bytes: lo = mid
+                    else: hi = mid
+                q = max(lo, self.min_quality)
+                data = tried[q]
+                fits = len(data) <= self.max_bytes
+        return EncodedImage(data, fmt, q, rgb.size, time.perf_counter() - t0, attempts, fits)
+
+    def save(self, img, path):
+        enc = self.encode(img, path)
+        enc.save(path)
+        return enc
@@ -1,7 +1,6 @@
 from __future__ import annotations
 
 import base64
-import copy
 import logging
 import math
 import os
@@ -27,6 +26,8 @@ IMAGE_FACTOR = 28
 MIN_PIXELS = 4 * 28 * 28
 MAX_PIXELS = 16384 * 28 * 28
 MAX_RATIO = 200
+# Decode JPEGs at a reduced DCT scale when the source is at least this many times the target.
+JPEG_DRAFT_MIN_SCALE = 2
 
 VIDEO_MIN_PIXELS = 128 * 28 * 28
 VIDEO_MAX_PIXELS = 768 * 28 * 28
@@ -95,52 +96,81 @@ def to_rgb(pil_image: Image.Image) -> Image.Image:
         return pil_image.convert("RGB")
 
 
+def _target_size(ele: dict, height: int, width: int, size_factor: int) -> tuple[int, int]:
+    """Resize target for an image whose header reports (height, width)."""
+    if "resized_height" in ele and "resized_width" in ele:
+        return smart_resize(
+            ele["resized_height"],
+            ele["resized_width"],
+            factor=size_factor,
+        )
+    min_pixels = ele.get("min_pixels", MIN_PIXELS)
+    max_pixels = ele.get("max_pixels", MAX_PIXELS)
+    return smart_resize(
+        height,
+        width,
+        factor=size_factor,
+        min_pixels=min_pixels,
+        max_pixels=max_pixels,
+    )
+
+
+def _apply_jpeg_draft(image_obj: Image.Image, resized_height: int, resized_width: int) -> None:
+    """Ask libjpeg to decode at a reduced DCT scale (1/2, 1/4, 1/8) when the target is much smaller.
+
+    Must be called before the pixel data is loaded. The drafted image is never smaller than
+    the requested size, so the final resize still only ever shrinks.
+    """
+    if getattr(image_obj, "format", None) != "JPEG":
+        return
+    width, height = image_obj.size
+    if min(width // resized_width, height // resized_height) < JPEG_DRAFT_MIN_SCALE:
+        return
+    image_obj.draft(image_obj.mode, (resized_width, resized_height))
+    logger.debug(f"jpeg draft: {width}x{height} -> {image_obj.size} for target {resized_width}x{resized_height}")
+
+
 def fetch_image(ele: dict[str, str | Image.Image], size_factor: int = IMAGE_FACTOR) -> Image.Image:
     if "image" in ele:
         image = ele["image"]
     else:
         image = ele["image_url"]
+
+    def _open(fp) -> tuple[Image.Image, tuple[int, int]]:
+        # Image.open only parses the header, so the target size is known before any pixel is decoded.
+        image_obj = Image.open(fp)
+        width, height = image_obj.size
+        target = _target_size(ele, height, width, size_factor)
+        _apply_jpeg_draft(image_obj, *target)
+        image_obj.load()
+        return image_obj, target
+
     image_obj = None
     if isinstance(image, Image.Image):
-        image_obj = image
+        width, height = image.size
+        image_obj, target = image, _target_size(ele, height, width, size_factor)
     elif image.startswith("http://") or image.startswith("https://"):
-        # fix memory leak issue while using BytesIO
+        # fix memory leak issue while using BytesIO: load() decodes fully before the buffer is closed
         with requests.get(image, stream=True) as response:
             response.raise_for_status()
             with BytesIO(response.content) as bio:
-                image_obj = copy.deepcopy(Image.open(bio))
+                image_obj, target = _open(bio)
     elif image.startswith("file://"):
-        image_obj = Image.open(image[7:])
+        image_obj, target = _open(image[7:])
     elif image.startswith("data:image"):
         if "base64," in image:
             _, base64_data = image.split("base64,", 1)
             data = base64.b64decode(base64_data)
-            # fix memory leak issue while using BytesIO
+            # fix memory leak issue while using BytesIO: load() decodes fully before the buffer is closed
             with BytesIO(data) as bio:
-                image_obj = copy.deepcopy(Image.open(bio))
+                image_obj, target = _open(bio)
     else:
-        image_obj = Image.open(image)
+        image_obj, target = _open(image)
     if image_obj is None:
         raise ValueError(f"Unrecognized image input, support local path, http url, base64 and PIL.Image, got {image}")
     image = to_rgb(image_obj)
     ## resize
-    if "resized_height" in ele and "resized_width" in ele:
-        resized_height, resized_width = smart_resize(
-            ele["resized_height"],
-            ele["resized_width"],
-            factor=size_factor,
-        )
-    else:
-        width, height = image.size
-        min_pixels = ele.get("min_pixels", MIN_PIXELS)
-        max_pixels = ele.get("max_pixels", MAX_PIXELS)
-        resized_height, resized_width = smart_resize(
-            height,
-            width,
-            factor=size_factor,
-            min_pixels=min_pixels,
-            max_pixels=max_pixels,
-        )
+    resized_height, resized_width = target
     image = image.resize((resized_width, resized_height))
 
     return image
@@ -0,0 +1,69 @@
+# -*- coding: utf-8 -*-
+"""
+roi_filters.py
+사각 영역(ROI)에만 필터를 적용하는 공용 연산.
+nano_banana_generate(soften_reserved_areas)와 ad_text_render(glass_underlay)가 함께 사용.
+
+- rect마다 (필터 반경 + 마스크 페더) 만큼 패딩한 타일만 잘라 블러 → 타일 경계 영향 없음
+- 타일 크기의 마스크(사각 / 둥근 사각 + 페더)로 제자리 합성
+- 비용이 전체 이미지 크기가 아니라 reserved 면적에 비례
+- 소스 타일은 합성 전에 모두 잘라 두므로 겹치는 rect도 원본 픽셀을 블러 (중복 블러 없음)
+
+rect: 픽셀 (x0,y0,x1,y1), ImageDraw.rectangle 규약(끝 포함).
+의존: Pillow
+"""
+
+import math
+
+from PIL import Image, ImageDraw, ImageFilter
+
+def _pad(v):
+    # PIL GaussianBlur(r)의 실질 커널 반경 ≈ 3r (+ box 근사 여유)
+    return int(math.ceil(3.0 * v)) + 2 if v > 0 else 0
+
+def _clip(box, W, H):
+    x0, y0, x1, y1 = box
+    return max(0, x0), max(0, y0), min(W, x1), min(H, y1)
+
+def roi_mask(size, rect, corner_radius=0, feather=0.0):
+    """타일 크기 L 마스크. rect는 타일 좌표, feather > 0이면 가우시안으로 가장자리를 부드럽게."""
+    m = Image.new("L", size, 0)
+    d = ImageDraw.Draw(m)
+    if corner_radius > 0:
+        d.rounded_rectangle(rect, radius=corner_radius, fill=255)
+    else:
+        d.rectangle(rect, fill=255)
+    if feather > 0:
+        m = m.filter(ImageFilter.GaussianBlur(radius=feather))
+    return m
+
+def blur_rects(img, rects, radius=2.0, feather=1.5, corner_radius=0, inplace=False):
+    """
+    rects 영역만 가우시안 블러해 페더 마스크로 합성.
+    inplace=False면 복사본을 돌려줌 (원본 유지).
+    """
+    out = img if inplace else img.copy()
+    W, H = img.size
+    mp = _pad(feather)
+    bp = _pad(radius)
+    jobs = []
+    for r in rects or []:
+        x0, y0, x1, y1 = [int(v) for v in r]
+        if x1 < x0: x0, x1 = x1, x0
+        if y1 < y0: y0, y1 = y1, y0
+        tile = _clip((x0-mp, y0-mp, x1+1+mp, y1+1+mp), W, H)
+        if tile[2] <= tile[0] or tile[3] <= tile[1]:
+            continue
+        src = _clip((tile[0]-bp, tile[1]-bp, tile[2]+bp, tile[3]+bp), W, H)
+        jobs.append(((x0, y0, x1, y1), tile, src, img.crop(src)))
+    for (x0, y0, x1, y1), tile, src, patch in jobs:
+        blurred = patch.filter(ImageFilter.GaussianBlur(radius=radius)) if radius > 0 else patch
+        tx, ty = tile[0] - src[0], tile[1] - src[1]
+        tw, th = tile[2] - tile[0], tile[3] - tile[1]
+        blurred = blurred.crop((tx, ty, tx+tw, ty+th))
+        mask = roi_mask((tw, th), (x0-tile[0], y0-tile[1], x1-tile[0], y1-tile[1]),
+                        corner_radius=corner_radius, feather=feather)
+        if blurred.mode != out.mode:
+            blurred = blurred.convert(out.mode)
+        out.paste(blurred, tile[:2], mask)
+    return out
@@ -0,0 +1,152 @@
+# -*- coding: utf-8 -*-
+"""
+speculative.py
+Stage 2(배경 생성) 추측 실행: Qwen(Stage 1)이 도는 동안 임시 레이아웃으로 배경을 먼저 생성.
+
+- layout: 이미지 에너지만으로 임시 레이아웃 저장 (layout_fallback.provisional_layout, 수십 ms)
+  → 오케스트레이터(compose_service)가 Qwen과 동시에 Stage 2를 시작
+- compare: Qwen 최종 레이아웃과 임시 레이아웃의 예약 영역(subject + text / logo / underlay bbox)을
+  type#index로 짝지어 IoU 비교. 개수가 같고 모든 짝이 tolerance 이상(캔버스 있으면 캔버스도 동일) → hit
+  hit면 추측 배경을 그대로 쓰고, miss면 최종 레이아웃으로 Stage 2를 다시 실행
+- 결과(hit / 최소 IoU / 절약 시간)는 히스토리 JSON에 최근 N개만 유지 → 적중률 보고
+
+추측 배경은 Qwen 배경 프롬프트 대신 ensure_background_prompts 기본 프롬프트로 생성됨 (opt-in).
+의존: 표준 라이브러리 (layout 서브커맨드만 numpy / Pillow)
+"""
+
+import os
+import json
+import time
+import argparse
+import tempfile
+
+SPEC_IOU = 0.5     # 예약 영역 짝별 최소 IoU
+SPEC_HISTORY = os.getenv("COMPOSE_SPEC_HISTORY", os.path.join(tempfile.gettempdir(), "compose_speculative.json"))
+SPEC_KEEP = 200    # 최근 N개 결과만 유지
+
+# ---------------------------
+# 예약 영역 비교
+# ---------------------------
+def iou(a, b):
+    """[x,y,w,h] 두 박스의 IoU."""
+    ax, ay, aw, ah = map(float, a); bx, by, bw, bh = map(float, b)
+    iw = max(0.0, min(ax+aw, bx+bw) - max(ax, bx))
+    ih = max(0.0, min(ay+ah, by+bh) - max(ay, by))
+    inter = iw * ih
+    union = aw*ah + bw*bh - inter
+    return inter / union if union > 0 else 0.0
+
+def reserved_boxes(meta):
+    """레이아웃 JSON → {"subject" | "type#index": [x,y,w,h]} (Stage 2가 비워 두는 영역)."""
+    layout = meta.get("layout", {}) or {}
+    out = {}
+    subj = layout.get("subject_layout") or {}
+    if subj.get("center") and subj.get("ratio"):
+        (cx, cy), (rw, rh) = subj["center"], subj["ratio"]
+        out["subject"] = [cx - rw/2, cy - rh/2, rw, rh]
+    counts = {}
+    for it in (layout.get("nongraphic_layout") or []) + (layout.get("graphic_layout") or []):
+        b = it.get("bbox")
+        if not (isinstance(b, list) and len(b) == 4):
+            continue
+        t = str(it.get("type") or "text").lower()
+        idx = counts.get(t, 0); counts[t] = idx + 1
+        out[f"{t}#{idx}"] = [float(v) for v in b]
+    return out
+
+def compare(provisional, final, tol=SPEC_IOU):
+    """임시 / 최종 레이아웃 비교 → {"hit", "min_iou", "ious", "missing", "extra", "canvas_match"}."""
+    p, f = reserved_boxes(provisional), reserved_boxes(final)
+    ious = {k: round(iou(p[k], f[k]), 4) for k in f if k in p}
+    missing = sorted(k for k in f if k not in p)   # 최종에만 있는 영역 (추측 배경엔 비워 두지 않음)
+    extra = sorted(k for k in p if k not in f)
+    pc, fc = provisional.get("canvas") or {}, final.get("canvas") or {}
+    canvas_match = (pc.get("size"), pc.get("offset")) == (fc.get("size"), fc.get("offset"))
+    min_iou = min(ious.values()) if ious else 0.0
+    hit = bool(ious) and not missing and not extra and canvas_match and min_iou >= tol
+    return {"hit": hit, "min_iou": min_iou, "ious": ious, "missing": missing, "extra": extra,
+            "canvas_match": canvas_match, "tol": tol}
+
+# ---------------------------
+# 적중률 히스토리
+# ---------------------------
+def load_history(path=SPEC_HISTORY):
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return list(json.load(f))[-SPEC_KEEP:]
+    except Exception:
+        return []
+
+def record(outcome, path=SPEC_HISTORY):
+    """결과 1건 추가 (hit, min_iou, saved_s ...). 반환: 추가 후 히스토리."""
+    hist = (load_history(path) + [dict(outcome, t=round(time.time(), 3))])[-SPEC_KEEP:]
+    try:
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(hist, f)
+        os.replace(tmp, path)
+    except Exception as e:
+        print(f"speculative history save failed: {e}")
+    return hist
+
+def hit_rate(hist):
+    """히스토리 → {"n", "hits", "rate", "saved_s"(hit당 평균 절약 초)}."""
+    hits = [h for h in hist if h.get("hit")]
+    saved = [float(h.get("saved_s", 0.0)) for h in hits]
+    return {"n": len(hist), "hits": len(hits), "rate": round(len(hits) / len(hist), 3) if hist else 0.0,
+            "saved_s": round(sum(saved) / len(saved), 2) if saved else 0.0}
+
+# ---------------------------
+# CLI
+# ---------------------------
+def _load_json(path):
+    with open(path, "r", encoding="utf-8-sig") as f:
+        return json.load(f)
+
+def cmd_layout(args):
+    from layout_fallback import provisional_layout
+
+    t0 = time.perf_counter()
+    cond = {}
+    if args.cond_json and os.path.exists(args.cond_json):
+        raw = _load_json(args.cond_json)
+        cond = raw.get("input_cond", raw)
+    parsed = provisional_layout(args.image, product_name=args.product_name, cond=cond, bg_min_chars=args.bg_min_chars)
+    with open(args.save, "w", encoding="utf-8") as f:
+        json.dump(parsed, f, ensure_ascii=False, indent=2)
+    print(f"[spec] provisional layout in {(time.perf_counter() - t0) * 1000:.0f} ms -> {args.save}")
+
+def cmd_compare(args):
+    res = compare(_load_json(args.provisional), _load_json(args.final), tol=args.tol)
+    print(json.dumps(res, ensure_ascii=False))
+
+def cmd_stats(args):
+    print(json.dumps(hit_rate(load_history(args.history)), ensure_ascii=False))
+
+def main():
+    ap = argparse.ArgumentParser(description="Stage 2 추측 실행 (임시 레이아웃 / 비교 / 적중률)")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+
+    p = sub.add_parser("layout", help="에너지 기반 임시 레이아웃 JSON (Qwen 출력과 같은 모양)")
+    p.add_argument("--image", required=True)
+    p.add_argument("--save", required=True)
+    p.add_argument("--product_name", default=None)
+    p.add_argument("--cond_json", default=None)
+    p.add_argument("--bg_min_chars", type=int, default=900)
+    p.set_defaults(func=cmd_layout)
+
+    c = sub.add_parser("compare", help="임시 vs 최종 레이아웃 예약 영역 IoU")
+    c.add_argument("--provisional", required=True)
+    c.add_argument("--final", required=True)
+    c.add_argument("--tol", type=float, default=SPEC_IOU)
+    c.set_defaults(func=cmd_compare)
+
+    s = sub.add_parser("stats", help="히스토리 적중률")
+    s.add_argument("--history", default=SPEC_HISTORY)
+    s.set_defaults(func=cmd_stats)
+
+    args = ap.parse_args()
+    args.func(args)
+
+if __name__ == "__main__":
+    main()
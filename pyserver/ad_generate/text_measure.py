@@ -0,0 +1,212 @@
+# -*- coding: utf-8 -*-
+"""
+text_measure.py
+ad_text_render 텍스트 측정 / 줄바꿈 / 폰트 크기 탐색.
+
+- 폰트별로 기준 크기(REF_SIZE)에서 글자 advance + 잉크 오른쪽 끝 + 쌍 커닝을 한 번만 구해 두고(GlyphTable)
+  크기 비율로 스케일해 문자열 prefix 폭을 누적합으로 근사 → 줄바꿈 위치를 O(n)으로 찾음
+- 찾은 위치는 draw.textbbox로 줄당 2번 확인(경계 직전은 들어가고 경계 글자를 넣으면 넘침).
+  근사가 어긋나면 경계를 한 칸씩 옮기며 정확히 맞춤 → 결과는 기존(글자/단어마다 textbbox)과 동일
+- 폰트 크기: 텍스트 전체 advance와 줄 높이를 기준 크기에서 한 번 재서 박스 면적으로 시작 크기를 추정,
+  그 주변에서 gallop + 이분 탐색 (기존 [min,max] 이분 탐색과 같은 "들어가는 최대 크기")
+
+의존: Pillow
+"""
+
+import weakref
+
+import numpy as np
+
+REF_SIZE = 64   # 시작 크기 추정용 기준 폰트 크기
+
+class GlyphTable:
+    """FreeTypeFont 하나(크기 고정)의 글자별 advance / 잉크 오른쪽 끝 / 쌍 커닝 캐시."""
+
+    def __init__(self, font):
+        self.font = font
+        self._adv = {}
+        self._right = {}
+        self._kern = {}
+        self._kerned = {}
+
+    def _glyph(self, c):
+        a = self._adv.get(c)
+        if a is None:
+            a = self._adv[c] = float(self.font.getlength(c))
+            self._right[c] = float(self.font.getbbox(c)[2])
+        return a
+
+    def kern(self, a, b):
+        k = self._kern.get((a, b))
+        if k is None:
+            k = self._kern[(a, b)] = float(self.font.getlength(a + b)) - self._glyph(a) - self._glyph(b)
+        return k
+
+    def has_kerning(self, text):
+        """문자열 전체 advance가 글자 advance 합과 다르면 쌍 커닝을 계산 (대부분의 한글 폰트는 건너뜀)."""
+        k = self._kerned.get(text)
+        if k is None:
+            total = sum(self._glyph(c) for c in text)
+            k = self._kerned[text] = abs(float(self.font.getlength(text)) - total) > 1e-3
+        return k
+
+    def extents(self, text, scale=1.0):
+        """
+        (pen, right): pen[i] = i번째 글자 시작 x (커닝 포함 누적 advance),
+        right[i] = pen[i] + 글자 i의 bbox 오른쪽 끝. 문자열 [s:k] 폭 ≈ max(right[s:k]) - pen[s].
+        scale: 이 테이블 폰트 크기 대비 배율 (다른 크기의 근사)
+        """
+        n = len(text)
+        adv = np.fromiter((self._glyph(c) for c in text), dtype=np.float64, count=n)
+        r = np.fromiter((self._right[c] for c in text), dtype=np.float64, count=n)
+        if n > 1 and self.has_kerning(text):
+            adv[:-1] += [self.kern(text[i], text[i+1]) for i in range(n-1)]
+        pen = np.concatenate(([0.0], np.cumsum(adv)[:-1])) if n else adv
+        return pen * scale, (pen + r) * scale
+
+_tables = weakref.WeakKeyDictionary()
+
+def glyph_table(font):
+    t = _tables.get(font)
+    if t is None:
+        t = _tables[font] = GlyphTable(font)
+    return t
+
+# ---------------------------
+# Exact measurement (textbbox) with per-font memo
+# ---------------------------
+class Measurer:
+    """
+    draw.textbbox((0,0), s, font) 결과를 문자열별로 memo. 근사값 확인 / 최종 배치에 사용.
+    ref_font: 근사용 글자 테이블을 만들 기준 폰트(같은 face, 다른 크기). 없으면 font 자체.
+    """
+
+    def __init__(self, draw, font, ref_font=None):
+        self.draw = draw
+        self.font = font
+        ref = ref_font or font
+        self.table = glyph_table(ref)
+        self.scale = float(font.size) / float(ref.size)
+        self._bbox = {}
+        self.calls = 0
+
+    def extents(self, text):
+        return self.table.extents(text, self.scale)
+
+    def bbox(self, s):
+        b = self._bbox.get(s)
+        if b is None:
+            self.calls += 1
+            b = self._bbox[s] = self.draw.textbbox((0, 0), s, font=self.font)
+        return b
+
+    def width(self, s):
+        return self.bbox(s)[2]
+
+# ---------------------------
+# Wrapping
+# ---------------------------
+def _first_over(right, pen_s, start, max_w):
+    """start 이후 (right - pen_s) > max_w 인 첫 인덱스 (없으면 len)."""
+    hit = np.flatnonzero(right[start:] - pen_s > max_w + 1e-6)
+    return start + int(hit[0]) if len(hit) else len(right)
+
+def _settle(fits_to, a, b, n):
+    """
+    근사 경계 b(항목 [a:b]가 한 줄)를 정확한 경계로: 첫 항목은 항상 포함,
+    [a:b]가 넘치면 줄이고 [a:b+1]이 들어가면 늘림. fits_to(b) = [a:b] 폭 <= max_w.
+    """
+    while b > a + 1 and not fits_to(b):
+        b -= 1
+    while b < n and fits_to(b + 1):
+        b += 1
+    return b
+
+def wrap_chars(m, text, max_w):
+    """기존 글자 단위 줄바꿈과 동일: 첫 글자는 항상 넣고, 넘치기 직전까지 붙임."""
+    n = len(text)
+    if n == 0: return []
+    pen, right = m.extents(text)
+    lines, s = [], 0
+    while s < n:
+        k = max(s + 1, _first_over(right, pen[s], s, max_w))
+        k = _settle(lambda b: m.width(text[s:b]) <= max_w, s, k, n)
+        lines.append(text[s:k])
+        s = k
+    return lines
+
+def wrap_words(m, text, max_w):
+    """기존 단어 단위 줄바꿈과 동일 (split 후 한 칸 공백으로 다시 이음, 첫 단어는 항상 넣음)."""
+    words = text.split()
+    if not words: return []
+    joined = ' '.join(words)
+    starts = np.cumsum([0] + [len(w) + 1 for w in words[:-1]])
+    ends = starts + np.array([len(w) for w in words])
+    # 글자 → 단어 번호 (단어 앞 공백은 뒤 단어에 속함)
+    owner = np.searchsorted(ends, np.arange(len(joined)), side="right")
+    pen, right = m.extents(joined)
+    lines, a = [], 0
+    nw = len(words)
+    while a < nw:
+        i = _first_over(right, pen[starts[a]], starts[a], max_w)
+        b = nw if i >= len(joined) else max(a + 1, int(owner[i]))
+        b = _settle(lambda e: m.width(' '.join(words[a:e])) <= max_w, a, b, nw)
+        lines.append(' '.join(words[a:b]))
+        a = b
+    return lines
+
+def wrap_text(m, text, max_w, mode='auto'):
+    mode = mode.lower()
+    if mode == 'auto':
+        mode = 'word' if (' ' in text) else 'char'
+    return wrap_words(m, text, max_w) if mode == 'word' else wrap_chars(m, text, max_w)
+
+# ---------------------------
+# Font size search
+# ---------------------------
+def estimate_size(ref_font, text, usable_w, usable_h, line_spacing=1.02, ref_size=REF_SIZE):
+    """
+    기준 크기 폰트로 잰 전체 advance / 줄 높이로 들어갈 크기를 해석적으로 추정.
+    한 줄에 들어가는 경우와 면적 기준(줄 수 x 줄 높이 ≈ 박스 높이) 중 큰 값.
+    """
+    adv = max(float(ref_font.getlength(text)), 1.0)
+    asc, desc = ref_font.getmetrics()
+    lh = max(float(asc + desc), 1.0)
+    one_line = min(usable_w / adv, usable_h / lh) * ref_size
+    area = (usable_w * usable_h / (adv * lh * max(line_spacing, 1.0))) ** 0.5 * ref_size
+    return max(one_line, area)
+
+def search_max_size(fits, lo, hi, start):
+    """
+    fits(size)가 참인 최대 크기를 start 주변에서 gallop 후 이분 탐색. 없으면 None.
+    fits가 단조(작을수록 잘 들어감)면 [lo,hi] 전체 이분 탐색과 같은 결과.
+    """
+    if lo > hi: return None
+    s = min(max(int(round(start)), lo), hi)
+    if fits(s):
+        good, step = s, 1
+        while True:
+            t = good + step
+            if t > hi:
+                bad = hi + 1
+                break
+            if not fits(t):
+                bad = t
+                break
+            good, step = t, step * 2
+    else:
+        bad, step = s, 1
+        while True:
+            t = bad - step
+            if t < lo:
+                good = lo - 1
+                break
+            if fits(t):
+                good = t
+                break
+            bad, step = t, step * 2
+    while bad - good > 1:
+        mid = (good + bad) // 2
+        if fits(mid): good = mid
+        else: bad = mid
+    return good if good >= lo else None
@@ -0,0 +1,127 @@
+# -*- coding: utf-8 -*-
+"""
+upload_policy.py
+Stage 2(nano_banana_generate) 요청 이미지 업로드 정책.
+
+- 해상도: 긴 변 max_side로 축소 (LANCZOS)
+- 색 처리: 알파/팔레트 → 배경색 위에 평탄화(JPEG에서 투명 영역이 검게 되는 것 방지),
+  ICC 프로파일이 있으면 sRGB로 변환(ImageCms가 없으면 그냥 제거), EXIF/ICC는 업로드에 싣지 않음
+- 인코딩: JPEG / WebP / PNG, 품질·크로마 서브샘플링 지정
+- 인코딩 결과(UploadPayload)는 한 번 만들어 후보·재시도 전체에서 재사용
+  (PIL 이미지를 그대로 넘기면 SDK가 요청마다 다시 인코딩)
+
+의존: Pillow (genai Part 변환 시 google-genai)
+"""
+
+import io
+import time
+import threading
+
+from PIL import Image
+
+try:
+    from PIL import ImageCms
+except ImportError:
+    ImageCms = None
+
+FORMATS = {
+    "jpeg": ("JPEG", "image/jpeg"),
+    "webp": ("WEBP", "image/webp"),
+    "png":  ("PNG", "image/png"),
+}
+SUBSAMPLING = {"4:4:4": 0, "4:2:2": 1, "4:2:0": 2}
+
+class UploadPayload:
+    """인코딩된 요청 이미지. size는 업로드 해상도 (synthetic 백엔드 출력 크기 등에 사용)."""
+
+    def __init__(self, data, mime_type, size, fmt, quality, encode_s):
+        self.data = data
+        self.mime_type = mime_type
+        self.size = size
+        self.fmt = fmt
+        self.quality = quality
+        self.encode_s = encode_s
+        self._part = None
+        self._lock = threading.Lock()
+
+    @property
+    def nbytes(self):
+        return len(self.data)
+
+    @property
+    def width(self):
+        return self.size[0]
+
+    @property
+    def height(self):
+        return self.size[1]
+
+    def part(self):
+        """genai types.Part (한 번만 생성해 후보 스레드들이 공유)."""
+        with self._lock:
+            if self._part is None:
+                from google.genai import types
+                self._part = types.Part.from_bytes(data=self.data, mime_type=self.mime_type)
+            return self._part
+
+    def describe(self):
+        w, h = self.size
+        q = "" if self.fmt == "png" else f" q{self.quality}"
+        return (f"{self.fmt.upper()}{q} {w}x{h} {self.nbytes/1024:.1f} KB "
+                f"(raw {w*h*3/1024/1024:.1f} MB, encode {self.encode_s*1000:.0f} ms)")
+
+class UploadPolicy:
+    def __init__(self, fmt="jpeg", quality=85, max_side=1536, subsampling="4:2:0",
+                 color="srgb", background=(255, 255, 255)):
+        if fmt not in FORMATS:
+            raise ValueError(f"unknown upload format: {fmt}")
+        self.fmt = fmt
+        self.quality = int(quality)
+        self.max_side = int(max_side or 0)
+        self.subsampling = subsampling
+        self.color = color
+        self.background = tuple(background)
+
+    # ----- color -----
+    def _to_srgb(self, img):
+        icc = img.info.get("icc_profile")
+        if not icc or self.color != "srgb" or ImageCms is None:
+            return img
+        try:
+            src = ImageCms.ImageCmsProfile(io.BytesIO(icc))
+            dst = ImageCms.createProfile("sRGB")
+            mode = "RGBA" if "A" in img.getbands() else "RGB"
+            return ImageCms.profileToProfile(img.convert(mode), src, dst, outputMode=mode)
+        except Exception:
+            return img
+
+    def _flatten(self, img):
+        if img.mode == "P" and "transparency" in img.info:
+            img = img.convert("RGBA")
+        if img.mode in ("RGBA", "LA"):
+            base = Image.new("RGB", img.size, self.background)
+            base.paste(img.convert("RGBA"), mask=img.getchannel("A"))
+            return base
+        return img if img.mode == "RGB" else img.convert("RGB")
+
+    def _resize(self, img):
+        w, h = img.size
+        if not self.max_side or max(w, h) <= self.max_side:
+            return img
+        s = self.max_side / max(w, h)
+        return img.resize((max(1, int(w*s)), max(1, int(h*s))), Image.LANCZOS)
+
+    # ----- encode -----
+    def prepare(self, img):
+        """PIL 이미지 → UploadPayload (리사이즈 + 색 처리 + 인코딩 1회)."""
+        t0 = time.perf_counter()
+        rgb = self._resize(self._flatten(self._to_srgb(img)))
+        pil_fmt, mime = FORMATS[self.fmt]
+        opts = {}
+        if self.fmt == "jpeg":
+            opts = {"quality": self.quality, "subsampling": SUBSAMPLING.get(self.subsampling, 2)}
+        elif self.fmt == "webp":
+            opts = {"quality": self.quality, "method": 4}
+        buf = io.BytesIO()
+        rgb.save(buf, format=pil_fmt, **opts)
+        return UploadPayload(buf.getvalue(), mime, rgb.size, self.fmt, self.quality, time.perf_counter() - t0)
@@ -0,0 +1,197 @@
+# -*- coding: utf-8 -*-
+r"""
+visual_layout_eval.py  (VLM-free visual 티어 vs Qwen, PAID-style eval + 지연 시간)
+
+- visual 티어(layout_fallback.provisional_layout)로 이미지별 레이아웃 생성 + 생성 시간(ms) 측정
+- ab_compare_paid_eval.py 와 같은 eval_one 으로 채점 → 기준 결과(--ref_dir, 예: _cmp_out_re2)의
+  base / lora 행과 합쳐 compare_report.csv 작성 (같은 이미지만 비교)
+- lora/evaluate_paid_metrics.py 로 PAID 지표(Val / Ali / Ove / Uti / Occ / Rea / Undl / Unds / TMR) 집계
+- aggregate.json: 모델별 평균, visual vs 기준 모델 composite_score 승패, visual 지연 시간(mean / p50 / p95)
+
+출력 구조 (--out_dir):
+  compare_report.csv, paid_metrics.csv, paid_summary.csv, aggregate.json
+  json/{visual,base,lora}/<image>.<model>.json, reasons/visual/*.txt
+
+사용 예 (기준 결과와 같은 테스트 이미지):
+  python -u .\visual_layout_eval.py ^
+    --images ".\data\ori_imgs\test2\*.png" ^
+    --ref_dir ".\_cmp_out_re2" ^
+    --out_dir ".\_cmp_out_visual"
+
+의존: numpy, Pillow (torch 불필요)
+"""
+
+import os, sys, json, glob, csv, argparse, shutil, subprocess, time
+
+import numpy as np
+
+from layout_fallback import provisional_layout
+from paid_eval import REPORT_FIELDS, Rules, eval_one
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+PAID_SCRIPT = os.path.join(HERE, "lora", "evaluate_paid_metrics.py")
+
+def log(msg: str):
+    print(f"[{time.strftime('%H:%M:%S')}] {msg}", flush=True)
+
+def write_json(p: str, obj) -> None:
+    os.makedirs(os.path.dirname(p), exist_ok=True)
+    with open(p, "w", encoding="utf-8") as f:
+        json.dump(obj, f, ensure_ascii=False, indent=2)
+
+def read_report(path: str):
+    """compare_report.csv → 행 dict 리스트 (숫자 컬럼은 float)."""
+    rows = []
+    with open(path, "r", encoding="utf-8") as f:
+        for row in csv.DictReader(f):
+            for k in REPORT_FIELDS:
+                if k in ("image", "model", "headline_suggestion", "background_prompt"):
+                    continue
+                try:
+                    row[k] = float(row[k])
+                except (KeyError, TypeError, ValueError):
+                    pass
+            rows.append(row)
+    return rows
+
+def agg(rows, model_name: str):
+    sub = [r for r in rows if r["model"] == model_name]
+    if not sub: return {}
+    out = {}
+    for k in REPORT_FIELDS:
+        if k in ("image","model","headline_suggestion","background_prompt"): continue
+        vals = [r[k] for r in sub if isinstance(r.get(k), (int, float))]
+        if vals:
+            out[k] = round(float(np.mean(vals)), 4)
+    out["count"] = len(sub)
+    return out
+
+def wins_vs(rows, model_a: str, model_b: str):
+    """이미지별 composite_score 승패 (둘 다 있는 이미지만)."""
+    by = {(r["image"], r["model"]): r for r in rows}
+    w = {model_a: 0, model_b: 0, "ties": 0}
+    for img in sorted(set(r["image"] for r in rows)):
+        a, b = by.get((img, model_a)), by.get((img, model_b))
+        if not a or not b: continue
+        if a["composite_score"] > b["composite_score"]: w[model_a] += 1
+        elif a["composite_score"] < b["composite_score"]: w[model_b] += 1
+        else: w["ties"] += 1
+    return w
+
+def latency_stats(ms):
+    if not ms: return {}
+    arr = np.asarray(ms, dtype=np.float64)
+    return {"n": int(arr.size), "mean": round(float(arr.mean()), 2),
+            "p50": round(float(np.percentile(arr, 50)), 2), "p95": round(float(np.percentile(arr, 95)), 2),
+            "max": round(float(arr.max()), 2)}
+
+def main():
+    ap = argparse.ArgumentParser(description="visual 레이아웃 티어 PAID 평가 (기준: Qwen base / LoRA 결과)")
+    ap.add_argument("--images", required=True, help="이미지 glob (기준 결과와 같은 테스트 셋)")
+    ap.add_argument("--ref_dir", default="_cmp_out_re2", help="ab_compare_paid_eval.py 출력 폴더 (비우면 visual만)")
+    ap.add_argument("--out_dir", default="_cmp_out_visual")
+    ap.add_argument("--product_name", default=None)
+    ap.add_argument("--cond_json", default=None)
+    ap.add_argument("--bg_min_chars", type=int, default=900)
+    ap.add_argument("--seed", type=int, default=1234)
+    ap.add_argument("--skip_paid", action="store_true", help="evaluate_paid_metrics.py 실행 생략")
+    args = ap.parse_args()
+
+    images = sorted(glob.glob(args.images))
+    if not images:
+        log(f"[ERR] no images: {args.images}")
+        sys.exit(1)
+    os.makedirs(args.out_dir, exist_ok=True)
+
+    cond = {}
+    if args.cond_json and os.path.exists(args.cond_json):
+        with open(args.cond_json, "r", encoding="utf-8") as f:
+            raw = json.load(f)
+        cond = raw.get("input_cond", raw)
+
+    # 1) visual 티어 레이아웃 + 채점
+    log(f"[visual] images: {len(images)} → {args.out_dir}")
+    provisional_layout(images[0], product_name=args.product_name, cond=cond,
+                       bg_min_chars=args.bg_min_chars, seed=args.seed)  # 워밍업 (임포트 / 첫 디코드 제외)
+    rules = Rules()
+    rows, lat_ms, failed = [], [], 0
+    for img in images:
+        name = os.path.basename(img)
+        try:
+            t0 = time.perf_counter()
+            parsed = provisional_layout(img, product_name=args.product_name, cond=cond,
+                                        bg_min_chars=args.bg_min_chars, seed=args.seed)
+            lat_ms.append((time.perf_counter() - t0) * 1000)
+            write_json(os.path.join(args.out_dir, "json", "visual", f"{name}.visual.json"), parsed)
+            row = eval_one(img, parsed, rules, reason_dir=os.path.join(args.out_dir, "reasons", "visual"))
+            row["image"] = name; row["model"] = "visual"
+            row["headline_suggestion"] = ""
+            row["background_prompt"] = ((parsed.get("background") or {}).get("prompt") or "").replace("\n", " ").strip()
+            rows.append(row)
+        except Exception as e:
+            failed += 1
+            log(f"[visual][ERR] {name}: {repr(e)}")
+    lat = latency_stats(lat_ms)
+    n_visual = len(rows)
+    log(f"[visual] done. ok:{n_visual} failed:{failed} latency(ms): {lat}")
+
+    # 2) 기준 결과(Qwen base / LoRA) 합치기: 같은 이미지 행 + JSON 복사
+    ref_models = []
+    ref_csv = os.path.join(args.ref_dir, "compare_report.csv") if args.ref_dir else ""
+    if ref_csv and os.path.exists(ref_csv):
+        names = {r["image"] for r in rows}
+        ref_rows = [r for r in read_report(ref_csv) if r["image"] in names and r["model"] != "visual"]
+        if not ref_rows:
+            log(f"[ref][warn] no matching images in {ref_csv} (이미지 파일명이 기준 결과와 같아야 함)")
+        ref_models = sorted(set(r["model"] for r in ref_rows))
+        for m in ref_models:
+            src = os.path.join(args.ref_dir, "json", m)
+            if os.path.isdir(src):
+                shutil.copytree(src, os.path.join(args.out_dir, "json", m), dirs_exist_ok=True)
+        rows += ref_rows
+        log(f"[ref] {ref_csv}: models {ref_models}, rows {len(ref_rows)}")
+    elif args.ref_dir:
+        log(f"[ref][warn] compare_report.csv not found: {ref_csv}")
+
+    csv_path = os.path.join(args.out_dir, "compare_report.csv")
+    with open(csv_path, "w", newline="", encoding="utf-8") as f:
+        w = csv.DictWriter(f, fieldnames=REPORT_FIELDS)
+        w.writeheader()
+        for r in rows:
+            w.writerow({k: r.get(k, "") for k in REPORT_FIELDS})
+    log(f"[CSV] wrote: {csv_path}")
+
+    # 3) PAID 지표 (Val / Ali / Ove ...): 기존 집계 스크립트 재사용
+    paid = []
+    if not args.skip_paid:
+        rc = subprocess.call([sys.executable, PAID_SCRIPT, "--out_dir", args.out_dir])
+        summary_csv = os.path.join(args.out_dir, "paid_summary.csv")
+        if rc == 0 and os.path.exists(summary_csv):
+            with open(summary_csv, "r", encoding="utf-8") as f:
+                paid = list(csv.DictReader(f))
+        else:
+            log(f"[PAID][warn] evaluate_paid_metrics.py rc={rc}")
+
+    # 4) 요약
+    ag = {
+        "params": {"images": args.images, "ref_dir": args.ref_dir, "cond_json": args.cond_json,
+                   "bg_min_chars": args.bg_min_chars, "seed": args.seed},
+        "latency_ms": {"visual": lat},
+        "mean": {m: agg(rows, m) for m in ["visual"] + ref_models},
+        "wins": {m: wins_vs(rows, "visual", m) for m in ref_models},
+        "paid_summary": paid,
+        "stats": {"visual_ok": n_visual, "visual_failed": failed},
+    }
+    agg_path = os.path.join(args.out_dir, "aggregate.json")
+    write_json(agg_path, ag)
+    log(f"[AGG] wrote: {agg_path}")
+
+    print("\n=== Aggregate (mean composite_score) ===")
+    for m, v in ag["mean"].items():
+        print(f"[{m.upper()}] composite={v.get('composite_score')} count={v.get('count')}")
+    for m, v in ag["wins"].items():
+        print(f"Wins — visual:{v['visual']}  {m}:{v[m]}  ties:{v['ties']}")
+    print(f"Latency (ms) — visual: {lat}")
+
+if __name__ == "__main__":
+    main()